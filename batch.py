@@ -0,0 +1,159 @@
+"""
+Clean many dirty exports (e.g. one per region per day) in parallel.
+
+Each worker process streams one file: dedups it against itself, runs steps 3-9,
+spills the uncapped rows (with their dedup fingerprint, see dedup.py) and
+returns a quantile sketch of resolution_hours (or every value, with the
+"exact" engine - see sketches.py). The parent then walks the spills
+in file order:
+ - drops rows whose fingerprint already showed up in an earlier file (global
+   dedup) and takes their values back out of the merged sketch. In key mode the
+   LATER file wins, so the spills are walked backwards, and a row goes if its
+   incident number is anywhere in a later file's raw rows - even if that later
+   row was then dropped by steps 3-9, as the serial run would have dropped it
+ - caps at the 99th percentile of the merged sketch, adds the labels and writes
+   the output.
+Sketch counts just add up, so the result is the same file a serial streaming
+run over the concatenated input produces (`--workers 1` runs it in-process).
+"""
+
+import glob
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from dedup import KEY, NO_KEY, Dedup, LatestKeys, SeenHashes
+from pipeline import (CAP_QUANTILE, LABELS, OUT_DATE_FORMAT, SPILL_DATE_FORMAT, _quiet, clean_chunk, finish_chunk,
+                      keep)
+from sketches import make_quantiles, quantile_note, quantiles_from_dict
+from storage import FORMATS, TableWriter, iter_table, write_table
+
+HASH_COL = "_row_hash"
+
+
+def find_inputs(pattern):
+    """A directory (every supported file in it) or a glob, sorted by name."""
+    if os.path.isdir(pattern):
+        paths = [os.path.join(pattern, f) for f in os.listdir(pattern)
+                 if os.path.splitext(f)[1].lower() in FORMATS]
+    else:
+        paths = glob.glob(pattern)
+    return sorted(paths)
+
+
+def clean_file(src, spill, chunksize, rel_error, dedup="exact", quantiles="sketch"):
+    """Worker: steps 2 (within this file) to 9 for one file -> spill + sketch.
+
+    In key mode the file's incident number hashes (before cleaning) are saved
+    next to the spill too, as <spill>.keys.npy.
+    """
+    t0 = time.perf_counter()
+    sketch = make_quantiles(quantiles, rel_error)
+    rows_in = 0
+    latest = None
+    if dedup == "key":
+        latest = LatestKeys.scan(iter_table(src, chunksize, columns=[KEY], dtype=str))
+        np.save(spill + ".keys.npy", latest.keys)
+    dd = Dedup(dedup, latest)
+    with TableWriter(spill, date_format=SPILL_DATE_FORMAT) as writer:
+        for chunk in iter_table(src, chunksize, dtype=str):
+            rows_in += len(chunk)
+            chunk, h_raw = dd.raw(chunk)
+            chunk, h_clean = dd.clean(clean_chunk(chunk, log=_quiet))
+            h = h_clean if h_raw is None else h_raw
+            sketch.add(chunk["resolution_hours"])
+            # keep the hash as text so it round-trips through a CSV spill exactly
+            chunk[HASH_COL] = h[chunk.index].astype(str).to_numpy()
+            writer.write(chunk)
+    return {
+        "file": src,
+        "spill": spill,
+        "keys": spill + ".keys.npy" if dedup == "key" else None,
+        "rows_in": rows_in,
+        "rows_dupes": dd.removed,
+        "rows_kept": writer.rows,
+        "sketch": sketch.to_dict(),
+        "seconds": time.perf_counter() - t0,
+    }
+
+
+def run_batch(pattern, out, workers=os.cpu_count(), chunksize=100_000, rel_error=0.001, cube=None,
+              dedup="exact", quantiles="sketch"):
+    paths = find_inputs(pattern)
+    if not paths:
+        raise FileNotFoundError(f"no dirty files match {pattern}")
+    tmp = out + ".parts"
+    os.makedirs(tmp, exist_ok=True)
+    spills = [os.path.join(tmp, f"{i:05d}.csv") for i in range(len(paths))]
+
+    print(f"Cleaning {len(paths)} files with {workers} worker(s)")
+    t0 = time.perf_counter()
+    if workers <= 1:
+        results = [clean_file(p, s, chunksize, rel_error, dedup, quantiles) for p, s in zip(paths, spills)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(clean_file, paths, spills, [chunksize] * len(paths),
+                                    [rel_error] * len(paths), [dedup] * len(paths), [quantiles] * len(paths)))
+
+    for r in results:
+        rate = r["rows_in"] / r["seconds"] if r["seconds"] else 0
+        print(f"- {r['file']}: {r['rows_in']} rows in, {r['rows_kept']} kept, "
+              f"{r['seconds']:.2f}s ({rate:,.0f} rows/s)")
+
+    # merge: global dedup in file order, fixing the sketch up as we go. Only the
+    # hash and duration columns are needed for this pass.
+    sketch = make_quantiles(quantiles, rel_error)
+    for r in results:
+        sketch.merge(quantiles_from_dict(r["sketch"]))
+    seen = SeenHashes()  # key mode: incident numbers in the raw rows of the later files
+    dropped = [None] * len(results)  # per spill: positions of rows that are cross-file duplicates
+    order = range(len(results))
+    for i in (reversed(order) if dedup == "key" else order):
+        r, drop, pos = results[i], [], 0
+        if r["rows_kept"]:
+            for chunk in iter_table(r["spill"], chunksize, columns=[HASH_COL, "resolution_hours"],
+                                    dtype={HASH_COL: str, "resolution_hours": float}):
+                h = chunk[HASH_COL].astype(np.uint64).to_numpy()
+                dup = (seen.contains(h) if dedup == "key" else ~seen.first_seen(h)) & (h != NO_KEY)
+                sketch.remove(chunk.loc[dup, "resolution_hours"])
+                drop.append(pos + np.flatnonzero(dup))
+                pos += len(chunk)
+        if dedup == "key":
+            seen.first_seen(np.load(r["keys"]))
+        dropped[i] = np.concatenate(drop) if drop else np.empty(0, dtype=np.int64)
+    n_dropped = sum(len(d) for d in dropped)
+    rows_in = sum(r["rows_in"] for r in results)
+    rows_kept = sum(r["rows_kept"] for r in results) - n_dropped
+    print(f"- starting rows: {rows_in}")
+    print(f"Step: drop duplicates ({dedup}) within files -> removed {sum(r['rows_dupes'] for r in results)} rows")
+    print(f"Step: drop duplicates ({dedup}) across files -> removed {n_dropped} more rows")
+
+    if not rows_kept:
+        write_table(pd.DataFrame(columns=keep + LABELS), out)
+    else:
+        # 8b) one global cap from the merged sketches
+        q99 = sketch.quantile(CAP_QUANTILE)
+        print(f"Step: capped resolution_hours at 99th percentile -> cap value: {q99:.2f} hours"
+              f" ({quantile_note(sketch)})")
+        with TableWriter(out, date_format=OUT_DATE_FORMAT) as writer:
+            for r, drop in zip(results, dropped):
+                if not r["rows_kept"]:
+                    continue
+                pos = 0
+                for chunk in iter_table(r["spill"], chunksize, dtype=str):
+                    here = drop[(drop >= pos) & (drop < pos + len(chunk))] - pos
+                    pos += len(chunk)
+                    chunk = chunk.drop(index=chunk.index[here]).drop(columns=[HASH_COL])
+                    chunk = finish_chunk(chunk, q99)
+                    writer.write(chunk)
+                    if cube is not None:
+                        cube.update(chunk)
+    shutil.rmtree(tmp)
+
+    print(f"✅ cleaned file saved → {out}")
+    print(f"rows: {rows_kept} ({time.perf_counter() - t0:.2f}s total)")
+    return results
@@ -0,0 +1,205 @@
+"""
+Benchmark the generate -> dirty -> clean -> summarise pipeline at several sizes.
+
+For every size it runs make_dataset.py, dirty_up.py, pipeline.py and summary.py
+as separate processes (so each one's peak RSS is its own) and records wall time,
+peak RSS and rows/sec, plus the per-step timings pipeline.py reports with
+--timings. Results go to a JSON file; with --baseline they're compared against a
+stored run and any stage/step that got slower (or, for the stages, used more peak
+RSS) than the tolerance fails the run. A baseline recorded with another --format
+isn't compared at all, and sizes it doesn't have are reported as not compared.
+
+    python benchmark.py --sizes 10k,1m,10m
+    python benchmark.py --sizes 10k,1m --save-baseline      # record a baseline
+    python benchmark.py --sizes 10k,1m                      # compare against it
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+BASE = os.path.dirname(os.path.abspath(__file__))
+RESULTS = "bench_results.json"
+BASELINE = "bench_baseline.json"
+NOW = "2025-01-01T00:00:00"  # fixed so every run benchmarks the same data
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    mult = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * mult)
+
+
+def run_stage(cmd):
+    """Run one stage in a child process -> (wall seconds, peak RSS in MB or None)."""
+    with tempfile.TemporaryFile() as err:
+        t0 = time.perf_counter()
+        proc = subprocess.Popen(cmd, cwd=BASE, stdout=subprocess.DEVNULL, stderr=err)
+        if hasattr(os, "wait4"):
+            _, status, usage = os.wait4(proc.pid, 0)
+            code = os.waitstatus_to_exitcode(status)
+            # ru_maxrss is KB on Linux, bytes on macOS
+            rss = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+        else:
+            code = proc.wait()
+            rss = None
+        wall = time.perf_counter() - t0
+        if code != 0:
+            err.seek(0)
+            raise RuntimeError(f"{' '.join(cmd)} failed ({code}):\n{err.read().decode(errors='replace')[-2000:]}")
+    return wall, rss
+
+
+def bench_size(n, workdir, fmt, seed):
+    agg = os.path.join(workdir, f"agg_{n}.{fmt}")
+    dirty = os.path.join(workdir, f"dirty_{n}.{fmt}")
+    clean = os.path.join(workdir, f"clean_{n}.{fmt}")
+    steps_json = os.path.join(workdir, f"steps_{n}.json")
+    py = sys.executable
+    stages = [
+        ("make_dataset", [py, "make_dataset.py", "--rows", str(n), "--seed", str(seed), "--now", NOW, "--out", agg]),
+        ("dirty_up", [py, "dirty_up.py", "--src", agg, "--dst", dirty, "--seed", str(seed)]),
+        ("pipeline", [py, "pipeline.py", "--src", dirty, "--out", clean, "--timings", steps_json]),
+        ("summary", [py, "summary.py", "--src", clean]),
+    ]
+    rows = []
+    for name, cmd in stages:
+        wall, rss = run_stage(cmd)
+        rows.append({"size": n, "stage": name, "wall_s": wall, "peak_rss_mb": rss,
+                     "rows_per_s": n / wall if wall else None})
+        print(f"- {n:>11,} rows  {name:<14} {wall:8.2f}s  "
+              f"{(f'{rss:,.0f} MB') if rss is not None else '?':>9}  {n / wall:>12,.0f} rows/s")
+    with open(steps_json, "r", encoding="utf-8") as f:
+        for step, wall in json.load(f).items():
+            rows.append({"size": n, "stage": f"pipeline.{step}", "wall_s": wall, "peak_rss_mb": None,
+                         "rows_per_s": n / wall if wall else None})
+    return rows
+
+
+# what compare() checks: (result key, unit, noise floor argument)
+CHECKS = [("wall_s", "s", "min_seconds"), ("peak_rss_mb", "MB", "min_mb")]
+
+
+def compare(results, baseline, tolerance, min_seconds, min_mb=10.0):
+    """Stages/steps worse than baseline * (1 + tolerance), in wall time or peak RSS.
+
+    A change also has to be bigger than min_seconds / min_mb to count (timer
+    and allocator noise). Returns (result, baseline result, key, ratio) tuples.
+    """
+    floors = {"min_seconds": min_seconds, "min_mb": min_mb}
+    old = {(r["size"], r["stage"]): r for r in baseline["results"]}
+    worse = []
+    for r in results:
+        b = old.get((r["size"], r["stage"]))
+        if b is None:
+            continue
+        for key, _, floor in CHECKS:
+            new, was = r.get(key), b.get(key)
+            if new is None or was is None:
+                continue
+            ratio = new / was if was else np.inf
+            if ratio > 1 + tolerance and new - was > floors[floor]:
+                worse.append((r, b, key, ratio))
+    return worse
+
+
+def mismatches(doc, baseline):
+    """Why a baseline can't be compared like-for-like: (fatal problems, warnings)."""
+    fatal, warn = [], []
+    if baseline.get("format") != doc["format"]:
+        fatal.append(f"baseline was recorded with --format {baseline.get('format')}, this run used {doc['format']}")
+    old = {r["size"] for r in baseline["results"]}
+    new = {r["size"] for r in doc["results"]}
+    if new - old:
+        warn.append(f"no baseline for {', '.join(f'{n:,}' for n in sorted(new - old))} rows (not compared)")
+    if old - new:
+        warn.append(f"baseline sizes {', '.join(f'{n:,}' for n in sorted(old - new))} not run this time")
+    return fatal, warn
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the incidents pipeline at several sizes.")
+    ap.add_argument("--sizes", default="10k,100k", help="comma separated row counts, e.g. 10k,1m,10m")
+    ap.add_argument("--format", default="csv", choices=["csv", "parquet", "feather"],
+                    help="file format handed between stages")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--workdir", help="where generated files go (default: a temp dir, removed afterwards)")
+    ap.add_argument("--results", default=RESULTS, help="JSON file for this run's results")
+    ap.add_argument("--baseline", default=BASELINE, help="JSON results to compare against (if it exists)")
+    ap.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown vs baseline (0.25 = 25%%)")
+    ap.add_argument("--min-seconds", type=float, default=0.05,
+                    help="ignore slowdowns smaller than this many seconds (timer noise)")
+    ap.add_argument("--min-mb", type=float, default=10.0,
+                    help="ignore peak RSS growth smaller than this many MB")
+    args = ap.parse_args()
+
+    sizes = [parse_size(s) for s in args.sizes.split(",")]
+    tmp = None if args.workdir else tempfile.TemporaryDirectory(prefix="incidents_bench_")
+    workdir = args.workdir or tmp.name
+    os.makedirs(workdir, exist_ok=True)
+
+    print(f"Benchmarking sizes {', '.join(f'{n:,}' for n in sizes)} ({args.format}) in {workdir}")
+    results = []
+    try:
+        for n in sizes:
+            results += bench_size(n, workdir, args.format, args.seed)
+    finally:
+        if tmp is not None:
+            tmp.cleanup()
+
+    doc = {
+        "when": pd.Timestamp.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "machine": platform.platform(),
+        "cpus": os.cpu_count(),
+        "format": args.format,
+        "results": results,
+    }
+    with open(args.results, "w", encoding="utf-8") as f:
+        json.dump(doc, f, indent=2)
+    print(f"✅ results written → {args.results}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(doc, f, indent=2)
+        print(f"✅ baseline saved → {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"(no baseline at {args.baseline}; run with --save-baseline to create one)")
+        return 0
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    fatal, warn = mismatches(doc, baseline)
+    for w in warn:
+        print(f"(warning: {w})")
+    if fatal:
+        for w in fatal:
+            print(f"❌ can't compare against {args.baseline}: {w}")
+        return 2
+    worse = compare(results, baseline, args.tolerance, args.min_seconds, args.min_mb)
+    if not worse:
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+        return 0
+    print(f"\n❌ REGRESSIONS against {args.baseline} (tolerance {args.tolerance:.0%}):")
+    units = {key: unit for key, unit, _ in CHECKS}
+    for r, b, key, ratio in worse:
+        u = units[key]
+        print(f"- {r['size']:>11,} rows  {r['stage']:<24} {key:<12} "
+              f"{b[key]:8.2f}{u} -> {r[key]:8.2f}{u}  (x{ratio:.2f})")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+"""
+Rollup cube of the cleaned incidents: one cell per (day, priority, group, state).
+
+summary.py and the figures all group the clean rows along the same few axes.
+The cube does that grouping once, while pipeline.py writes its output: every
+cell keeps row / SLA-breach / quick-resolution counts, the resolution_hours
+count and sum, the cell's top-k values and a quantile sketch. Questions like
+"rows per priority", "breach rate per month" or "median hours for Network" are
+then answered from a few thousand cells instead of every row.
+
+Everything in a cell just adds up (the sketches merge exactly), so cubes of
+separate runs merge into one, and adding a new day's rows only touches that
+day's cells.
+
+    python pipeline.py --cube data/incidents_cube.json
+    python cube.py day1.json day2.json --out all.json --by month final_priority
+"""
+
+import argparse
+import heapq
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from sketches import QuantileSketch
+
+DIMS = ["day", "final_priority", "assignment_group_mode", "final_state"]
+MEASURES = ["rows", "breached", "sla_count", "quick", "quick_count", "res_count", "res_sum"]
+TOP_K = 5
+# coarser than the cap's sketch: there is one sketch per cell, and 1% is plenty
+# for reporting percentiles
+CUBE_ERROR = 0.01
+MISSING = "nan"  # same label summary.py gives missing values
+
+
+def _days(s):
+    # "YYYY-MM-DD" of first_opened_at, whether it's typed or still text
+    if pd.api.types.is_datetime64_any_dtype(s):
+        days = pd.Series(np.datetime_as_string(s.to_numpy().astype("datetime64[D]")), index=s.index)
+        return days.where(s.notna(), MISSING)
+    return s.astype(object).str.slice(0, 10).where(s.notna(), MISSING)
+
+
+def _labels(s):
+    return s.astype(object).where(s.notna(), MISSING).astype(str)
+
+
+def _flag(df, col, derived):
+    # 0/1 label column as float (NaN = missing); derived from the hours if absent
+    if col in df.columns:
+        return pd.to_numeric(df[col], errors="coerce").to_numpy(dtype="float64")
+    return derived
+
+
+def _push_top(top, values, k):
+    for v in values:
+        if len(top) < k:
+            heapq.heappush(top, float(v))
+        elif v > top[0]:
+            heapq.heapreplace(top, float(v))
+
+
+def _match(key, where):
+    for dim, want in where.items():
+        value = key[0][:7] if dim == "month" else key[DIMS.index(dim)]
+        if value not in (want if isinstance(want, (list, tuple, set)) else [want]):
+            return False
+    return True
+
+
+class RollupCube:
+    """Mergeable per-(day, priority, group, state) aggregates of a clean table."""
+
+    def __init__(self, rel_error=CUBE_ERROR, top_k=TOP_K):
+        self.rel_error = rel_error
+        self.top_k = top_k
+        self.nulls = {}   # day -> {column: missing values} (for the missingness figure)
+        self.cells = {}   # (day, priority, group, state) -> {measure: n, "top": [...], "sketch": ...}
+
+    def _cell(self, key):
+        cell = self.cells.get(key)
+        if cell is None:
+            cell = dict.fromkeys(MEASURES, 0)
+            cell["res_sum"] = 0.0
+            cell["top"] = []  # min-heap
+            cell["sketch"] = QuantileSketch(self.rel_error)
+            self.cells[key] = cell
+        return cell
+
+    def update(self, df):
+        """Add the rows of a clean frame (or chunk of one)."""
+        if not len(df):
+            return self
+        days = _days(df["first_opened_at"]).to_numpy()
+        for day, counts in df.isna().groupby(days, sort=False).sum().iterrows():
+            store = self.nulls.setdefault(day, {})
+            for c, n in counts.items():
+                store[c] = store.get(c, 0) + int(n)
+
+        res = pd.to_numeric(df["resolution_hours"], errors="coerce").to_numpy(dtype="float64")
+        has_res = ~np.isnan(res)
+        sla = _flag(df, "sla_breached", (res > 24).astype("float64"))
+        quick = _flag(df, "quick_resolution", (res < 12).astype("float64"))
+        values = pd.DataFrame({
+            "rows": 1,
+            "breached": np.nan_to_num(sla),
+            "sla_count": ~np.isnan(sla),
+            "quick": np.nan_to_num(quick),
+            "quick_count": ~np.isnan(quick),
+            "res_count": has_res,
+            "res_sum": np.where(has_res, res, 0.0),
+        })
+        keys = [days] + [_labels(df[d]).to_numpy() for d in DIMS[1:]]
+        g = values.groupby(keys, sort=False)
+        sums = g.sum()
+        positions = g.indices
+        for key, row in zip(sums.index, sums.itertuples(index=False)):
+            cell = self._cell(key)
+            for m in MEASURES[:-1]:
+                cell[m] += int(getattr(row, m))
+            cell["res_sum"] += float(row.res_sum)
+            v = res[positions[key]]
+            v = v[~np.isnan(v)]
+            cell["sketch"].add(v)
+            _push_top(cell["top"], np.sort(v)[-self.top_k:], self.top_k)
+        return self
+
+    def merge(self, other):
+        if other.rel_error != self.rel_error:
+            raise ValueError("can only merge cubes built with the same rel_error")
+        for day, theirs in other.nulls.items():
+            store = self.nulls.setdefault(day, {})
+            for c, n in theirs.items():
+                store[c] = store.get(c, 0) + n
+        for key, theirs in other.cells.items():
+            cell = self._cell(key)
+            for m in MEASURES:
+                cell[m] += theirs[m]
+            cell["sketch"].merge(theirs["sketch"])
+            _push_top(cell["top"], theirs["top"], self.top_k)
+        return self
+
+    def drop(self, period):
+        """Forget every cell whose day starts with `period` ("2025-09" or "2025-09-14").
+
+        Used when a partition is rewritten: its cells are dropped, then rebuilt
+        from the new rows.
+        """
+        for key in [k for k in self.cells if k[0].startswith(period)]:
+            del self.cells[key]
+        for day in [d for d in self.nulls if d.startswith(period)]:
+            del self.nulls[day]
+        return self
+
+    @property
+    def rows(self):
+        return sum(cell["rows"] for cell in self.cells.values())
+
+    def missing(self):
+        """Missing values per column over the whole cube."""
+        total = {}
+        for counts in self.nulls.values():
+            for c, n in counts.items():
+                total[c] = total.get(c, 0) + n
+        return total
+
+    # --- queries ------------------------------------------------------------
+
+    def frame(self, by=("final_priority",), **where):
+        """Measures summed per `by` (any of DIMS, plus "month"), over cells matching `where`."""
+        by = list(by)
+        recs = []
+        for key, cell in self.cells.items():
+            if _match(key, where):
+                rec = dict(zip(DIMS, key), month=key[0][:7])
+                rec.update((m, cell[m]) for m in MEASURES)
+                recs.append(rec)
+        df = pd.DataFrame(recs, columns=DIMS + ["month"] + MEASURES)
+        return df.groupby(by)[MEASURES].sum() if by else df[MEASURES].sum()
+
+    def sketch(self, **where):
+        """resolution_hours sketch of every cell matching `where` (e.g. final_priority="2 - High")."""
+        sk = QuantileSketch(self.rel_error)
+        for key, cell in self.cells.items():
+            if _match(key, where):
+                sk.merge(cell["sketch"])
+        return sk
+
+    def top(self, **where):
+        """The top_k largest resolution_hours of the cells matching `where`, largest first."""
+        top = []
+        for key, cell in self.cells.items():
+            if _match(key, where):
+                _push_top(top, cell["top"], self.top_k)
+        return sorted(top, reverse=True)
+
+    # --- persistence --------------------------------------------------------
+
+    def to_dict(self):
+        return {
+            "rel_error": self.rel_error,
+            "top_k": self.top_k,
+            "dims": DIMS,
+            "nulls": self.nulls,
+            "cells": [
+                dict(key=list(key), top=sorted(cell["top"], reverse=True), sketch=cell["sketch"].to_dict(),
+                     **{m: cell[m] for m in MEASURES})
+                for key, cell in sorted(self.cells.items())
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        cube = cls(d["rel_error"], d["top_k"])
+        cube.nulls = {day: dict(counts) for day, counts in d["nulls"].items()}
+        for c in d["cells"]:
+            cell = cube._cell(tuple(c["key"]))
+            for m in MEASURES:
+                cell[m] = c[m]
+            cell["sketch"] = QuantileSketch.from_dict(c["sketch"])
+            _push_top(cell["top"], c["top"], cube.top_k)
+        return cube
+
+    def save(self, path):
+        # temp file + rename, so a reader never sees half a cube
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Merge rollup cubes and/or print a rollup from them.")
+    ap.add_argument("cubes", nargs="+", help="cube JSON files written by pipeline.py --cube")
+    ap.add_argument("--out", help="save the merged cube here")
+    ap.add_argument("--by", nargs="+", default=["final_priority"],
+                    help=f"dimensions to roll up by (from {', '.join(DIMS)}, month)")
+    args = ap.parse_args()
+
+    cube = None
+    for path in args.cubes:
+        part = RollupCube.load(path)
+        cube = part if cube is None else cube.merge(part)
+    print(f"Loaded {len(args.cubes)} cube(s): {cube.rows} rows in {len(cube.cells)} cells")
+    if args.out:
+        cube.save(args.out)
+        print(f"✅ merged cube saved → {args.out}")
+
+    table = cube.frame(args.by)
+    table["breach_rate"] = table["breached"] / table["sla_count"]
+    table["mean_hours"] = table["res_sum"] / table["res_count"]
+    print(table[["rows", "breach_rate", "mean_hours"]].to_string())
+
+
+if __name__ == "__main__":
+    main()
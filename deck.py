@@ -0,0 +1,214 @@
+"""
+Fast builds of the coursework deck, or one deck per assignment group.
+
+generate_presentation.py builds every slide from scratch. Here the static
+slides (title, intro, limitations, checklist, ...) are built once into a
+template, data/decks/.template-<hash>.pptx, which is rebuilt only when their
+content or the slide helpers change. Each deck loads that template and only
+adds the dynamic slides:
+ - the numbers: rows removed by cleaning, and a summary for its group (or all rows)
+ - the pipeline.py code snippets
+ - the figures from data/figures/
+ - the pipeline.py appendix
+The numbers come from the statistics document summary.py --stats-json writes
+(data/incidents_stats.json); only if there isn't one is the clean data read,
+once for all decks. pipeline.py is read once, and each PNG once. The snippets are cached by the hash of
+pipeline.py, and each deck's inputs are fingerprinted: a deck whose template,
+numbers, snippets, captions and image hashes haven't changed isn't rebuilt.
+The decks that do need building are built in parallel worker processes.
+
+    python deck.py                         # data/decks/CW1_presentation.pptx
+    python deck.py --per-group --workers 4 # + CW1_presentation_<group>.pptx each
+    python deck.py --force                 # ignore the cache
+"""
+
+import argparse
+import glob
+import hashlib
+import inspect
+import io
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import generate_presentation as gp
+from summary import GROUP_COL, stats_document, summarise_files
+
+CLEAN = os.path.join(gp.BASE, "data", "incidents_clean.csv")
+DECK_DIR = os.path.join(gp.BASE, "data", "decks")
+CACHE_FILE = ".deck_cache.json"
+
+
+def _sha(data):
+    return hashlib.sha1(data if isinstance(data, bytes) else data.encode("utf-8")).hexdigest()
+
+
+# --- template ---------------------------------------------------------------
+
+def template_key():
+    """Hash of everything that goes into the static slides."""
+    import pptx
+    parts = [json.dumps([gp.TITLE, gp.INTRO_SLIDES, gp.OUTRO_SLIDES]), pptx.__version__]
+    parts += [inspect.getsource(f) for f in (gp.new_presentation, gp.add_title_slide, gp.add_bullet_slide,
+                                             gp.add_bullet_slides, gp.add_notes)]
+    return _sha("\n".join(parts))[:12]
+
+
+def ensure_template(deck_dir, key):
+    """Path of the static-slides template, building it (and dropping stale ones) if needed."""
+    path = os.path.join(deck_dir, f".template-{key}.pptx")
+    if not os.path.exists(path):
+        for old in glob.glob(os.path.join(deck_dir, ".template-*.pptx")):
+            os.remove(old)
+        prs = gp.new_presentation()
+        gp.add_title_slide(prs, *gp.TITLE)
+        gp.add_bullet_slides(prs, gp.INTRO_SLIDES)
+        gp.add_bullet_slides(prs, gp.OUTRO_SLIDES)
+        prs.save(path + ".tmp")
+        os.replace(path + ".tmp", path)
+        print(f"Built template {path}")
+    return path
+
+
+def _move_slides(prs, start, count, to):
+    # python-pptx only appends slides; reorder the presentation's slide id list
+    ids = prs.slides._sldIdLst
+    moved = list(ids)[start:start + count]
+    for el in moved:
+        ids.remove(el)
+    for k, el in enumerate(moved):
+        ids.insert(to + k, el)
+
+
+# --- one deck ------------------------------------------------------------------
+
+def build_deck(template, out, numbers, snippets, captions, images, source):
+    """Template + the dynamic slides -> `out`. `images` maps figure name -> PNG bytes."""
+    from pptx import Presentation
+    t0 = time.perf_counter()
+    prs = Presentation(template)
+    head = 1 + len(gp.INTRO_SLIDES)  # title + intro slides; the outro follows them in the template
+    n = len(prs.slides)
+
+    gp.add_bullet_slides(prs, numbers)
+    gp.add_snippet_slides(prs, snippets)
+    gp.add_visual_slides(prs, captions, {name: io.BytesIO(data) for name, data in images.items()})
+    _move_slides(prs, n, len(prs.slides) - n, head)
+    if source:
+        gp.add_appendix(prs, source)
+
+    prs.save(out + ".tmp")
+    os.replace(out + ".tmp", out)
+    return out, time.perf_counter() - t0
+
+
+# --- inputs ---------------------------------------------------------------------
+
+def load_numbers(stats_path, clean):
+    """The statistics document; built from `clean` (one pass, no step counts) if there isn't one."""
+    doc = gp.load_stats(stats_path)
+    if doc is not None:
+        return doc, stats_path
+    print(f"No {stats_path} (python summary.py --stats-json ...), reading {clean}")
+    groups = {}
+    stats = summarise_files([clean], groups=groups)
+    return stats_document(stats, [clean], groups), clean
+
+
+def _slug(group):
+    return re.sub(r"[^A-Za-z0-9]+", "_", group).strip("_") or "unassigned"
+
+
+def snippets_for(source, cache):
+    """SNIPPETS slides for this pipeline.py, cached by its hash."""
+    key = _sha(source)
+    cached = cache.get("snippets", {})
+    if cached.get("key") != key:
+        cached = {"key": key, "slides": gp.snippet_slides(source)}
+        cache["snippets"] = cached
+    return [tuple(s) for s in cached["slides"]]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Build the deck (or one per assignment group) from a cached template.")
+    ap.add_argument("--stats", default=gp.STATS_JSON, help="statistics document from summary.py --stats-json")
+    ap.add_argument("--clean", default=CLEAN,
+                    help="cleaned data (.csv, .parquet or .feather), read only if there's no --stats document")
+    ap.add_argument("--out-dir", default=DECK_DIR)
+    ap.add_argument("--per-group", action="store_true", help=f"also build one deck per {GROUP_COL}")
+    ap.add_argument("--workers", type=int, default=os.cpu_count())
+    ap.add_argument("--force", action="store_true", help="rebuild the template and every deck")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    os.makedirs(args.out_dir, exist_ok=True)
+    cache_path = os.path.join(args.out_dir, CACHE_FILE)
+    cache = {}
+    if os.path.exists(cache_path) and not args.force:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+
+    key = template_key()
+    if args.force:
+        for old in glob.glob(os.path.join(args.out_dir, ".template-*.pptx")):
+            os.remove(old)
+    template = ensure_template(args.out_dir, key)
+
+    pipeline_path = os.path.join(gp.BASE, "pipeline.py")
+    source = ""
+    if os.path.exists(pipeline_path):
+        with open(pipeline_path, "r", encoding="utf-8") as f:
+            source = f.read()
+    snippets = snippets_for(source, cache)
+    captions = gp.parse_figures_md(gp.FIG_MD)
+    images = {}
+    for name in gp.VIS_ORDER:
+        path = os.path.join(gp.FIG_DIR, name)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                images[name] = f.read()
+    doc, numbers_from = load_numbers(args.stats, args.clean)
+    print(f"Read {numbers_from} ({doc['overall']['rows']} rows, {len(doc['by_group'])} groups), pipeline.py and "
+          f"{len(images)} figures in {time.perf_counter() - t0:.2f}s")
+
+    decks = [("CW1_presentation.pptx", gp.stats_slides(doc))]
+    if args.per_group:
+        if not doc["by_group"]:
+            print(f"- {numbers_from} has no per-group numbers, building the overall deck only")
+        for g in doc["by_group"]:
+            decks.append((f"CW1_presentation_{_slug(g)}.pptx", gp.stats_slides(doc, g)))
+
+    image_hashes = {name: _sha(data) for name, data in images.items()}
+    built = cache.get("decks", {})
+    todo = []
+    for name, numbers in decks:
+        out = os.path.join(args.out_dir, name)
+        fp = _sha(json.dumps([key, numbers, snippets, captions, image_hashes, _sha(source)], sort_keys=True))
+        if built.get(name) == fp and os.path.exists(out):
+            print(f"- {name}: unchanged, skipped")
+        else:
+            todo.append((name, out, numbers, fp))
+
+    if todo:
+        workers = max(1, min(args.workers, len(todo)))
+        jobs = [(template, out, numbers, snippets, captions, images, source) for _, out, numbers, _ in todo]
+        if workers == 1:
+            results = [build_deck(*job) for job in jobs]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(build_deck, *zip(*jobs)))
+        for (name, _, _, fp), (_, secs) in zip(todo, results):
+            built[name] = fp
+            print(f"- {name}: built in {secs:.2f}s")
+    cache["decks"] = built
+
+    with open(cache_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+    print(f"✅ {len(todo)} deck(s) built, {len(decks) - len(todo)} skipped → {args.out_dir}"
+          f" ({time.perf_counter() - t0:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+Step 2 of the cleaner: drop duplicate rows, in one of three modes.
+
+Every row is reduced to one 64-bit fingerprint (pandas' hash_pandas_object over
+the fields that matter for the mode) and only those uint64s are remembered
+between chunks, files and incremental runs - 8 bytes per kept row (16 per key
+while looking for the latest version of each incident).
+
+ - exact   rows whose raw text is identical (what drop_duplicates() did)
+ - key     one row per incident `number`, the LAST one in the export wins, so a
+           re-export with a new events_count or a reformatted timestamp
+           replaces the earlier row. Rows without a number are all kept.
+ - near    rows that are identical once normalised: timestamps floored to the
+           minute, text stripped and casefolded, priority in its canonical
+           form. That needs the parsed / mapped columns, so this mode runs on
+           the output of steps 3-8 instead of the raw rows.
+"""
+
+import numpy as np
+import pandas as pd
+
+from storage import clean_dtypes, decode_numbers, fit_integers
+
+MODES = ["exact", "key", "near"]
+KEY = "number"
+NO_KEY = np.uint64(0)  # fingerprint of rows that have no key (never deduplicated)
+NEAR_COLS = ["number", "first_opened_at", "last_resolved_at", "last_closed_at", "final_priority", "final_state",
+             "assignment_group_mode", "events_count"]
+
+
+def row_hashes(df):
+    """Fingerprint of the whole raw row (exact mode)."""
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+def _text(s):
+    # strip + casefold each distinct value once; "", "nan" and NaN are all missing
+    codes, uniques = pd.factorize(decode_numbers(s))
+    norm = pd.Index(uniques, dtype=object).astype(str).str.strip().str.casefold()
+    norm = np.append(norm.to_numpy(dtype=object), None)
+    norm[np.isin(norm, ["", "nan"])] = None
+    return norm[codes]
+
+
+def key_hashes(df, key=KEY):
+    """(fingerprint of the normalised key, mask of rows that have a key)."""
+    k = _text(df[key])
+    has = pd.notna(k)
+    return pd.util.hash_pandas_object(pd.Series(k), index=False).to_numpy(), has
+
+
+def near_hashes(df):
+    """Fingerprint of the normalised row (near mode); expects the cleaned columns."""
+    norm = {}
+    for c in NEAR_COLS:
+        if c not in df.columns:
+            continue
+        s = df[c]
+        if pd.api.types.is_datetime64_any_dtype(s):
+            norm[c] = s.dt.floor("min")
+        elif c == "events_count":
+            # as keep_columns() stores it, whichever side of it the rows are
+            norm[c] = fit_integers(s, clean_dtypes()["events_count"])[0]
+        else:
+            norm[c] = _text(s)
+    return pd.util.hash_pandas_object(pd.DataFrame(norm, index=df.index), index=False).to_numpy()
+
+
+class SeenHashes:
+    """Sorted uint64 arrays of row hashes we've already kept (8 bytes per row).
+
+    New hashes go into a short list of sorted runs, merged like a binary
+    counter (a run is merged into the one before it once it's at least as big),
+    so each hash is merged O(log n) times rather than re-sorting everything per
+    chunk. `values` compacts them into the one sorted array that gets saved.
+    """
+
+    def __init__(self):
+        self._runs = []
+
+    @property
+    def values(self):
+        if len(self._runs) != 1:
+            merged = np.empty(0, dtype=np.uint64)
+            for run in self._runs:
+                merged = _merge_sorted(merged, run)
+            self._runs = [merged]
+        return self._runs[0]
+
+    @values.setter
+    def values(self, values):
+        self._runs = [np.asarray(values, dtype=np.uint64)]
+
+    def __len__(self):
+        return sum(len(run) for run in self._runs)
+
+    def copy(self):
+        # cheap: runs are only ever replaced by merged copies, never changed in place
+        other = SeenHashes()
+        other._runs = list(self._runs)
+        return other
+
+    def contains(self, h):
+        h = np.asarray(h, dtype=np.uint64)
+        found = np.zeros(len(h), dtype=bool)
+        for run in self._runs:
+            if not len(run):
+                continue
+            pos = np.searchsorted(run, h)
+            pos[pos == len(run)] = 0
+            found |= run[pos] == h
+        return found
+
+    def first_seen(self, h):
+        """Mask of hashes not seen before (and not repeated earlier in h); remembers them."""
+        h = np.asarray(h, dtype=np.uint64)
+        new = ~pd.Series(h).duplicated().to_numpy() & ~self.contains(h)
+        run = np.sort(h[new])
+        while self._runs and len(self._runs[-1]) <= len(run):
+            run = _merge_sorted(self._runs.pop(), run)
+        if len(run):
+            self._runs.append(run)
+        return new
+
+
+def _merge_sorted(a, b):
+    # linear merge of two sorted arrays (no re-sort)
+    return np.insert(a, np.searchsorted(a, b), b) if len(a) else b
+
+
+class LatestKeys:
+    """Where the last row of every key is: sorted key hashes + their last row position.
+
+    Built in one pass over just the key column (see scan()), then used to keep
+    only each key's last row while the full rows stream past.
+    """
+
+    def __init__(self, keys=None, positions=None):
+        self.keys = np.empty(0, dtype=np.uint64) if keys is None else keys
+        self.positions = np.empty(0, dtype=np.int64) if positions is None else positions
+
+    @classmethod
+    def scan(cls, chunks):
+        """From an iterable of frames holding (at least) the key column, in export order."""
+        keys, positions, start = [], [], 0
+        for chunk in chunks:
+            h, has = key_hashes(chunk)
+            keys.append(h[has])
+            positions.append(start + np.flatnonzero(has))
+            start += len(chunk)
+        if not keys:
+            return cls()
+        keys = np.concatenate(keys)
+        positions = np.concatenate(positions)
+        # stable sort keeps positions ascending within a key, so the last of each run wins
+        order = np.argsort(keys, kind="stable")
+        keys, positions = keys[order], positions[order]
+        last = np.append(keys[1:] != keys[:-1], True)
+        return cls(keys[last], positions[last])
+
+    def is_latest(self, h, positions):
+        if not len(self.keys):
+            return np.zeros(len(h), dtype=bool)
+        pos = np.searchsorted(self.keys, h)
+        pos[pos == len(self.keys)] = 0
+        return (self.keys[pos] == h) & (self.positions[pos] == positions)
+
+
+class Dedup:
+    """Step 2 as a filter over consecutive chunks of one export.
+
+    raw() runs on the rows as read (exact / key), clean() on the output of steps
+    3-8 (near); each returns (kept rows, their fingerprints as a Series indexed
+    like the rows) and the other one passes chunks through. In key mode rows
+    without a key get the fingerprint NO_KEY. `removed` counts the rows
+    dropped so far.
+    """
+
+    def __init__(self, mode="exact", latest=None, seen=None):
+        if mode not in MODES:
+            raise ValueError(f"unknown dedup mode '{mode}' (one of {', '.join(MODES)})")
+        if mode == "key" and latest is None:
+            raise ValueError("key mode needs the LatestKeys of the export (LatestKeys.scan)")
+        self.mode = mode
+        self.latest = latest
+        self.seen = SeenHashes() if seen is None else seen
+        self.position = 0  # rows of the export passed to raw() so far
+        self.removed = 0
+
+    def _keep(self, df, keep, h):
+        self.removed += int((~keep).sum())
+        return df[keep], pd.Series(h, index=df.index)[keep]
+
+    def raw(self, df):
+        if self.mode == "exact":
+            h = row_hashes(df)
+            return self._keep(df, self.seen.first_seen(h), h)
+        if self.mode == "key":
+            h, has = key_hashes(df)
+            positions = np.arange(self.position, self.position + len(df))
+            self.position += len(df)
+            return self._keep(df, ~has | self.latest.is_latest(h, positions), np.where(has, h, NO_KEY))
+        return df, None
+
+    def clean(self, df):
+        if self.mode != "near":
+            return df, None
+        h = near_hashes(df)
+        return self._keep(df, self.seen.first_seen(h), h)
@@ -1,115 +1,182 @@
-import pandas as pd
+import argparse
+
 import numpy as np
-import random
-from datetime import timedelta
-
-# read your clean-ish base file
-src = "data/incidents_aggregated_5k.csv"  # change if needed
-dst = "data/incidents_dirty.csv"
-
-df = pd.read_csv(src, low_memory=False)
-df_dirty = df.copy()
-
-print(f"Loaded source: {src}")
-print(f"- starting rows: {len(df)}")
-
-n = len(df_dirty)
-rng = np.random.default_rng(42)
-
-# 1) add ~1% duplicate rows
-dupes = df_dirty.sample(frac=0.01, random_state=42)
-df_dirty = pd.concat([df_dirty, dupes], ignore_index=True)
-print(f"Injected duplicates: {len(dupes)} rows (1%) -> rows now: {len(df_dirty)})")
-
-# 2) introduce missing values (~2%) in key columns
-if "final_priority" in df_dirty.columns:
-    idx = df_dirty.sample(frac=0.02, random_state=1).index
-    df_dirty.loc[idx, "final_priority"] = np.nan
-    print(f"Introduced missing final_priority: {len(idx)} rows (~2%)")
-
-if "assignment_group_mode" in df_dirty.columns:
-    idx = df_dirty.sample(frac=0.02, random_state=2).index
-    df_dirty.loc[idx, "assignment_group_mode"] = np.nan
-    print(f"Introduced missing assignment_group_mode: {len(idx)} rows (~2%)")
-
-# 3) inconsistent priority labels (~1%)
-if "final_priority" in df_dirty.columns:
-    map_variants = {
-        "1 - Critical": ["critical", "Critical", "1-critical", "P1"],
-        "2 - High": ["high", "High", "2-high", "P2"],
-        "3 - Moderate": ["moderate", "Moderate", "3-mod", "P3"],
-        "4 - Low": ["low", "Low", "4-low", "P4"],
-    }
-    idx = df_dirty.sample(frac=0.01, random_state=3).index
-    for i in idx:
-        val = df_dirty.at[i, "final_priority"]
-        if pd.isna(val):
-            continue
-        # pick a variant for the current value if known
-        variants = map_variants.get(val, None)
-        if variants:
-            df_dirty.at[i, "final_priority"] = random.choice(variants)
-    print(f"Corrupted priority labels (variants applied): {len(idx)} rows (~1%)")
-
-# 4) dirty up date formats (first_opened_at) (~1.5%)
-def to_weird_formats(s):
-    # expect a datetime-like string; keep original if issue
-    try:
-        dt = pd.to_datetime(s, errors="coerce")
-        if pd.isna(dt):  # already bad -> leave it
-            return s
-        choice = rng.choice([0,1,2,3])
-        if choice == 0:
-            return dt.strftime("%d/%m/%Y %H:%M")        # European
-        elif choice == 1:
-            return dt.strftime("%m/%d/%Y %H:%M")        # US style
-        elif choice == 2:
-            return dt.strftime("%Y/%m/%d %H:%M")        # ISO-ish with slashes
-        else:
-            return dt.strftime("%Y-%m-%dT%H:%M:%SZ")    # ISO with Z
-    except Exception:
-        return s
-
-if "first_opened_at" in df_dirty.columns:
-    idx = df_dirty.sample(frac=0.015, random_state=4).index
-    df_dirty.loc[idx, "first_opened_at"] = df_dirty.loc[idx, "first_opened_at"].astype(str).map(to_weird_formats)
-
-    # add a few outright invalid strings (~0.3%)
-    idx_bad = df_dirty.sample(frac=0.003, random_state=5).index
-    df_dirty.loc[idx_bad, "first_opened_at"] = "not a date"
-    print(f"Changed date formats for first_opened_at: {len(idx)} rows (~1.5%)")
-    print(f"Inserted invalid date strings: {len(idx_bad)} rows (~0.3%)")
-
-# 5) make some bad durations in resolution_hours
-if "resolution_hours" in df_dirty.columns:
-    # ~0.5% negative
-    idx_neg = df_dirty.sample(frac=0.005, random_state=6).index
-    df_dirty.loc[idx_neg, "resolution_hours"] = -abs(pd.to_numeric(df_dirty.loc[idx_neg, "resolution_hours"], errors="coerce"))
-
-    # ~0.5% huge outliers
-    idx_huge = df_dirty.sample(frac=0.005, random_state=7).index
-    df_dirty.loc[idx_huge, "resolution_hours"] = 9999
-    print(f"Injected negative durations: {len(idx_neg)} rows (~0.5%)")
-    print(f"Injected huge outliers (9999): {len(idx_huge)} rows (~0.5%)")
-
-# 6) make some resolved earlier than opened (~0.5%) to simulate time order bugs
-if {"first_opened_at","last_resolved_at"}.issubset(df_dirty.columns):
-    idx_swap = df_dirty.sample(frac=0.005, random_state=8).index
-    opened = pd.to_datetime(df_dirty.loc[idx_swap, "first_opened_at"], errors="coerce")
-    resolved = pd.to_datetime(df_dirty.loc[idx_swap, "last_resolved_at"], errors="coerce")
-    # push resolved 5 hours before opened (only where both parse)
-    mask = opened.notna() & resolved.notna()
-    adj_idx = df_dirty.loc[idx_swap].index[mask]
-    df_dirty.loc[adj_idx, "last_resolved_at"] = (opened[mask] - pd.Timedelta(hours=5)).astype(str)
-    print(f"Swapped timestamps (resolved before opened) for {len(adj_idx)} rows (~0.5% attempted)")
-
-# 7) add extra spaces in assignment group (~1%)
-if "assignment_group_mode" in df_dirty.columns:
-    idx = df_dirty.sample(frac=0.01, random_state=9).index
-    df_dirty.loc[idx, "assignment_group_mode"] = df_dirty.loc[idx, "assignment_group_mode"].astype(str).apply(lambda x: f" {x}  ")
-    print(f"Added extra spaces to assignment_group_mode for {len(idx)} rows (~1%)")
-
-# write out dirty file
-df_dirty.to_csv(dst, index=False)
-print(f"✅ Wrote dirty dataset → {dst}")
-print(f"Rows (including dupes): {len(df_dirty)}")
+import pandas as pd
+
+from pipeline import parse_dt
+from storage import TableWriter, iter_table
+
+SRC = "data/incidents_aggregated_5k.csv"  # clean-ish base file
+DST = "data/incidents_dirty.csv"
+
+# what we break, and in roughly what fraction of rows. Each corruption gets its
+# own random mask per chunk, so they overlap the same way independent samples would.
+CORRUPTION_RATES = {
+    "duplicate": 0.01,               # 1) exact copies appended to the chunk
+    "missing_priority": 0.02,        # 2) final_priority -> NaN
+    "missing_group": 0.02,           #    assignment_group_mode -> NaN
+    "priority_variant": 0.01,        # 3) "2 - High" -> "high", "P2", ...
+    "weird_date_format": 0.015,      # 4) first_opened_at in EU / US / slashed / Z formats
+    "invalid_date": 0.003,           #    first_opened_at -> "not a date"
+    "negative_duration": 0.005,      # 5) resolution_hours -> negative
+    "huge_duration": 0.005,          #    resolution_hours -> 9999
+    "resolved_before_opened": 0.005, # 6) last_resolved_at 5h before first_opened_at
+    "padded_group": 0.01,            # 7) " Network  "
+}
+
+PRIORITY_VARIANTS = {
+    "1 - Critical": ["critical", "Critical", "1-critical", "P1"],
+    "2 - High": ["high", "High", "2-high", "P2"],
+    "3 - Moderate": ["moderate", "Moderate", "3-mod", "P3"],
+    "4 - Low": ["low", "Low", "4-low", "P4"],
+}
+
+WEIRD_FORMATS = [
+    "%d/%m/%Y %H:%M",        # European
+    "%m/%d/%Y %H:%M",        # US style
+    "%Y/%m/%d %H:%M",        # ISO-ish with slashes
+    "%Y-%m-%dT%H:%M:%SZ",    # ISO with Z
+]
+
+
+def _as_text(df):
+    # typed columns (parquet/feather input) -> plain objects, since we write bad
+    # strings / new labels into them below
+    for c in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[c]):
+            df[c] = df[c].astype(str).where(df[c].notna())
+        elif isinstance(df[c].dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(df[c]):
+            df[c] = df[c].astype(object)
+    return df
+
+
+def corrupt_chunk(df, rates, rng):
+    """Apply every corruption in `rates` to one chunk. Returns (df, rows hit per corruption)."""
+    df = _as_text(df)
+    hit = {}
+
+    def mask(name):
+        m = rng.random(len(df)) < rates.get(name, 0)
+        hit[name] = hit.get(name, 0) + int(m.sum())
+        return m
+
+    # 1) duplicates first, so the copies can get corrupted further like in real exports
+    dupes = df[mask("duplicate")]
+    df = pd.concat([df, dupes], ignore_index=True)
+
+    # 2) missing values in key columns
+    if "final_priority" in df.columns:
+        df.loc[mask("missing_priority"), "final_priority"] = np.nan
+    if "assignment_group_mode" in df.columns:
+        df.loc[mask("missing_group"), "assignment_group_mode"] = np.nan
+
+    # 3) inconsistent priority labels: a random variant of the current value
+    if "final_priority" in df.columns:
+        m = mask("priority_variant")
+        for canon, variants in PRIORITY_VARIANTS.items():
+            rows = m & (df["final_priority"] == canon).to_numpy()
+            if rows.any():
+                pick = rng.integers(0, len(variants), rows.sum())
+                df.loc[rows, "final_priority"] = np.array(variants, dtype=object)[pick]
+
+    # 4) dirty up date formats in first_opened_at (values that don't parse are left alone)
+    if "first_opened_at" in df.columns:
+        m = mask("weird_date_format")
+        dt = parse_dt(df.loc[m, "first_opened_at"])
+        dt = dt[dt.notna()]
+        fmt = rng.integers(0, len(WEIRD_FORMATS), len(dt))
+        for k, f in enumerate(WEIRD_FORMATS):
+            sel = dt[fmt == k]
+            df.loc[sel.index, "first_opened_at"] = sel.dt.strftime(f)
+        # a few outright invalid strings
+        df.loc[mask("invalid_date"), "first_opened_at"] = "not a date"
+
+    # 5) bad durations in resolution_hours
+    if "resolution_hours" in df.columns:
+        m = mask("negative_duration")
+        df.loc[m, "resolution_hours"] = -pd.to_numeric(df.loc[m, "resolution_hours"], errors="coerce").abs()
+        df.loc[mask("huge_duration"), "resolution_hours"] = 9999
+
+    # 6) resolved earlier than opened, to simulate time order bugs
+    if {"first_opened_at", "last_resolved_at"}.issubset(df.columns):
+        m = mask("resolved_before_opened")
+        opened = parse_dt(df.loc[m, "first_opened_at"])
+        resolved = parse_dt(df.loc[m, "last_resolved_at"])
+        ok = opened.notna() & resolved.notna()
+        df.loc[ok[ok].index, "last_resolved_at"] = (opened[ok] - pd.Timedelta(hours=5)).astype(str)
+
+    # 7) extra spaces in assignment group (NaN turns into " nan  ", as it always has)
+    if "assignment_group_mode" in df.columns:
+        m = mask("padded_group")
+        df.loc[m, "assignment_group_mode"] = " " + df.loc[m, "assignment_group_mode"].astype(str) + "  "
+
+    return df, hit
+
+
+def corrupt(df, rates=CORRUPTION_RATES, seed=42, chunksize=1_000_000, hit=None):
+    """corrupt_chunk() over a frame already in memory; returns the dirty frame.
+
+    Uses the same per-chunk random streams as run(), so corrupt(df) is the file
+    run() writes for df. `hit`, if given, is a dict that gets rows hit per
+    corruption added to it.
+    """
+    parts = []
+    for i, start in enumerate(range(0, max(len(df), 1), chunksize)):
+        # corrupt_chunk converts columns in place; don't touch the caller's frame
+        part, h = corrupt_chunk(df.iloc[start:start + chunksize].copy(deep=False), rates,
+                                np.random.default_rng([seed, i]))
+        parts.append(part)
+        if hit is not None:
+            for k, v in h.items():
+                hit[k] = hit.get(k, 0) + v
+    return pd.concat(parts, ignore_index=True)
+
+
+def run(src=SRC, dst=DST, rates=CORRUPTION_RATES, seed=42, chunksize=1_000_000):
+    """Corrupt `src` chunk by chunk into `dst`.
+
+    Chunk i uses the random stream seeded from (seed, i), so the same seed and
+    chunksize always give the same dirty file.
+    """
+    print(f"Loaded source: {src}")
+    rows_in = 0
+    hit = {}
+    with TableWriter(dst) as writer:
+        for i, chunk in enumerate(iter_table(src, chunksize)):
+            rows_in += len(chunk)
+            chunk, h = corrupt_chunk(chunk, rates, np.random.default_rng([seed, i]))
+            for k, v in h.items():
+                hit[k] = hit.get(k, 0) + v
+            writer.write(chunk)
+
+    print(f"- starting rows: {rows_in}")
+    for name, rate in rates.items():
+        print(f"Corruption {name}: {hit.get(name, 0)} rows (~{rate:.1%})")
+    print(f"✅ Wrote dirty dataset → {dst}")
+    print(f"Rows (including dupes): {writer.rows}")
+    return hit
+
+
+def _rate(text):
+    name, _, value = text.partition("=")
+    if name not in CORRUPTION_RATES:
+        raise argparse.ArgumentTypeError(f"unknown corruption '{name}' (one of {', '.join(CORRUPTION_RATES)})")
+    return name, float(value)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Inject data quality problems into the incidents dataset.")
+    ap.add_argument("--src", default=SRC, help="clean-ish base file")
+    ap.add_argument("--dst", default=DST, help="dirty output (.csv, .parquet or .feather)")
+    ap.add_argument("--seed", type=int, default=42, help="random seed (same seed + chunksize -> same output)")
+    ap.add_argument("--chunksize", type=int, default=1_000_000, help="rows corrupted per chunk")
+    ap.add_argument("--rate", type=_rate, action="append", default=[], metavar="NAME=FRACTION",
+                    help="override one corruption rate, e.g. --rate invalid_date=0.05 (repeatable)")
+    args = ap.parse_args()
+
+    rates = dict(CORRUPTION_RATES, **dict(args.rate))
+    run(args.src, args.dst, rates, args.seed, args.chunksize)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Model-ready feature store of the clean incidents: memory-mapped .npy arrays + a schema.
+
+pipeline.py --features DIR writes, one row per clean incident, in row order:
+ DIR/numeric.npy     float32 (n, 5)  opened hour of day (with minutes), day of week
+                                     (Mon=0), day of year, days since 1970-01-01,
+                                     events_count (NaN if missing)
+ DIR/categories.npy  int16 (n, 3)    final_priority / assignment_group_mode /
+                                     final_state as codes into schema["vocab"], -1 = missing
+ DIR/targets.npy     int8 (n, 3)     sla_breached, quick_resolution, priority_label (-1 = missing)
+ DIR/hours.npy       float32 (n,)    resolution_hours (capped), for duration models
+ DIR/schema.json     row count, column names per array, the vocabularies
+Training jobs open them with np.load(mmap_mode="r") - no parsing, and only the
+pages a batch touches are read:
+
+    fs = FeatureStore("data/features")
+    X = np.hstack([fs.numeric, fs.one_hot("final_priority")])
+    for batch in fs.batches(4096, shuffle=True):
+        ...  # batch["numeric"], batch["targets"], ... are views into the files
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+SCHEMA = "schema.json"
+SCHEMA_VERSION = 1
+NUMERIC = ["opened_hour", "opened_dow", "opened_doy", "opened_day", "events_count"]
+CATEGORICAL = ["final_priority", "assignment_group_mode", "final_state"]
+TARGETS = ["sla_breached", "quick_resolution", "priority_label"]
+HOURS = "resolution_hours"
+# priorities always get the same codes, whichever order they turn up in
+PRIORITIES = ["1 - Critical", "2 - High", "3 - Moderate", "4 - Low"]
+ARRAYS = {
+    # name -> (dtype, columns; None for a 1-d array)
+    "numeric": ("float32", NUMERIC),
+    "categories": ("int16", CATEGORICAL),  # int16, not int8: there can be more than 127 groups
+    "targets": ("int8", TARGETS),
+    "hours": ("float32", None),
+}
+
+
+def _opened(s):
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s
+    return pd.to_datetime(s, format="ISO8601", errors="coerce")
+
+
+class FeatureWriter:
+    """Write clean chunks of a known total of `rows` rows into DIR's arrays.
+
+    The arrays are allocated up front as memory-mapped .npy files and filled in
+    place, so memory stays one chunk's worth however many rows there are. The
+    vocabularies grow as new values turn up (codes never change once given).
+    """
+
+    def __init__(self, directory, rows):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.rows = rows
+        self.pos = 0
+        self.vocab = {c: list(PRIORITIES) if c == "final_priority" else [] for c in CATEGORICAL}
+        self.arrays = {}
+        for name, (dtype, cols) in ARRAYS.items():
+            shape = (rows,) if cols is None else (rows, len(cols))
+            self.arrays[name] = np.lib.format.open_memmap(os.path.join(directory, f"{name}.npy"), mode="w+",
+                                                          dtype=dtype, shape=shape)
+
+    def _codes(self, col, s):
+        vocab = self.vocab[col]
+        known = {v: i for i, v in enumerate(vocab)}
+        # look each distinct value up once, then broadcast with the codes
+        codes, uniques = pd.factorize(s.astype(object).where(s.notna(), None))
+        for v in uniques:
+            if str(v) not in known:
+                known[str(v)] = len(vocab)
+                vocab.append(str(v))
+        lookup = np.array([known[str(v)] for v in uniques] + [-1], dtype="int16")
+        return lookup[codes]  # code -1 (missing) picks the trailing -1
+
+    def write(self, df):
+        n = len(df)
+        if self.pos + n > self.rows:
+            raise ValueError(f"{self.directory}: more than the {self.rows} rows it was sized for")
+        rows = slice(self.pos, self.pos + n)
+        opened = _opened(df["first_opened_at"])
+        num = self.arrays["numeric"]
+        num[rows, 0] = (opened.dt.hour + opened.dt.minute / 60).to_numpy("float32", na_value=np.nan)
+        num[rows, 1] = opened.dt.dayofweek.to_numpy("float32", na_value=np.nan)
+        num[rows, 2] = opened.dt.dayofyear.to_numpy("float32", na_value=np.nan)
+        days = opened.to_numpy("datetime64[ns]").astype("datetime64[D]")
+        num[rows, 3] = np.where(np.isnat(days), np.nan, days.astype("int64")).astype("float32")
+        num[rows, 4] = pd.to_numeric(df["events_count"], errors="coerce").to_numpy("float32", na_value=np.nan)
+        for j, c in enumerate(CATEGORICAL):
+            self.arrays["categories"][rows, j] = self._codes(c, df[c])
+        for j, c in enumerate(TARGETS):
+            self.arrays["targets"][rows, j] = pd.to_numeric(df[c], errors="coerce").fillna(-1).to_numpy("int8")
+        self.arrays["hours"][rows] = pd.to_numeric(df[HOURS], errors="coerce").to_numpy("float32", na_value=np.nan)
+        self.pos += n
+
+    def close(self):
+        if self.pos != self.rows:
+            raise ValueError(f"{self.directory}: wrote {self.pos} rows, sized for {self.rows}")
+        for arr in self.arrays.values():
+            arr.flush()
+        self.arrays = {}
+        schema = {
+            "version": SCHEMA_VERSION,
+            "rows": self.rows,
+            "arrays": {name: {"file": f"{name}.npy", "dtype": dtype, "columns": cols}
+                       for name, (dtype, cols) in ARRAYS.items()},
+            "missing_code": -1,
+            "vocab": self.vocab,
+        }
+        with open(os.path.join(self.directory, SCHEMA), "w", encoding="utf-8") as f:
+            json.dump(schema, f, indent=2)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+
+
+def write_features(df, directory):
+    """The whole clean frame -> DIR; returns the schema's vocabularies."""
+    with FeatureWriter(directory, len(df)) as w:
+        w.write(df)
+    return w.vocab
+
+
+class FeatureStore:
+    """Read side: the arrays memory-mapped read-only, plus schema helpers."""
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, SCHEMA), "r", encoding="utf-8") as f:
+            self.schema = json.load(f)
+        if self.schema.get("version") != SCHEMA_VERSION:
+            raise ValueError(f"{directory}: schema version {self.schema.get('version')}, expected {SCHEMA_VERSION}")
+        self.rows = self.schema["rows"]
+        self.vocab = self.schema["vocab"]
+        for name, spec in self.schema["arrays"].items():
+            setattr(self, name, np.load(os.path.join(directory, spec["file"]), mmap_mode="r"))
+
+    def __len__(self):
+        return self.rows
+
+    def column(self, name):
+        """One named column (a view) from whichever array holds it."""
+        for array, spec in self.schema["arrays"].items():
+            if spec["columns"] is None and name == HOURS:
+                return getattr(self, array)
+            if spec["columns"] and name in spec["columns"]:
+                return getattr(self, array)[:, spec["columns"].index(name)]
+        raise KeyError(name)
+
+    def one_hot(self, name, rows=slice(None)):
+        """float32 one-hot of a categorical (missing rows are all zeros), columns in vocab order."""
+        codes = np.asarray(self.column(name)[rows])
+        out = np.zeros((len(codes), len(self.vocab[name])), dtype="float32")
+        ok = codes >= 0
+        out[np.flatnonzero(ok), codes[ok]] = 1.0
+        return out
+
+    def batches(self, batch_size, shuffle=False, seed=None):
+        """Yield {array name: rows} for consecutive row blocks - views, nothing copied.
+
+        With shuffle, the blocks come in a random order (each block is still
+        contiguous, so reads stay sequential within it).
+        """
+        starts = np.arange(0, self.rows, batch_size)
+        if shuffle:
+            np.random.default_rng(seed).shuffle(starts)
+        for start in starts:
+            rows = slice(int(start), int(min(start + batch_size, self.rows)))
+            yield {name: getattr(self, name)[rows] for name in self.schema["arrays"]}
@@ -11,16 +11,18 @@ This script embeds captions directly under each figure and writes detailed notes
 Replace [YourName] and [YourID] in filenames before final save, or edit the variables below.
 """
 
+import json
 import os
 import textwrap
-from pptx import Presentation
-from pptx.util import Inches, Pt
-from pptx.enum.text import PP_ALIGN
 from datetime import timedelta
+# python-pptx is imported inside the functions that build slides, so the
+# caption/snippet helpers (and --help style startup) don't pay for it
 
 BASE = os.path.dirname(__file__)
 FIG_DIR = os.path.join(BASE, "data", "figures")
 FIG_MD = os.path.join(FIG_DIR, "FIGURES.md")
+# numbers for the slides, from: python summary.py --stats-json data/incidents_stats.json --stage-log ...
+STATS_JSON = os.path.join(BASE, "data", "incidents_stats.json")
 
 # Output filenames (placeholders)
 NAME = "[YourName]"
@@ -77,6 +79,7 @@ def add_title_slide(prs, title, subtitle):
 
 # Add a slide with bullet points
 def add_bullet_slide(prs, title, bullets, notes=None):
+    from pptx.util import Pt
     layout = prs.slide_layouts[1]
     slide = prs.slides.add_slide(layout)
     slide.shapes.title.text = title
@@ -100,6 +103,7 @@ def add_notes(slide, notes_text):
 
 # Add image + caption slide (image on left or top)
 def add_image_caption_slide(prs, title, image_path, caption, notes=None):
+    from pptx.util import Inches, Pt
     slide = prs.slides.add_slide(prs.slide_layouts[6])  # blank
     # title
     left = Inches(0.4)
@@ -157,7 +161,10 @@ def extract_snippet(file_path, anchors, context_lines=1):
     if not os.path.exists(file_path):
         return ""
     with open(file_path, 'r', encoding='utf-8') as f:
-        lines = f.read().splitlines()
+        return _snippet(f.read().splitlines(), anchors, context_lines)
+
+
+def _snippet(lines, anchors, context_lines=1):
     for i, line in enumerate(lines):
         for anchor in anchors:
             if anchor in line:
@@ -167,86 +174,190 @@ def extract_snippet(file_path, anchors, context_lines=1):
     return ""
 
 
-# Build presentation
-def build_presentation():
-    captions = parse_figures_md(FIG_MD)
-    fig_files = [f for f in os.listdir(FIG_DIR) if f.lower().endswith('.png')]
-
-    prs = Presentation()
-    prs.slide_width = Inches(13.33)
-    prs.slide_height = Inches(7.5)
+# Slide content. Kept as data so deck.py can build the static slides into a
+# template once and only add the figure / snippet slides per deck.
+TITLE = ("Coursework 1: Dataset selection & preprocessing",
+         "COM774 — Intelligence Engineering and Infrastructure\nPrepared: [Your Name] | Student ID: [Your ID]")
 
-    # Title slide
-    title = "Coursework 1: Dataset selection & preprocessing"
-    subtitle = f"COM774 — Intelligence Engineering and Infrastructure\nPrepared: [Your Name] | Student ID: [Your ID]"
-    add_title_slide(prs, title, subtitle)
-
-    # Core slides
-    add_bullet_slide(prs, "Introduction & Aim", [
+INTRO_SLIDES = [
+    ("Introduction & Aim", [
         "Aim: Select and prepare a dataset for a DevOps-related ML problem.",
         "This coursework focuses on the Data Pipeline; CW2 will build the ML model."],
-        notes="Introduce the coursework purpose, deliverables and link to CW2.")
-
-    add_bullet_slide(prs, "Dataset Overview", [
+        "Introduce the coursework purpose, deliverables and link to CW2."),
+    ("Dataset Overview", [
         "Source: local repository 'data/incidents_clean.csv' (cleaned output).",
         "Schema: key columns include first_opened_at, final_priority, resolution_hours, assignment_group_mode."],
-        notes="Show 1-2 sample rows and mention size and date range.")
-
-    add_bullet_slide(prs, "Why this dataset?", [
+        "Show 1-2 sample rows and mention size and date range."),
+    ("Why this dataset?", [
         "Relevant to incident management and SLA monitoring in DevOps.",
         "Feasible for CW2 ML tasks (predict breach/priority/duration)."],
-        notes="Explain practical value and link to real-world DevOps operations.")
-
-    add_bullet_slide(prs, "Data Quality Issues Found", [
+        "Explain practical value and link to real-world DevOps operations."),
+    ("Data Quality Issues Found", [
         "Missing values in priority and timestamps; inconsistent assignment_group labels.",
         "Outliers in resolution hours and negative/invalid timestamps."],
-        notes="Quantify counts where possible (use summary outputs).")
-
-    add_bullet_slide(prs, "Cleaning & Preprocessing Steps", [
+        "Quantify counts where possible (use summary outputs)."),
+    ("Cleaning & Preprocessing Steps", [
         "Drop exact duplicates and rows without opened timestamp.",
         "Normalize priority labels; parse timestamps; compute resolution_hours from timestamps.",
         "Clip extreme resolution outliers, encode categories, create SLA flags."],
-        notes="Reference pipeline.py and explain rationale for each step.")
+        "Reference pipeline.py and explain rationale for each step."),
+]
+
+# (slide title, anchors, context lines, note) for the code snippet slides
+SNIPPETS = [
+    ('Code: parse timestamps (snippet)', ['def parse_dt', 'pd.to_datetime'], 1,
+     'Parse mixed-format date/time strings and coerce failures to NaT to make downstream duration calculations safe.'),
+    ('Code: compute resolution_hours (snippet)', ['resolution_hours_from_time', 'dt.total_seconds'], 2,
+     'Compute duration in hours from timestamps; prefer computed duration when available and coerce original values to numeric.'),
+    ('Code: canonicalise category labels (snippet)', ['canon = key.map(aliases'], 4,
+     'Clean each distinct priority/group/state label once (strip, casefold, alias lookup) and map the rows '
+     'through the categorical codes, so label variants merge into canonical categories for modelling.'),
+]
+
+VIS_ORDER = [
+    'incidents_over_time.png',
+    'missingness_heatmap.png',
+    'incidents_per_priority.png',
+    'sla_rate_by_month.png',
+    'resolution_by_priority.png',
+    'incidents_dirty_vs_clean.png'
+]
+
+INTEGRITY = (
+    'I declare that this is all my own work. Any material I have referred to has been accurately referenced and any contribution of Artificial Intelligence technology has been fully acknowledged.'
+)
+
+OUTRO_SLIDES = [
+    ('Limitations & Assumptions', [
+        'Data biases, gaps in time range, synthetic anomalies if used.',
+        'Decisions (clipping, encoding) may affect model behaviour in CW2.'], 'Be candid about limitations and how to mitigate.'),
+    ('Next steps for CW2', [
+        'Define target (SLA breach prediction) and candidate features.',
+        'Model evaluation plan: metrics, baseline, retraining triggers.'], 'Outline model approach and MLOps considerations.'),
+    ('Conclusion & Key Takeaways', [
+        'Dataset is feasible and relevant to incident management.',
+        'Cleaning steps improved quality and produced key features for ML.'], 'Summarise and provide call-to-action for CW2.'),
+    ('Academic Integrity Declaration', [INTEGRITY], 'Include full coursework declaration from brief.'),
+    ('Submission Checklist', [
+        'File: CW1_presentation_[YourName]_[YourID].pptx (ensure name & ID on first slide).',
+        'Embedded video and audio checked; length ≈7.5 minutes.',
+        'References and academic integrity slide present.'], 'Final checks before upload.'),
+    ('Reproducibility & Commands', [
+        'Run: python pipeline.py -> data/incidents_clean.csv',
+        'Run: python make_more_visuals.py -> data/figures/*.png',
+        'Python packages: see requirements or virtualenv used.'], 'Include exact versions in README if required.'),
+]
 
-    # Add code snippet slides (short, annotated)
-    pipeline_path = os.path.join(BASE, 'pipeline.py')
-    # snippet 1: parse_dt and date parsing
-    snip1 = extract_snippet(pipeline_path, ['def parse_dt', 'pd.to_datetime'])
-    note1 = 'Parse mixed-format date/time strings and coerce failures to NaT to make downstream duration calculations safe.'
-    if snip1:
-        add_image_caption_slide(prs, 'Code: parse timestamps (snippet)', '', snip1 + '\n\n' + note1, notes=note1)
-
-    # snippet 2: compute resolution_hours
-    snip2 = extract_snippet(pipeline_path, ['resolution_hours_from_time', 'dt.total_seconds'], context_lines=2)
-    note2 = 'Compute duration in hours from timestamps; prefer computed duration when available and coerce original values to numeric.'
-    if snip2:
-        add_image_caption_slide(prs, 'Code: compute resolution_hours (snippet)', '', snip2 + '\n\n' + note2, notes=note2)
-
-    # snippet 3: normalize priority mapping
-    snip3 = extract_snippet(pipeline_path, ['priority_map', 'def normalise_priority'], context_lines=3)
-    note3 = 'Map many variants of priority labels to canonical categories to ensure consistent modelling.'
-    if snip3:
-        add_image_caption_slide(prs, 'Code: normalise priority labels (snippet)', '', snip3 + '\n\n' + note3, notes=note3)
+APPENDIX_LINES = 120  # first lines of pipeline.py on the appendix slide
 
-    # Visual results slides (reuse earlier approach)
-    vis_order = [
-        'incidents_over_time.png',
-        'missingness_heatmap.png',
-        'incidents_per_priority.png',
-        'sla_rate_by_month.png',
-        'resolution_by_priority.png',
-        'incidents_dirty_vs_clean.png'
+
+# what each pipeline.py stage removes, for the data quality slide
+STEP_NAMES = {
+    "dedup": "duplicate rows",
+    "dedup_near": "near-duplicate rows",
+    "drop_unopened": "rows without an opened timestamp",
+    "drop_negative": "rows with negative resolution_hours",
+    "clean": "rows without an opened timestamp or with negative resolution_hours",  # streaming run
+}
+
+
+def load_stats(path=STATS_JSON):
+    """The statistics document summary.py --stats-json writes, or None if there isn't one."""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def quality_bullets(doc):
+    rows = doc["rows"]
+    out = []
+    if rows["dirty"]:
+        gone = rows["dirty"] - rows["clean"]
+        out.append(f"{rows['dirty']:,} rows in the dirty export -> {rows['clean']:,} clean "
+                   f"({gone:,} removed, {gone / rows['dirty']:.1%})")
+    else:
+        out.append(f"{rows['clean']:,} rows after cleaning")
+    for step in doc["steps"]:
+        if step.get("kind", "clean") == "clean" and step["removed"]:
+            out.append(f"Removed {step['removed']:,} {STEP_NAMES.get(step['stage'], 'rows at ' + step['stage'])}")
+    missing = doc["overall"]["priority"].get("nan", 0)
+    if missing:
+        out.append(f"{missing:,} clean rows still have no final_priority")
+    return out
+
+
+def summary_bullets(res, total_rows):
+    """Bullet text for one SummaryStats.results() dict."""
+    rows = res["rows"]
+    if not rows:
+        return ["No incidents in the cleaned data."]
+    out = [f"{rows:,} cleaned incidents ({rows / max(total_rows, 1):.1%} of all)"]
+    out.append(f"SLA breached (>24h): {res['sla_breach_rate']:.1%}")
+    if res["quick_rate"] is not None:
+        out.append(f"Quick resolution (<12h): {res['quick_rate']:.1%}")
+    hours = res["resolution_hours"]
+    if hours["count"]:
+        out.append(f"Resolution hours: median {hours['median']:.1f}, 90th pct {hours['p90']:.1f}, "
+                   f"99th pct {hours['p99']:.1f}")
+    top, n = max(res["priority"].items(), key=lambda kv: kv[1])
+    out.append(f"Most common priority: {top} ({n / rows:.1%})")
+    return out
+
+
+def stats_slides(doc, group=None):
+    """(title, bullets, notes) slides with the numbers from a stats document (one group's, if given)."""
+    res = doc["overall"] if group is None else doc["by_group"][group]
+    return [
+        ("Data quality in numbers", quality_bullets(doc),
+         "Counts from the cleaning run (pipeline.py stage log) and the cleaned data (summary.py)."),
+        (f"Summary: {'all incidents' if group is None else group}", summary_bullets(res, doc["overall"]["rows"]),
+         "Numbers from the cleaned data (summary.py)."),
     ]
-    for i in range(0, len(vis_order), 3):
-        group = vis_order[i:i+3]
+
+
+def new_presentation():
+    from pptx import Presentation
+    from pptx.util import Inches
+    prs = Presentation()
+    prs.slide_width = Inches(13.33)
+    prs.slide_height = Inches(7.5)
+    return prs
+
+
+def add_bullet_slides(prs, slides):
+    for title, bullets, notes in slides:
+        add_bullet_slide(prs, title, bullets, notes=notes)
+
+
+def snippet_slides(pipeline_source):
+    """(title, text, note) per SNIPPETS entry found in the pipeline.py source text."""
+    lines = pipeline_source.splitlines()
+    out = []
+    for title, anchors, context, note in SNIPPETS:
+        snip = _snippet(lines, anchors, context)
+        if snip:
+            out.append((title, snip + '\n\n' + note, note))
+    return out
+
+
+def add_snippet_slides(prs, snippets):
+    for title, text, note in snippets:
+        add_image_caption_slide(prs, title, '', text, notes=note)
+
+
+def add_visual_slides(prs, captions, images):
+    """Figures three to a slide. `images` maps file name -> path or file-like (missing names get a placeholder)."""
+    from pptx.util import Inches
+    for i in range(0, len(VIS_ORDER), 3):
+        group = VIS_ORDER[i:i+3]
         slide = prs.slides.add_slide(prs.slide_layouts[6])
         slide.shapes.add_textbox(Inches(0.5), Inches(0.2), Inches(12.3), Inches(0.6)).text_frame.text = 'Visual results'
         y = 1.0
         for img in group:
-            img_path = os.path.join(FIG_DIR, img)
             cap = captions.get(img, '')
             try:
-                slide.shapes.add_picture(img_path, Inches(0.5), Inches(y), width=Inches(4.0))
+                slide.shapes.add_picture(images[img], Inches(0.5), Inches(y), width=Inches(4.0))
             except Exception:
                 slide.shapes.add_textbox(Inches(0.5), Inches(y), Inches(4.0), Inches(1.0)).text_frame.text = f'(Missing: {img})'
             cf = slide.shapes.add_textbox(Inches(0.5), Inches(y+2.2), Inches(4.0), Inches(0.8)).text_frame
@@ -255,41 +366,48 @@ def build_presentation():
             y += 2.8
         add_notes(slide, 'Discuss interpretation and implication of each figure; refer to captions under images.')
 
-    # Limitations, Next steps, Conclusion, Integrity, Submission checklist
-    add_bullet_slide(prs, 'Limitations & Assumptions', [
-        'Data biases, gaps in time range, synthetic anomalies if used.',
-        'Decisions (clipping, encoding) may affect model behaviour in CW2.'], notes='Be candid about limitations and how to mitigate.')
 
-    add_bullet_slide(prs, 'Next steps for CW2', [
-        'Define target (SLA breach prediction) and candidate features.',
-        'Model evaluation plan: metrics, baseline, retraining triggers.'], notes='Outline model approach and MLOps considerations.')
+def add_appendix(prs, pipeline_source):
+    full = '\n'.join(pipeline_source.splitlines()[:APPENDIX_LINES])  # first 120 lines to keep length reasonable
+    add_image_caption_slide(prs, 'Appendix: pipeline.py (start)', '', full, notes='Full pipeline available in repository (pipeline.py)')
 
-    add_bullet_slide(prs, 'Conclusion & Key Takeaways', [
-        'Dataset is feasible and relevant to incident management.',
-        'Cleaning steps improved quality and produced key features for ML.'], notes='Summarise and provide call-to-action for CW2.')
 
-    integrity = (
-        'I declare that this is all my own work. Any material I have referred to has been accurately referenced and any contribution of Artificial Intelligence technology has been fully acknowledged.'
-    )
-    add_bullet_slide(prs, 'Academic Integrity Declaration', [integrity], notes='Include full coursework declaration from brief.')
+# Build presentation
+def build_presentation(out_pptx=OUT_PPTX):
+    captions = parse_figures_md(FIG_MD)
+
+    prs = new_presentation()
 
-    add_bullet_slide(prs, 'Submission Checklist', [
-        'File: CW1_presentation_[YourName]_[YourID].pptx (ensure name & ID on first slide).',
-        'Embedded video and audio checked; length ≈7.5 minutes.',
-        'References and academic integrity slide present.'], notes='Final checks before upload.')
+    # Title slide
+    add_title_slide(prs, *TITLE)
 
-    add_bullet_slide(prs, 'Reproducibility & Commands', [
-        'Run: python pipeline.py -> data/incidents_clean.csv',
-        'Run: python make_more_visuals.py -> data/figures/*.png',
-        'Python packages: see requirements or virtualenv used.'], notes='Include exact versions in README if required.')
+    # Core slides
+    add_bullet_slides(prs, INTRO_SLIDES)
 
-    # Appendix: full pipeline snippet
+    # Numbers from summary.py's statistics document, if there is one
+    stats = load_stats()
+    if stats is not None:
+        add_bullet_slides(prs, stats_slides(stats))
+
+    # Add code snippet slides (short, annotated)
+    pipeline_path = os.path.join(BASE, 'pipeline.py')
+    source = ''
     if os.path.exists(pipeline_path):
         with open(pipeline_path, 'r', encoding='utf-8') as pf:
-            full = '\n'.join(pf.read().splitlines()[:120])  # first 120 lines to keep length reasonable
-        add_image_caption_slide(prs, 'Appendix: pipeline.py (start)', '', full, notes='Full pipeline available in repository (pipeline.py)')
+            source = pf.read()
+    add_snippet_slides(prs, snippet_slides(source))
+
+    # Visual results slides (reuse earlier approach)
+    add_visual_slides(prs, captions, {img: os.path.join(FIG_DIR, img) for img in VIS_ORDER})
+
+    # Limitations, Next steps, Conclusion, Integrity, Submission checklist
+    add_bullet_slides(prs, OUTRO_SLIDES)
+
+    # Appendix: full pipeline snippet
+    if source:
+        add_appendix(prs, source)
 
-    out_path = os.path.join(BASE, OUT_PPTX)
+    out_path = os.path.join(BASE, out_pptx)
     prs.save(out_path)
 
     # Build speaker script / slide notes text
@@ -299,7 +417,7 @@ def build_presentation():
     extra = TOTAL_SECONDS - per_slide * n
     t = 0
     with open(os.path.join(BASE, OUT_SCRIPT), 'w', encoding='utf-8') as sfile, open(os.path.join(BASE, OUT_NOTES_MD), 'w', encoding='utf-8') as nfile:
-        sfile.write(f"Timed speaker script for {OUT_PPTX}\nTotal time: {TOTAL_SECONDS} seconds (~7.5 minutes)\n\n")
+        sfile.write(f"Timed speaker script for {os.path.basename(out_pptx)}\nTotal time: {TOTAL_SECONDS} seconds (~7.5 minutes)\n\n")
         for idx, slide in enumerate(all_slides, start=1):
             duration = per_slide + (1 if idx <= extra else 0)
             start = timedelta(seconds=t)
@@ -329,4 +447,7 @@ def build_presentation():
 
 
 if __name__ == '__main__':
-    build_presentation()
+    import argparse
+    ap = argparse.ArgumentParser(description="Build the coursework deck, speaker script and notes.")
+    ap.add_argument("--out", default=OUT_PPTX, help="deck file name (default: timestamped, in case one is open)")
+    build_presentation(ap.parse_args().out)
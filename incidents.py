@@ -0,0 +1,21 @@
+"""
+The whole pipeline as plain functions on DataFrames - no files, no globals.
+
+    import incidents
+
+    raw = incidents.generate(10_000, seed=1)       # make_dataset.py
+    dirty = incidents.corrupt(raw, seed=1)         # dirty_up.py
+    clean = incidents.clean(dirty)                 # pipeline.py (steps 2-10)
+    stats = incidents.summarise(clean)             # summary.py, as a dict
+
+A long-running process imports this once and pushes frames through; the
+scripts are thin CLIs around the same functions (reading/writing files on
+either side), so both give the same rows for the same input.
+"""
+
+from dirty_up import CORRUPTION_RATES, corrupt
+from make_dataset import generate_frame as generate
+from pipeline import clean
+from summary import SummaryStats, summarise
+
+__all__ = ["CORRUPTION_RATES", "SummaryStats", "clean", "corrupt", "generate", "summarise"]
@@ -0,0 +1,394 @@
+"""
+Incremental runs of the cleaner against an export that only ever grows.
+
+Instead of re-cleaning the whole history every hour, we keep a small state next
+to the clean store (STORE/_state.json + STORE/_seen.npy):
+ - how far into the export we've already read (bytes for CSV, rows for
+   parquet/feather) plus a hash of its first bytes, so a rewritten export is noticed
+ - the high-watermark of first_opened_at (for information - dirty rows turn up
+   with old or garbled timestamps, so the read position is what we trust)
+ - the dedup mode (see dedup.py) and its fingerprints of every row kept so far:
+   raw / normalised row hashes for exact / near mode (STORE/_seen.npy), or the
+   number hash of every stored row plus its partition for key mode
+   (STORE/_keys.npz). In key mode a row re-exported in a later run replaces the
+   stored one: the old row is taken out of its raw/ partition (and the sketch)
+   and that partition's output is rewritten.
+ - the resolution_hours quantile sketch (or every value, with the "exact"
+   engine - see sketches.py) and the 99th percentile cap it gave
+ - per partition: row count and the largest uncapped resolution_hours
+ - a rollup cube of the final rows (STORE/_cube.json, see cube.py), updated
+   with just the rows appended / the partitions rewritten
+ - rolling-window metrics of the final rows (STORE/_metrics.json, see
+   metrics.py): appended rows are added, a rewritten partition's old rows are
+   taken out and its new ones added
+
+The store itself is partitioned by month of first_opened_at:
+ STORE/raw/month=YYYY-MM.csv   cleaned rows before the cap (steps 3-9)
+ STORE/month=YYYY-MM.csv       final rows (capped + labelled)
+
+A run only cleans the new rows and appends them to both. If the cap moves, only
+the partitions holding values above the lower of the old/new cap are re-capped
+from raw/. A --rebuild wipes the store and replays the export through exactly
+the same code, so it produces the same files.
+"""
+
+import hashlib
+import io
+import json
+import math
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from cube import RollupCube
+from dedup import KEY, NO_KEY, Dedup, LatestKeys, SeenHashes, key_hashes
+from metrics import RollingMetrics
+from pipeline import CAP_QUANTILE, SPILL_DATE_FORMAT, _quiet, clean_chunk, finish_chunk
+from sketches import make_quantiles, quantiles_from_dict
+from storage import fmt_of, iter_table
+
+STATE_FILE = "_state.json"
+SEEN_FILE = "_seen.npy"
+KEYS_FILE = "_keys.npz"
+CUBE_FILE = "_cube.json"
+METRICS_FILE = "_metrics.json"
+HEAD_BYTES = 64 * 1024
+
+
+class _Slice(io.RawIOBase):
+    """Read at most n bytes from an already positioned binary file."""
+
+    def __init__(self, f, n):
+        self.f = f
+        self.left = n
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = min(len(b), self.left)
+        if n <= 0:
+            return 0
+        data = self.f.read(n)
+        b[:len(data)] = data
+        self.left -= len(data)
+        return len(data)
+
+
+def _complete_end(f):
+    """Byte position just after the last newline (ignore a half-written last line)."""
+    f.seek(0, os.SEEK_END)
+    pos = f.tell()
+    while pos > 0:
+        step = min(HEAD_BYTES, pos)
+        f.seek(pos - step)
+        block = f.read(step)
+        nl = block.rfind(b"\n")
+        if nl >= 0:
+            return pos - step + nl + 1
+        pos -= step
+    return 0
+
+
+def _read_csv_from(path, offset, chunksize, end=None, columns=None):
+    """Yield text chunks of a CSV from byte `offset` (0 = just after the header)."""
+    with open(path, "rb") as f:
+        header = f.readline()
+        names = pd.read_csv(io.BytesIO(header), nrows=0).columns.tolist()
+        if end is None:
+            end = _complete_end(f)
+        start = max(offset, len(header))
+        if start >= end:
+            return
+        f.seek(start)
+        body = io.BufferedReader(_Slice(f, end - start))
+        yield from pd.read_csv(body, header=None, names=names, usecols=columns, dtype=str, chunksize=chunksize)
+
+
+def _head_hash(path, n):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read(n)).hexdigest()
+
+
+def _new_export_rows(src, state, chunksize, columns=None):
+    """Yield the rows of `src` we haven't read yet and move the read position on."""
+    if fmt_of(src) == "csv":
+        with open(src, "rb") as f:
+            end = _complete_end(f)
+        yield from _read_csv_from(src, state["offset"], chunksize, end, columns)
+        state["offset"] = end
+        return
+    skip = state["offset"]
+    for chunk in iter_table(src, chunksize, columns=columns):
+        if skip >= len(chunk):
+            skip -= len(chunk)
+            continue
+        chunk = chunk.iloc[skip:]
+        skip = 0
+        state["offset"] += len(chunk)
+        yield chunk
+
+
+class _KeyIndex:
+    """Sorted number hashes of the rows in the store + the partition (as YYYYMM) of each."""
+
+    def __init__(self, keys=None, months=None):
+        self.keys = np.empty(0, dtype=np.uint64) if keys is None else keys
+        self.months = np.empty(0, dtype=np.int32) if months is None else months
+
+    def lookup(self, h):
+        """Partition of each hash as YYYYMM, 0 where it isn't stored."""
+        if not len(self.keys):
+            return np.zeros(len(h), dtype=np.int32)
+        pos = np.searchsorted(self.keys, h)
+        pos[pos == len(self.keys)] = 0
+        return np.where(self.keys[pos] == h, self.months[pos], 0)
+
+    def update(self, h, months):
+        # new entries win over old ones for the same key
+        keys = np.concatenate([self.keys, h])
+        months = np.concatenate([self.months, months])
+        order = np.argsort(keys, kind="stable")
+        keys, months = keys[order], months[order]
+        last = np.append(keys[1:] != keys[:-1], True) if len(keys) else np.empty(0, dtype=bool)
+        self.keys, self.months = keys[last], months[last]
+
+
+def _fresh_state(src, rel_error, dedup, quantiles="sketch"):
+    return {
+        "src": os.path.abspath(src),
+        "dedup": dedup,
+        "quantiles": quantiles,
+        "offset": 0,
+        "head_len": 0,
+        "head_hash": None,
+        "watermark": None,
+        "sketch": make_quantiles(quantiles, rel_error).to_dict(),
+        "cap": None,
+        "partitions": {},
+    }
+
+
+def _load_state(store):
+    path = os.path.join(store, STATE_FILE)
+    if not os.path.exists(path):
+        return None, SeenHashes(), _KeyIndex()
+    with open(path, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    seen = SeenHashes()
+    seen_path = os.path.join(store, SEEN_FILE)
+    if os.path.exists(seen_path):
+        seen.values = np.load(seen_path)
+    index = _KeyIndex()
+    keys_path = os.path.join(store, KEYS_FILE)
+    if os.path.exists(keys_path):
+        with np.load(keys_path) as z:
+            index = _KeyIndex(z["keys"], z["months"])
+    return state, seen, index
+
+
+def _save_state(store, state, seen, index):
+    # write to temp files first so a crash mid-save doesn't leave a torn state
+    path = os.path.join(store, STATE_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    with open(os.path.join(store, SEEN_FILE + ".tmp"), "wb") as f:
+        np.save(f, seen.values)
+    with open(os.path.join(store, KEYS_FILE + ".tmp"), "wb") as f:
+        np.savez(f, keys=index.keys, months=index.months)
+    os.replace(os.path.join(store, SEEN_FILE + ".tmp"), os.path.join(store, SEEN_FILE))
+    os.replace(os.path.join(store, KEYS_FILE + ".tmp"), os.path.join(store, KEYS_FILE))
+    os.replace(path + ".tmp", path)
+
+
+def _retract(store, key, drop, before, chunksize):
+    """Rewrite raw/month=key.csv without its rows before byte `before` whose number hash is in `drop`.
+
+    Returns (resolution_hours of the removed rows, rows left, largest resolution_hours left).
+    """
+    raw_path = os.path.join(store, "raw", f"month={key}.csv")
+    tmp = raw_path + ".tmp"
+    removed, rows, top = [], 0, None
+    first = True
+    parts = [(_read_csv_from(raw_path, 0, chunksize, end=before), True),
+             (_read_csv_from(raw_path, before, chunksize), False)]
+    for chunks, old in parts:
+        for chunk in chunks:
+            if old:
+                gone = np.isin(key_hashes(chunk)[0], drop)
+                removed.append(pd.to_numeric(chunk.loc[gone, "resolution_hours"]))
+                chunk = chunk[~gone]
+            chunk.to_csv(tmp, index=False, mode="w" if first else "a", header=first)
+            first = False
+            rows += len(chunk)
+            m = pd.to_numeric(chunk["resolution_hours"]).max()
+            if pd.notna(m) and (top is None or m > top):
+                top = float(m)
+    os.replace(tmp, raw_path)
+    return (pd.concat(removed) if removed else pd.Series(dtype="float64")), rows, top
+
+
+def _write_output(store, key, cap, chunksize, cube, metrics, offset=0):
+    """(Re)write STORE/month=key.csv from raw/, or append the raw rows after `offset`."""
+    raw_path = os.path.join(store, "raw", f"month={key}.csv")
+    out_path = os.path.join(store, f"month={key}.csv")
+    first = offset == 0
+    if first:
+        cube.drop(key)
+        # the metrics are by opened and resolved day, so a month can't just be
+        # dropped: take the rows being replaced out one by one
+        if os.path.exists(out_path):
+            for chunk in pd.read_csv(out_path, chunksize=chunksize):
+                metrics.update(chunk, sign=-1)
+    for chunk in _read_csv_from(raw_path, offset, chunksize):
+        chunk = finish_chunk(chunk, cap)
+        chunk.to_csv(out_path, index=False, mode="w" if first else "a", header=first)
+        cube.update(chunk)
+        metrics.update(chunk)
+        first = False
+
+
+def _load_metrics(store, chunksize):
+    # stores from before the metrics existed get them built from their output once
+    path = os.path.join(store, METRICS_FILE)
+    if os.path.exists(path):
+        return RollingMetrics.load(path)
+    metrics = RollingMetrics()
+    for name in sorted(os.listdir(store)):
+        if name.startswith("month=") and name.endswith(".csv"):
+            for chunk in pd.read_csv(os.path.join(store, name), chunksize=chunksize):
+                metrics.update(chunk)
+    return metrics
+
+
+def run_incremental(src, store, chunksize=100_000, rel_error=0.001, rebuild=False, dedup="exact",
+                    quantiles="sketch"):
+    state, seen, index = (None, SeenHashes(), _KeyIndex()) if rebuild else _load_state(store)
+
+    if state is not None and state["head_hash"] is not None and (
+            _head_hash(src, state["head_len"]) != state["head_hash"]):
+        print(f"Export {src} was rewritten since the last run -> full rebuild")
+        state = None
+    if state is not None and state.get("dedup", "exact") != dedup:
+        print(f"Store was deduplicated with mode '{state.get('dedup', 'exact')}', not '{dedup}' -> full rebuild")
+        state = None
+    if state is not None and state.get("quantiles", "sketch") != quantiles:
+        print(f"Store's cap came from the '{state.get('quantiles', 'sketch')}' quantile engine, "
+              f"not '{quantiles}' -> full rebuild")
+        state = None
+    if state is None:
+        seen, index = SeenHashes(), _KeyIndex()
+        if os.path.isdir(store):
+            shutil.rmtree(store)
+        state = _fresh_state(src, rel_error, dedup, quantiles)
+        print(f"Starting a fresh clean store: {store}")
+    os.makedirs(os.path.join(store, "raw"), exist_ok=True)
+
+    sketch = quantiles_from_dict(state["sketch"])
+    cube_path = os.path.join(store, CUBE_FILE)
+    cube = RollupCube.load(cube_path) if os.path.exists(cube_path) else RollupCube()
+    metrics = _load_metrics(store, chunksize)
+    partitions = state["partitions"]
+    appended_from = {}  # partition -> size of its raw file before this run
+    replaced = {}       # key mode: partition -> number hashes of its rows that a new row replaces
+    rows_in = rows_kept = 0
+
+    print(f"Incremental run over {src} (already read: {state['offset']} {'bytes' if fmt_of(src) == 'csv' else 'rows'})")
+    latest = None
+    if dedup == "key":
+        # where each number's last row is among the new rows (a copy of the state, so
+        # the read position doesn't move yet)
+        latest = LatestKeys.scan(_new_export_rows(src, dict(state), chunksize, columns=[KEY]))
+    dd = Dedup(dedup, latest, seen)
+    for chunk in _new_export_rows(src, state, chunksize):
+        rows_in += len(chunk)
+
+        # 2) duplicates, against everything kept in earlier runs too
+        chunk, h = dd.raw(chunk)
+        if dedup == "key":
+            h = h[h != NO_KEY].to_numpy()
+            old = index.lookup(h)
+            for code in np.unique(old[old > 0]):
+                replaced.setdefault(f"{code // 100:04d}-{code % 100:02d}", []).append(h[old == code])
+
+        # 3) - 9) (+ near duplicates)
+        chunk, _ = dd.clean(clean_chunk(chunk, log=_quiet))
+        rows_kept += len(chunk)
+        if dedup == "key" and len(chunk):
+            h, has = key_hashes(chunk)
+            months = chunk["first_opened_at"].dt.year * 100 + chunk["first_opened_at"].dt.month
+            index.update(h[has], months.to_numpy(dtype=np.int32)[has])
+        sketch.add(chunk["resolution_hours"])
+        if len(chunk):
+            top = chunk["first_opened_at"].max().isoformat()
+            state["watermark"] = max(state["watermark"] or top, top)
+
+        month = chunk["first_opened_at"].dt.strftime("%Y-%m")
+        for key, part in chunk.groupby(month, sort=False):
+            raw_path = os.path.join(store, "raw", f"month={key}.csv")
+            exists = os.path.exists(raw_path)
+            appended_from.setdefault(key, os.path.getsize(raw_path) if exists else 0)
+            part.to_csv(raw_path, index=False, mode="a" if exists else "w", header=not exists,
+                        date_format=SPILL_DATE_FORMAT)
+            info = partitions.setdefault(key, {"rows": 0, "raw_max": None})
+            info["rows"] += len(part)
+            top = part["resolution_hours"].max()
+            if pd.notna(top) and (info["raw_max"] is None or top > info["raw_max"]):
+                info["raw_max"] = float(top)
+
+    print(f"- new rows read: {rows_in}, kept after dedup/cleaning: {rows_kept}")
+    print(f"Step: drop duplicates ({dedup}) -> removed {dd.removed} rows")
+
+    # key mode: take the replaced rows out of their partitions (only rows from
+    # earlier runs - everything appended this run is already the latest version)
+    retracted = 0
+    for key, hashes in sorted(replaced.items()):
+        before = appended_from.get(key, os.path.getsize(os.path.join(store, "raw", f"month={key}.csv")))
+        gone, rows, top = _retract(store, key, np.concatenate(hashes), before, chunksize)
+        sketch.remove(gone)
+        retracted += len(gone)
+        partitions[key] = {"rows": rows, "raw_max": top}
+    if dedup == "key":
+        print(f"Step: replaced {retracted} rows from earlier runs with their re-exported versions"
+              + (f" ({', '.join(sorted(replaced))})" if replaced else ""))
+
+    # 8b) the cap over all rows ever kept; only partitions with values between the
+    # old and the new cap need re-capping. Until some row has a resolution_hours
+    # there's no cap (NaN, as in the streaming run) and the rows go out uncapped
+    old_cap = state["cap"]
+    cap = sketch.quantile(CAP_QUANTILE)
+    old_limit = math.inf if old_cap is None else old_cap
+    limit = math.inf if math.isnan(cap) else cap
+    recapped = []
+    for key, info in sorted(partitions.items()):
+        moved = limit != old_limit and info["raw_max"] is not None and info["raw_max"] > min(old_limit, limit)
+        # (stores from before uncapped writes can have partitions never written out)
+        missing = not os.path.exists(os.path.join(store, f"month={key}.csv"))
+        if moved or missing or key in replaced:
+            _write_output(store, key, cap, chunksize, cube, metrics)
+            if moved:
+                recapped.append(key)
+        elif key in appended_from:
+            _write_output(store, key, cap, chunksize, cube, metrics, offset=appended_from[key])
+    if math.isnan(cap):
+        print("Step: no resolution_hours kept yet -> rows written uncapped")
+    else:
+        print(f"Step: capped resolution_hours at 99th percentile -> cap value: {cap:.2f} hours"
+              + (f" (was {old_cap:.2f})" if old_cap is not None and old_cap != cap else ""))
+    print(f"- partitions appended: {len(appended_from)}, re-capped: {len(recapped)}"
+          + (f" ({', '.join(recapped)})" if recapped else ""))
+
+    # parquet/feather exports get rewritten as a whole when they grow, so the
+    # "was it rewritten?" check only makes sense for CSV
+    if fmt_of(src) == "csv" and (state["head_hash"] is None or state["head_len"] < HEAD_BYTES):
+        state["head_len"] = min(HEAD_BYTES, os.path.getsize(src))
+        state["head_hash"] = _head_hash(src, state["head_len"])
+    state["sketch"] = sketch.to_dict()
+    state["cap"] = None if math.isnan(cap) else cap
+    cube.save(cube_path)
+    metrics.save(os.path.join(store, METRICS_FILE))
+    _save_state(store, state, dd.seen, index)
+    print(f"✅ clean store updated → {store} ({sum(p['rows'] for p in partitions.values())} rows)")
+    return cube
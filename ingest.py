@@ -0,0 +1,492 @@
+"""
+Long-running ingest service: clean incidents as they arrive instead of per export.
+
+    python ingest.py --store data/live --port 8080 --tail data/incidents_dirty.csv
+
+Records come in over HTTP and/or by tailing a growing CSV:
+ - POST /incidents   a JSON object, a JSON list of them, or one object per line,
+                     with the dirty export's columns -> 202 {"accepted": n}
+ - GET  /summary     the running summary.py statistics plus service counters
+ - GET  /health      200 {"status": "ok"} while the worker runs and the last batch
+                     went through, "degraded" after a failed batch, 503 "down"
+                     once the worker has stopped (POSTs then get 503 too)
+ - GET  /metrics     a rolling-window trend (metrics.py): ?measure=breach_rate&window=7
+                     &priority=...&group=...&days=30 -> {"series": {day: value}, "latest": {...}}
+ - --tail FILE       new complete lines of a CSV (with header) as it grows
+
+Everything goes through one bounded queue. A single worker takes micro-batches
+off it - up to --batch-size rows, or whatever has arrived once the oldest row
+has waited --max-latency seconds - and runs the same steps as pipeline.py:
+dedup (against everything kept so far), steps 3-9, the cap and the labels. When
+the worker falls behind the queue fills up and producers wait: HTTP clients get
+their response later and the tail stops reading, rather than memory growing.
+A batch that fails to clean is rolled back (dedup fingerprints, cap sketch),
+written as it arrived to STORE/_quarantine/batch-NNNNN.csv and logged; the
+worker carries on with the next one.
+
+The cap is the 99th percentile of every row kept so far (a running sketch, as in
+incremental.py), so early rows are capped with an early estimate. Clean rows are
+appended to STORE/month=YYYY-MM.csv; the dedup fingerprints, the sketches, the
+summary, the rolling metrics and the size of every month file are checkpointed
+to STORE/_service.json + STORE/_seen.npy + STORE/_metrics.json and picked up
+again on restart. Key dedup needs to see the whole export first, so the service
+only does exact and near.
+
+On restart the month files are cut back to their checkpointed sizes (and files
+started since are removed), so the store always matches the saved state:
+ - tailed rows land exactly once: whatever was appended after the checkpoint is
+   read from the tailed file again
+ - HTTP rows answered 202 after the last checkpoint are gone after a crash (a
+   clean shutdown saves everything); clients that need them should resend, which
+   is safe - rows already kept are dropped as duplicates.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import threading
+import time
+import traceback
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from dedup import Dedup, SeenHashes
+from incremental import METRICS_FILE, _complete_end, _read_csv_from
+from metrics import MEASURES, RATES, RollingMetrics
+from pipeline import CAP_QUANTILE, SPILL_DATE_FORMAT, _quiet, clean_chunk, finish_chunk, keep
+from sketches import QuantileSketch
+from summary import SummaryStats
+
+STATE_FILE = "_service.json"
+SEEN_FILE = "_seen.npy"
+DEDUP_MODES = ["exact", "near"]
+QUARANTINE_DIR = "_quarantine"
+
+
+def _as_text(df):
+    # same shape as the streaming run reads: the export's columns, all text
+    # (NaN stays NaN), so the dedup fingerprints match whatever the source
+    df = df.reindex(columns=keep)
+    return df.astype(object).where(df.notna(), np.nan).apply(lambda s: s.where(s.isna(), s.astype(str)))
+
+
+def _records(body):
+    """HTTP body -> DataFrame: a JSON object, a JSON list of objects, or JSON lines."""
+    text = body.decode("utf-8").strip()
+    if not text:
+        return pd.DataFrame(columns=keep)
+    if text.startswith("["):
+        records = json.loads(text)
+    else:
+        records = [json.loads(line) for line in text.splitlines() if line.strip()]
+    if not all(isinstance(r, dict) for r in records):
+        raise ValueError("expected JSON objects with the export's columns")
+    return pd.DataFrame.from_records(records)
+
+
+class IngestService:
+    def __init__(self, store, batch_size=5000, max_latency=1.0, max_pending=50_000, rel_error=0.001,
+                 dedup="exact"):
+        if dedup not in DEDUP_MODES:
+            raise ValueError(f"the service can't do '{dedup}' dedup (one of {', '.join(DEDUP_MODES)})")
+        self.store = store
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        # queue items are pieces of at most batch_size rows
+        self.queue = asyncio.Queue(maxsize=max(1, max_pending // batch_size))
+        self.sketch = QuantileSketch(rel_error)  # uncapped resolution_hours, for the cap
+        self.stats = SummaryStats(rel_error)
+        self.dedup = Dedup(dedup)
+        self.metrics = RollingMetrics(rel_error)
+        # the worker thread changes the dedup fingerprints, sketches, stats,
+        # metrics, counters and committed tail offsets in place: it holds this
+        # lock for a whole batch, and save() / the /metrics queries take it too
+        self.state_lock = threading.Lock()
+        self.tail_offsets = {}  # tail file -> byte offset up to which the rows are processed (saved)
+        self._read_offsets = {}  # ... up to which they're read and queued (this run only)
+        self.counters = {"received": 0, "kept": 0, "batches": 0, "last_batch_rows": 0,
+                         "last_batch_seconds": 0.0, "max_wait_seconds": 0.0,
+                         "failed_batches": 0, "quarantined_rows": 0, "last_error": None}
+        self.worker = None  # the run_worker() task, once serve() starts it
+        self.last_batch_failed = False
+        self.snapshot = {}
+        self._load()
+        self._publish()
+
+    # --- state ----------------------------------------------------------------
+
+    def _month_files(self):
+        if not os.path.isdir(self.store):
+            return []
+        return sorted(f for f in os.listdir(self.store) if f.startswith("month=") and f.endswith(".csv"))
+
+    def _rollback_outputs(self, sizes):
+        # rows appended after the checkpoint aren't in the saved dedup state, so
+        # keeping them would duplicate them when they come in again
+        for name in self._month_files():
+            out = os.path.join(self.store, name)
+            if name not in sizes:
+                os.remove(out)
+                print(f"- removed {out}: started after the last checkpoint")
+            elif os.path.getsize(out) > sizes[name]:
+                with open(out, "r+b") as f:
+                    f.truncate(sizes[name])
+                print(f"- cut {out} back to its checkpointed size")
+
+    def _load(self):
+        path = os.path.join(self.store, STATE_FILE)
+        if not os.path.exists(path):
+            self._rollback_outputs({})
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state["dedup"] != self.dedup.mode:
+            raise ValueError(f"{self.store} was deduplicated with mode '{state['dedup']}', "
+                             f"not '{self.dedup.mode}' (use another --store)")
+        self.sketch = QuantileSketch.from_dict(state["sketch"])
+        self.stats = SummaryStats.from_dict(state["summary"])
+        self.tail_offsets = state["tail_offsets"]
+        self.counters.update(state["counters"])
+        if "outputs" in state:  # (not in checkpoints from before it was saved)
+            self._rollback_outputs(state["outputs"])
+        seen = SeenHashes()
+        seen.values = np.load(os.path.join(self.store, SEEN_FILE))
+        self.dedup.seen = seen
+        metrics_path = os.path.join(self.store, METRICS_FILE)
+        if os.path.exists(metrics_path):
+            self.metrics = RollingMetrics.load(metrics_path)
+        print(f"Resumed from {path}: {self.stats.rows} clean rows so far")
+
+    def save(self):
+        # temp files first so a crash mid-save doesn't leave a torn state; the
+        # lock keeps a batch from landing halfway through (blocks, so serve()
+        # calls this from a thread)
+        os.makedirs(self.store, exist_ok=True)
+        path = os.path.join(self.store, STATE_FILE)
+        seen_path = os.path.join(self.store, SEEN_FILE)
+        with self.state_lock:
+            state = {"dedup": self.dedup.mode, "sketch": self.sketch.to_dict(), "summary": self.stats.to_dict(),
+                     "tail_offsets": dict(self.tail_offsets), "counters": dict(self.counters),
+                     "outputs": {name: os.path.getsize(os.path.join(self.store, name))
+                                 for name in self._month_files()}}
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            with open(seen_path + ".tmp", "wb") as f:
+                np.save(f, self.dedup.seen.values)
+            self.metrics.save(os.path.join(self.store, METRICS_FILE))
+            os.replace(seen_path + ".tmp", seen_path)
+            os.replace(path + ".tmp", path)
+
+    def _publish(self):
+        # /summary reads this dict while the worker thread updates the stats, so
+        # it's rebuilt after each batch and swapped in whole
+        self.snapshot = dict(self.stats.results(), service=dict(self.counters, dedup=self.dedup.mode,
+                                                                cap=self._cap()))
+
+    def _cap(self):
+        return self.sketch.quantile(CAP_QUANTILE) if self.sketch.count else None
+
+    def health(self):
+        """GET /health: (HTTP status, body) - is the worker alive, and did the last batch go through?"""
+        alive = self.worker is not None and not self.worker.done()
+        status = "down" if not alive else "degraded" if self.last_batch_failed else "ok"
+        c = self.counters
+        return (200 if alive else 503), {
+            "status": status, "worker_alive": alive, "queued_pieces": self.queue.qsize(),
+            "batches": c["batches"], "failed_batches": c["failed_batches"],
+            "quarantined_rows": c["quarantined_rows"], "last_error": c["last_error"],
+        }
+
+    def metrics_query(self, query):
+        """GET /metrics: one measure's trend over the last `days` days, plus the latest window."""
+        q = {k: v[-1] for k, v in parse_qs(query).items()}
+        measure = q.get("measure", "opened")
+        if measure not in MEASURES and measure not in RATES:
+            raise ValueError(f"unknown measure '{measure}' (one of {', '.join(MEASURES + list(RATES))})")
+        window = int(q["window"]) if q.get("window") else None
+        if window is not None and window not in self.metrics.windows:
+            raise ValueError(f"window must be one of {', '.join(map(str, self.metrics.windows))}")
+        days = int(q.get("days", 30))
+        with self.state_lock:
+            s = self.metrics.series(measure, window, q.get("priority"), q.get("group"))
+            latest = self.metrics.latest(window or 7, q.get("priority"), q.get("group"))
+        s = s.tail(days)
+        return {"measure": measure, "window": window,
+                "series": {str(d.date()): None if pd.isna(v) else float(v) for d, v in s.items()},
+                "latest": latest}
+
+    # --- producers --------------------------------------------------------------
+
+    async def submit(self, df, offsets=None):
+        """Queue dirty rows; waits while the queue is full (that's the backpressure).
+
+        `offsets` ({tail file: byte offset}) go with the last piece and are
+        committed once the worker has applied it.
+        """
+        now = time.monotonic()
+        starts = list(range(0, len(df), self.batch_size)) or [0]
+        for start in starts:
+            last = start == starts[-1]
+            await self.queue.put((now, df.iloc[start:start + self.batch_size], offsets if last else None))
+        self.counters["received"] += len(df)
+
+    async def handle_http(self, reader, writer):
+        status, payload = 200, None
+        try:
+            method, path, _ = (await reader.readline()).decode("latin-1").split(" ", 2)
+            headers = {}
+            while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+            if method == "POST" and path == "/incidents" and self.health()[0] != 200:
+                # nobody would ever take the rows off the queue
+                status, payload = 503, {"error": "the ingest worker has stopped, see /health"}
+            elif method == "POST" and path == "/incidents":
+                df = _records(body)
+                await self.submit(df)
+                status, payload = 202, {"accepted": len(df)}
+            elif method == "GET" and path == "/summary":
+                payload = self.snapshot
+            elif method == "GET" and path == "/health":
+                status, payload = self.health()
+            elif method == "GET" and urlsplit(path).path == "/metrics":
+                # takes the state lock, so off the event loop
+                payload = await asyncio.to_thread(self.metrics_query, urlsplit(path).query)
+            else:
+                status, payload = 404, {"error": f"no route for {method} {path}"}
+        except (ValueError, asyncio.IncompleteReadError) as e:  # JSONDecodeError is a ValueError
+            status, payload = 400, {"error": str(e)}
+        data = json.dumps(payload).encode("utf-8")
+        reason = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found",
+                  503: "Service Unavailable"}[status]
+        writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode("latin-1") + data)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def tail(self, path, poll=0.5):
+        """Follow a growing CSV export, queueing each complete new line once.
+
+        The saved offset only moves past rows once the worker has applied them,
+        so a checkpoint with rows still queued reads those again on restart.
+        """
+        key = os.path.abspath(path)
+        while True:
+            if os.path.exists(path):
+                offset = self._read_offsets.get(key, self.tail_offsets.get(key, 0))
+                if os.path.getsize(path) < offset:
+                    print(f"{path} shrank -> reading it again from the start")
+                    offset = 0
+                with open(path, "rb") as f:
+                    end = _complete_end(f)
+                if end > offset:
+                    chunks = _read_csv_from(path, offset, self.batch_size, end)
+                    # hold one chunk back, so the offset rides on the last one (or
+                    # on an empty piece, if there were only blank lines)
+                    chunk = await asyncio.to_thread(next, chunks, None)
+                    if chunk is None:
+                        await self.submit(pd.DataFrame(columns=keep), {key: end})
+                    while chunk is not None:
+                        following = await asyncio.to_thread(next, chunks, None)
+                        await self.submit(chunk, None if following is not None else {key: end})
+                        chunk = following
+                self._read_offsets[key] = max(end, offset)
+            await asyncio.sleep(poll)
+
+    # --- the worker ---------------------------------------------------------------
+
+    def process(self, df):
+        """Clean one micro-batch, append it to the store and fold it into the stats (apply() holds the lock).
+
+        If cleaning raises, the dedup fingerprints and the cap sketch are put
+        back as they were, so the rows can be sent again once fixed.
+        """
+        t0 = time.perf_counter()
+        rows = len(df)
+        seen, removed, hours = self.dedup.seen.copy(), self.dedup.removed, None
+        try:
+            # 2) + 3) - 9)
+            df, _ = self.dedup.raw(_as_text(df))
+            df, _ = self.dedup.clean(clean_chunk(df, log=_quiet))
+            if len(df):
+                # 8b) + 10) with the running cap
+                hours = df["resolution_hours"]
+                self.sketch.add(hours)
+                # NaN (no cap, as in the streaming run) until a kept row has a duration
+                df = finish_chunk(df, self.sketch.quantile(CAP_QUANTILE))
+        except Exception:
+            self.dedup.seen, self.dedup.removed = seen, removed
+            if hours is not None:
+                self.sketch.remove(hours)
+            raise
+        if len(df):
+            month = df["first_opened_at"].dt.strftime("%Y-%m")
+            for key, part in df.groupby(month, sort=False):
+                out = os.path.join(self.store, f"month={key}.csv")
+                exists = os.path.exists(out)
+                part.to_csv(out, index=False, mode="a" if exists else "w", header=not exists,
+                            date_format=SPILL_DATE_FORMAT)
+            self.stats.update(df)
+            self.metrics.update(df)
+        c = self.counters
+        c["kept"] += len(df)
+        c["batches"] += 1
+        c["last_batch_rows"] = rows
+        c["last_batch_seconds"] = time.perf_counter() - t0
+        self._publish()
+        return len(df)
+
+    async def run_worker(self):
+        """Take micro-batches off the queue until it hands over None."""
+        loop = asyncio.get_running_loop()
+        done = False
+        while not done:
+            item = await self.queue.get()
+            if item is None:
+                break
+            first, part, offsets = item
+            parts, rows, batch_offsets = [part], len(part), dict(offsets or {})
+            # fill the batch until it's full or the oldest row has waited max_latency
+            while rows < self.batch_size:
+                wait = first + self.max_latency - time.monotonic()
+                try:
+                    item = self.queue.get_nowait() if wait <= 0 else await asyncio.wait_for(self.queue.get(), wait)
+                except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                    break
+                if item is None:
+                    done = True
+                    break
+                parts.append(item[1])
+                rows += len(item[1])
+                batch_offsets.update(item[2] or {})
+            batch = pd.concat(parts, ignore_index=True)
+            failed = await loop.run_in_executor(None, self.apply, batch, batch_offsets)
+            if failed is not None:
+                error, path = failed
+                print(f"❌ batch of {len(batch)} rows failed ({type(error).__name__}: {error}) -> quarantined → {path}")
+                continue
+            waited = time.monotonic() - first
+            self.counters["max_wait_seconds"] = max(self.counters["max_wait_seconds"], waited)
+            c = self.counters
+            print(f"- batch {c['batches']}: {len(batch)} rows in, {c['kept']} kept so far, "
+                  f"oldest row waited {waited:.2f}s")
+
+    def apply(self, batch, offsets):
+        """process() one batch under the state lock, then commit the tail offsets it covers.
+
+        A batch that fails is quarantined instead (one bad batch mustn't stop
+        the service); returns (exception, quarantine file) for it, else None.
+        """
+        failed = None
+        with self.state_lock:
+            if len(batch):
+                try:
+                    self.process(batch)
+                    self.last_batch_failed = False
+                except Exception as e:
+                    traceback.print_exc()
+                    failed = e, self.quarantine(batch, e)
+            # the rows up to here are in the store (or the quarantine) now
+            self.tail_offsets.update(offsets)
+        return failed
+
+    def quarantine(self, batch, error):
+        """Keep a batch that failed to clean, as it arrived, and count it."""
+        c = self.counters
+        c["failed_batches"] += 1
+        c["quarantined_rows"] += len(batch)
+        c["last_error"] = f"{type(error).__name__}: {error}"
+        directory = os.path.join(self.store, QUARANTINE_DIR)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"batch-{c['failed_batches']:05d}.csv")
+        batch.to_csv(path, index=False)
+        self.last_batch_failed = True
+        self._publish()
+        return path
+
+
+def _worker_stopped(task):
+    # the worker only returns after the queue hands over None; anything else is a crash
+    if not task.cancelled() and task.exception() is not None:
+        print("❌ the ingest worker stopped:")
+        traceback.print_exception(task.exception())
+
+
+async def serve(service, host, port, tail=None, checkpoint=30.0):
+    os.makedirs(service.store, exist_ok=True)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, AttributeError):  # Windows: Ctrl+C still raises KeyboardInterrupt
+            pass
+
+    worker = service.worker = asyncio.create_task(service.run_worker())
+    worker.add_done_callback(_worker_stopped)
+    producers = []
+    server = None
+    if port:
+        server = await asyncio.start_server(service.handle_http, host, port)
+        print(f"Listening on http://{host}:{port} (POST /incidents, GET /summary, GET /health, GET /metrics)")
+    if tail:
+        producers.append(asyncio.create_task(service.tail(tail)))
+        print(f"Tailing {tail}")
+    print(f"Micro-batches of up to {service.batch_size} rows, max latency {service.max_latency}s, "
+          f"store {service.store}")
+
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), checkpoint)
+        except asyncio.TimeoutError:
+            await asyncio.to_thread(service.save)
+
+    # stop taking rows, let the worker finish what's queued, then save
+    print("Shutting down: draining the queue")
+    if server is not None:
+        server.close()
+        await server.wait_closed()
+    for task in producers:
+        task.cancel()
+    if not worker.done():
+        await service.queue.put(None)
+        await worker
+    service.save()
+    print(f"✅ clean store → {service.store} ({service.stats.rows} rows)")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Clean incidents as they arrive (HTTP and/or a tailed CSV).")
+    ap.add_argument("--store", default="data/live", help="directory for the month=YYYY-MM.csv partitions + state")
+    ap.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    ap.add_argument("--port", type=int, default=8080, help="HTTP port (0 = no HTTP endpoint)")
+    ap.add_argument("--tail", metavar="CSV", help="also follow this growing CSV export")
+    ap.add_argument("--batch-size", type=int, default=5000, help="most rows cleaned per micro-batch")
+    ap.add_argument("--max-latency", type=float, default=1.0,
+                    help="seconds a row may wait before its (partial) batch is cleaned anyway")
+    ap.add_argument("--max-pending", type=int, default=50_000,
+                    help="rows queued before producers have to wait (backpressure)")
+    ap.add_argument("--sketch-error", type=float, default=0.001, help="relative error of the cap / percentiles")
+    ap.add_argument("--dedup", choices=DEDUP_MODES, default="exact", help="step 2 mode (see dedup.py)")
+    ap.add_argument("--checkpoint", type=float, default=30.0, help="seconds between state saves")
+    args = ap.parse_args()
+    if not args.port and not args.tail:
+        ap.error("nothing to ingest: give an HTTP --port and/or --tail")
+
+    service = IngestService(args.store, args.batch_size, args.max_latency, args.max_pending, args.sketch_error,
+                            args.dedup)
+    try:
+        asyncio.run(serve(service, args.host, args.port, args.tail, args.checkpoint))
+    except KeyboardInterrupt:
+        service.save()
+
+
+if __name__ == "__main__":
+    main()
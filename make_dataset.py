@@ -1,32 +1,46 @@
-import pandas as pd
-import numpy as np
-from datetime import datetime, timedelta
-import random
+import argparse
 import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from storage import TableWriter, fmt_of, iter_table
+
+OUT = "data/incidents_aggregated_5k.csv"
+
+PRIORITIES = np.array(["1 - Critical", "2 - High", "3 - Moderate", "4 - Low"], dtype=object)
+GROUPS = np.array(["Network", "Database", "Application", "Security"], dtype=object)
+STATES = np.array(["Resolved", "Closed"], dtype=object)
 
-# make sure your 'data' folder exists
-os.makedirs("data", exist_ok=True)
-
-# we will make 2000 fake incidents
-n = 2000
-random.seed(42)
-now = datetime.now()
-
-data = []
-for i in range(n):
-    number = f"INC{100000 + i}"
-    priority = random.choice(["1 - Critical", "2 - High", "3 - Moderate", "4 - Low"])
-    opened = now - timedelta(days=random.randint(0, 60), hours=random.randint(0, 23))
-    duration = timedelta(hours=random.randint(1, 72))  # how long it took to resolve
-    resolved = opened + duration
-    closed = resolved + timedelta(hours=random.randint(1, 5))
-    assignment = random.choice(["Network", "Database", "Application", "Security"])
-    state = random.choice(["Resolved", "Closed"])
-    events = random.randint(1, 10)
-    resolution_hours = round(duration.total_seconds() / 3600, 2)
-
-    data.append({
-        "number": number,
+# rows are generated in fixed-size blocks, each with its own random stream seeded
+# from (seed, block number). A block's rows don't depend on how many shards or
+# processes there are, so the same seed always gives the same file.
+BLOCK = 100_000
+
+HOUR = np.timedelta64(3600 * 10**6, "us")
+DAY = 24 * HOUR
+
+
+def generate_block(block, n, seed, now):
+    """Rows block*BLOCK .. block*BLOCK+n-1, all columns drawn at once."""
+    rng = np.random.default_rng([seed, block])
+    start = block * BLOCK
+    now = np.datetime64(now, "us")
+
+    priority = PRIORITIES[rng.integers(0, 4, n)]
+    opened = now - rng.integers(0, 61, n) * DAY - rng.integers(0, 24, n) * HOUR
+    duration = rng.integers(1, 73, n)  # how long it took to resolve (hours)
+    resolved = opened + duration * HOUR
+    closed = resolved + rng.integers(1, 6, n) * HOUR
+    assignment = GROUPS[rng.integers(0, 4, n)]
+    state = STATES[rng.integers(0, 2, n)]
+    events = rng.integers(1, 11, n)
+
+    return pd.DataFrame({
+        "number": "INC" + pd.Series(np.arange(start, start + n) + 100000).astype(str),
         "first_opened_at": opened,
         "last_resolved_at": resolved,
         "last_closed_at": closed,
@@ -34,12 +48,86 @@ for i in range(n):
         "final_priority": priority,
         "assignment_group_mode": assignment,
         "events_count": events,
-        "resolution_hours": resolution_hours
+        "resolution_hours": np.round(duration.astype("float64"), 2),
     })
 
-df = pd.DataFrame(data)
-df.to_csv("data/incidents_aggregated_5k.csv", index=False)
-out_path = "data/incidents_aggregated_5k.csv"
-print(f"✅ Fake incident dataset created: {out_path}")
-print(f"- rows generated: {len(df)}")
-print("- sample rows:\n", df.head(3).to_string(index=False))
+
+def _blocks(n):
+    return [(b, min(BLOCK, n - b * BLOCK)) for b in range(-(-n // BLOCK))]
+
+
+def generate_frame(n, seed=42, now=None):
+    """The rows generate() would write for (n, seed, now), as one DataFrame.
+
+    `now` defaults to the current time.
+    """
+    now = datetime.now() if now is None else pd.Timestamp(now)
+    return pd.concat([generate_block(block, k, seed, now) for block, k in _blocks(n)] or
+                     [generate_block(0, 0, seed, now)], ignore_index=True)
+
+
+def write_blocks(blocks, seed, now, out):
+    """Generate the given (block, rows) pairs in order and append them to `out`."""
+    with TableWriter(out) as writer:
+        for block, n in blocks:
+            writer.write(generate_block(block, n, seed, now))
+    return out
+
+
+def generate(n, seed, now, out, shards=1):
+    blocks = _blocks(n)
+    shards = max(1, min(shards, len(blocks)))
+    if shards == 1:
+        return write_blocks(blocks, seed, now, out)
+
+    # each shard writes a contiguous run of blocks to its own part file, then the
+    # parts are appended in order
+    per = -(-len(blocks) // shards)
+    groups = [blocks[i:i + per] for i in range(0, len(blocks), per)]
+    tmp = out + ".parts"
+    os.makedirs(tmp, exist_ok=True)
+    ext = os.path.splitext(out)[1]
+    parts = [os.path.join(tmp, f"{i:05d}{ext}") for i in range(len(groups))]
+    with ProcessPoolExecutor(max_workers=len(groups)) as pool:
+        list(pool.map(write_blocks, groups, [seed] * len(groups), [now] * len(groups), parts))
+
+    if fmt_of(out) == "csv":
+        with open(out, "wb") as dst:
+            for i, part in enumerate(parts):
+                with open(part, "rb") as src:
+                    if i:
+                        src.readline()  # header only once
+                    shutil.copyfileobj(src, dst)
+    else:
+        with TableWriter(out) as writer:
+            for part in parts:
+                for chunk in iter_table(part, BLOCK):
+                    writer.write(chunk)
+    shutil.rmtree(tmp)
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Generate a fake incidents dataset.")
+    ap.add_argument("--rows", type=int, default=2000, help="number of incidents to generate")
+    ap.add_argument("--seed", type=int, default=42, help="random seed (same seed -> same rows)")
+    ap.add_argument("--now", default=None,
+                    help="timestamp the incidents are generated back from (default: current time); "
+                         "fix it as well to reproduce a file exactly")
+    ap.add_argument("--shards", type=int, default=1, help="generate in this many processes")
+    ap.add_argument("--out", default=OUT, help="output file (.csv, .parquet or .feather)")
+    args = ap.parse_args()
+
+    # make sure the output folder exists
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    now = pd.Timestamp(args.now) if args.now else datetime.now()
+
+    generate(args.rows, args.seed, now, args.out, args.shards)
+    print(f"✅ Fake incident dataset created: {args.out}")
+    print(f"- rows generated: {args.rows}")
+    head = next(iter_table(args.out, 3))
+    print("- sample rows:\n", head.head(3).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
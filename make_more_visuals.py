@@ -0,0 +1,340 @@
+"""
+Render every figure listed in data/figures/FIGURES.md from the cleaned data.
+
+Each figure's data is aggregated once up front (daily counts, monthly SLA rate,
+box stats per priority, ...) into small JSON-able dicts. A figure is only
+re-rendered when the hash of its aggregate (plus the plotting code) changed
+since the last run or its PNG is missing; the ones that do need drawing are
+rendered in parallel worker processes with the headless Agg backend.
+
+    python make_more_visuals.py            # -> data/figures/*.png
+    python make_more_visuals.py --force    # ignore the cache
+    python make_more_visuals.py --cube data/incidents_cube.json   # no row scan at all
+
+With --cube every aggregate is read off the rollup cube pipeline.py wrote (see
+cube.py); box plots and the histogram then come from the cube's sketches.
+"""
+
+import argparse
+import hashlib
+import inspect
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from cube import MISSING, RollupCube
+from storage import iter_table, read_table
+
+BASE = os.path.dirname(os.path.abspath(__file__))
+CLEAN = os.path.join(BASE, "data", "incidents_clean.csv")
+DIRTY = os.path.join(BASE, "data", "incidents_dirty.csv")
+FIG_DIR = os.path.join(BASE, "data", "figures")
+CACHE_FILE = ".render_cache.json"
+
+PIPELINE_STEPS = ["Ingestion\n(dirty CSV)", "Validation\n(dedup, dates)", "Cleaning\n(priorities, durations)",
+                  "Labelling\n(SLA flags)", "Output\n(clean CSV)"]
+
+
+# --- aggregation (parent process, one pass over the frame) ------------------
+
+def _box(values):
+    v = np.sort(values[~np.isnan(values)])
+    if len(v) == 0:
+        return None
+    q1, med, q3 = np.percentile(v, [25, 50, 75])
+    iqr = q3 - q1
+    lo = v[v >= q1 - 1.5 * iqr]
+    hi = v[v <= q3 + 1.5 * iqr]
+    return {"q1": q1, "med": med, "q3": q3, "whislo": lo.min(), "whishi": hi.max()}
+
+
+def aggregate(df, dirty_rows):
+    """Small per-figure inputs, keyed by PNG name."""
+    opened = pd.to_datetime(df["first_opened_at"])
+    res = pd.to_numeric(df["resolution_hours"], errors="coerce")
+    agg = {}
+
+    daily = opened.dt.normalize().value_counts().sort_index()
+    if len(daily):
+        daily = daily.reindex(pd.date_range(daily.index.min(), daily.index.max(), freq="D"), fill_value=0)
+    agg["incidents_over_time.png"] = {
+        "dates": [d.strftime("%Y-%m-%d") for d in daily.index],
+        "counts": daily.tolist(),
+        "rolling7": daily.rolling(7, min_periods=1).mean().round(6).tolist(),
+    }
+
+    agg["incidents_dirty_vs_clean.png"] = {"dirty": dirty_rows, "clean": len(df)}
+
+    pri = df["final_priority"].astype(object).fillna("Unknown").value_counts().sort_index()
+    agg["incidents_per_priority.png"] = {"labels": pri.index.tolist(), "counts": pri.tolist()}
+
+    miss = (df.isna().mean() * 100).sort_values(ascending=False)
+    agg["missingness_heatmap.png"] = {"columns": miss.index.tolist(), "pct": miss.round(6).tolist()}
+
+    groups = df["assignment_group_mode"].astype(object).fillna("(missing)").value_counts().head(10)
+    agg["top_assignment_groups.png"] = {"labels": groups.index.tolist(), "counts": groups.tolist()}
+
+    monthly = pd.to_numeric(df["sla_breached"], errors="coerce").groupby(opened.dt.to_period("M")).mean()
+    agg["sla_rate_by_month.png"] = {"months": [str(m) for m in monthly.index],
+                                    "rate": monthly.round(6).tolist()}
+
+    boxes = []
+    for label, part in res.groupby(df["final_priority"].astype(object).fillna("Unknown")):
+        b = _box(part.to_numpy(dtype="float64"))
+        if b is not None:
+            boxes.append(dict(label=label, **{k: round(float(v), 6) for k, v in b.items()}))
+    agg["resolution_by_priority.png"] = {"boxes": sorted(boxes, key=lambda b: b["label"])}
+
+    r = res.dropna()
+    cap = float(r.quantile(0.99)) if len(r) else 0.0
+    counts, edges = np.histogram(r.clip(upper=cap), bins=50) if len(r) else (np.zeros(0), np.zeros(1))
+    agg["resolution_time_hist.png"] = {"counts": counts.tolist(), "edges": np.round(edges, 6).tolist(),
+                                       "cap": round(cap, 6)}
+
+    agg["sla_breach_distribution.png"] = {
+        "Met (≤24h)": int((res <= 24).sum()),
+        "Breached (>24h)": int((res > 24).sum()),
+        "Missing": int(res.isna().sum()),
+    }
+
+    agg["pipeline_diagram.png"] = {"steps": PIPELINE_STEPS}
+    return agg
+
+
+def _box_sketch(sk):
+    # same box stats as _box, with the quantiles and whisker ends taken from the sketch
+    if sk.count == 0:
+        return None
+    q1, med, q3 = (sk.quantile(q) for q in (0.25, 0.5, 0.75))
+    iqr = q3 - q1
+    values, _ = sk.buckets()
+    lo = values[values >= q1 - 1.5 * iqr]
+    hi = values[values <= q3 + 1.5 * iqr]
+    return {"q1": q1, "med": med, "q3": q3, "whislo": lo.min(), "whishi": hi.max()}
+
+
+def aggregate_cube(cube, dirty_rows):
+    """Same inputs as aggregate(), read off a RollupCube instead of the rows."""
+    agg = {}
+    daily = cube.frame(["day"])["rows"]
+    daily = daily[daily.index != MISSING]
+    daily.index = pd.to_datetime(daily.index)
+    if len(daily):
+        daily = daily.reindex(pd.date_range(daily.index.min(), daily.index.max(), freq="D"), fill_value=0)
+    agg["incidents_over_time.png"] = {
+        "dates": [d.strftime("%Y-%m-%d") for d in daily.index],
+        "counts": daily.tolist(),
+        "rolling7": daily.rolling(7, min_periods=1).mean().round(6).tolist(),
+    }
+
+    agg["incidents_dirty_vs_clean.png"] = {"dirty": dirty_rows, "clean": cube.rows}
+
+    pri = cube.frame(["final_priority"])["rows"].rename({MISSING: "Unknown"}).sort_index()
+    agg["incidents_per_priority.png"] = {"labels": pri.index.tolist(), "counts": pri.tolist()}
+
+    miss = (pd.Series(cube.missing(), dtype="float64") / max(cube.rows, 1) * 100).sort_values(ascending=False)
+    agg["missingness_heatmap.png"] = {"columns": miss.index.tolist(), "pct": miss.round(6).tolist()}
+
+    groups = cube.frame(["assignment_group_mode"])["rows"].rename({MISSING: "(missing)"})
+    groups = groups.sort_values(ascending=False, kind="stable").head(10)
+    agg["top_assignment_groups.png"] = {"labels": groups.index.tolist(), "counts": groups.tolist()}
+
+    monthly = cube.frame(["month"])
+    monthly = monthly[(monthly.index != MISSING) & (monthly["sla_count"] > 0)]
+    agg["sla_rate_by_month.png"] = {"months": monthly.index.tolist(),
+                                    "rate": (monthly["breached"] / monthly["sla_count"]).round(6).tolist()}
+
+    boxes = []
+    for label in sorted(cube.frame(["final_priority"]).index):
+        b = _box_sketch(cube.sketch(final_priority=label))
+        if b is not None:
+            boxes.append(dict(label="Unknown" if label == MISSING else label,
+                              **{k: round(float(v), 6) for k, v in b.items()}))
+    agg["resolution_by_priority.png"] = {"boxes": sorted(boxes, key=lambda b: b["label"])}
+
+    sk = cube.sketch()
+    values, weights = sk.buckets()
+    cap = float(sk.quantile(0.99)) if sk.count else 0.0
+    counts, edges = (np.histogram(np.minimum(values, cap), bins=50, weights=weights) if sk.count
+                     else (np.zeros(0), np.zeros(1)))
+    agg["resolution_time_hist.png"] = {"counts": counts.astype(int).tolist(), "edges": np.round(edges, 6).tolist(),
+                                       "cap": round(cap, 6)}
+
+    totals = cube.frame(by=[])
+    agg["sla_breach_distribution.png"] = {
+        "Met (≤24h)": int(totals["res_count"] - totals["breached"]),
+        "Breached (>24h)": int(totals["breached"]),
+        "Missing": int(totals["rows"] - totals["res_count"]),
+    }
+
+    agg["pipeline_diagram.png"] = {"steps": PIPELINE_STEPS}
+    return agg
+
+
+# --- rendering (worker processes) ------------------------------------------
+
+def plot_incidents_over_time(ax, d):
+    dates = pd.to_datetime(d["dates"])
+    ax.plot(dates, d["counts"], color="#9ecae1", linewidth=1, label="daily")
+    ax.plot(dates, d["rolling7"], color="#08519c", linewidth=2, label="7-day rolling mean")
+    ax.set(title="Incidents opened per day", xlabel="date (first_opened_at)", ylabel="incidents")
+    ax.legend()
+
+
+def plot_incidents_dirty_vs_clean(ax, d):
+    ax.bar(["dirty", "clean"], [d["dirty"], d["clean"]], color=["#de2d26", "#31a354"])
+    for i, v in enumerate([d["dirty"], d["clean"]]):
+        ax.text(i, v, f"{v:,}", ha="center", va="bottom")
+    ax.set(title="Rows before and after cleaning", ylabel="rows")
+
+
+def plot_incidents_per_priority(ax, d):
+    ax.bar(d["labels"], d["counts"], color="#3182bd")
+    ax.set(title="Incidents per priority", xlabel="final_priority", ylabel="incidents")
+
+
+def plot_missingness_heatmap(ax, d):
+    ax.barh(d["columns"][::-1], d["pct"][::-1], color="#756bb1")
+    ax.set(title="Missing values per column (cleaned data)", xlabel="% missing", xlim=(0, 100))
+
+
+def plot_top_assignment_groups(ax, d):
+    ax.barh(d["labels"][::-1], d["counts"][::-1], color="#e6550d")
+    ax.set(title="Top assignment groups", xlabel="incidents")
+
+
+def plot_sla_rate_by_month(ax, d):
+    ax.plot(d["months"], d["rate"], marker="o", color="#de2d26")
+    ax.set(title="SLA breach rate by month", xlabel="month", ylabel="fraction breached", ylim=(0, 1))
+
+
+def plot_resolution_by_priority(ax, d):
+    stats = [dict(b, fliers=[]) for b in d["boxes"]]
+    if stats:
+        ax.bxp(stats, showfliers=False)
+    ax.set_yscale("symlog", linthresh=1)
+    ax.set(title="Resolution hours by priority", xlabel="final_priority", ylabel="resolution_hours (symlog)")
+
+
+def plot_resolution_time_hist(ax, d):
+    if d["counts"]:
+        ax.stairs(d["counts"], d["edges"], fill=True, color="#31a354")
+    ax.set(title=f"Resolution time (clipped at p99 = {d['cap']:.1f}h)", xlabel="hours", ylabel="incidents")
+
+
+def plot_sla_breach_distribution(ax, d):
+    ax.bar(list(d), list(d.values()), color=["#31a354", "#de2d26", "#bdbdbd"])
+    ax.set(title="SLA status", ylabel="incidents")
+
+
+def plot_pipeline_diagram(ax, d):
+    steps = d["steps"]
+    ax.set_xlim(0, len(steps))
+    ax.set_ylim(0, 1)
+    ax.axis("off")
+    for i, step in enumerate(steps):
+        ax.text(i + 0.5, 0.5, step, ha="center", va="center", fontsize=11,
+                bbox=dict(boxstyle="round,pad=0.6", fc="#deebf7", ec="#3182bd"))
+        if i:
+            ax.annotate("", xy=(i + 0.12, 0.5), xytext=(i - 0.12, 0.5),
+                        arrowprops=dict(arrowstyle="->", lw=2))
+    ax.set_title("pipeline.py processing steps")
+
+
+PLOTS = {
+    "incidents_over_time.png": plot_incidents_over_time,
+    "incidents_dirty_vs_clean.png": plot_incidents_dirty_vs_clean,
+    "incidents_per_priority.png": plot_incidents_per_priority,
+    "missingness_heatmap.png": plot_missingness_heatmap,
+    "top_assignment_groups.png": plot_top_assignment_groups,
+    "sla_rate_by_month.png": plot_sla_rate_by_month,
+    "resolution_by_priority.png": plot_resolution_by_priority,
+    "resolution_time_hist.png": plot_resolution_time_hist,
+    "sla_breach_distribution.png": plot_sla_breach_distribution,
+    "pipeline_diagram.png": plot_pipeline_diagram,
+}
+
+
+def render(name, data, path):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    t0 = time.perf_counter()
+    fig, ax = plt.subplots(figsize=(12, 3) if name == "pipeline_diagram.png" else (9, 5))
+    PLOTS[name](ax, data)
+    fig.tight_layout()
+    fig.savefig(path, dpi=120)
+    plt.close(fig)
+    return name, time.perf_counter() - t0
+
+
+def fingerprint(name, data):
+    # the aggregate plus the plotting code, so editing a plot re-renders it too
+    h = hashlib.sha1(json.dumps(data, sort_keys=True, default=str).encode())
+    h.update(inspect.getsource(PLOTS[name]).encode())
+    return h.hexdigest()
+
+
+def _count_rows(path):
+    first = next(iter_table(path, 1)).columns[0]
+    return sum(len(c) for c in iter_table(path, 1_000_000, columns=[first]))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Render the figures in data/figures/FIGURES.md.")
+    ap.add_argument("--clean", default=CLEAN, help="cleaned data (.csv, .parquet or .feather)")
+    ap.add_argument("--dirty", default=DIRTY, help="dirty data (only its row count is used)")
+    ap.add_argument("--out-dir", default=FIG_DIR)
+    ap.add_argument("--workers", type=int, default=os.cpu_count())
+    ap.add_argument("--cube", metavar="JSON", help="aggregate from this rollup cube instead of --clean")
+    ap.add_argument("--force", action="store_true", help="re-render everything")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    os.makedirs(args.out_dir, exist_ok=True)
+    dirty_rows = _count_rows(args.dirty) if os.path.exists(args.dirty) else 0
+    if args.cube:
+        agg = aggregate_cube(RollupCube.load(args.cube), dirty_rows)
+    else:
+        df = read_table(args.clean)
+        agg = aggregate(df, dirty_rows)
+        del df
+    print(f"Aggregated figure data from {args.cube or args.clean} in {time.perf_counter() - t0:.2f}s")
+
+    cache_path = os.path.join(args.out_dir, CACHE_FILE)
+    cache = {}
+    if os.path.exists(cache_path) and not args.force:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+
+    todo = []
+    for name, data in agg.items():
+        fp = fingerprint(name, data)
+        path = os.path.join(args.out_dir, name)
+        if cache.get(name) == fp and os.path.exists(path):
+            print(f"- {name}: unchanged, skipped")
+        else:
+            todo.append((name, data, path, fp))
+
+    if todo:
+        workers = max(1, min(args.workers, len(todo)))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [(fp, pool.submit(render, name, data, path)) for name, data, path, fp in todo]
+            for fp, fut in futures:
+                name, secs = fut.result()
+                cache[name] = fp
+                print(f"- {name}: rendered in {secs:.2f}s")
+
+    with open(cache_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+    print(f"✅ {len(todo)} figure(s) rendered, {len(agg) - len(todo)} skipped → {args.out_dir}"
+          f" ({time.perf_counter() - t0:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""
+Rolling-window operational metrics: per-day counters, kept up to date as rows arrive.
+
+Per (final_priority, assignment_group_mode) and per day the engine counts:
+ - opened      rows by the day of first_opened_at
+ - resolved    rows by the day of last_resolved_at
+ - breached / sla_count, res_count / res_sum   by opened day (as in cube.py)
+ - a resolution_hours sketch per opened day
+Next to the daily counters it keeps the trailing 7/30/90-day sums for every day.
+update() with new rows adds them to the days they touch and recomputes the
+windows over just those days (plus the window length after them), so the cost
+follows the new rows and the span they cover, not the history. Rows can also be
+taken out again (sign=-1), for partitions that get rewritten.
+
+Queries only read the arrays in memory - a trend series for a priority/group is
+a slice and a sum over a few dozen series:
+
+    m = RollingMetrics.load("data/incidents_metrics.json")
+    m.series("breach_rate", window=7, priority="1 - Critical")   # pd.Series by day
+    m.latest(window=30, group="Network")                         # dashboard tile
+
+pipeline.py --metrics JSON writes one; incremental.py keeps STORE/_metrics.json
+up to date, and ingest.py answers GET /metrics from its own.
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from cube import CUBE_ERROR, _flag, _labels
+from sketches import QuantileSketch
+
+MEASURES = ["opened", "resolved", "breached", "sla_count", "res_count", "res_sum"]
+# derived measures: numerator / denominator
+RATES = {"breach_rate": ("breached", "sla_count"), "mean_hours": ("res_sum", "res_count")}
+WINDOWS = (7, 30, 90)
+DIMS = ["final_priority", "assignment_group_mode"]
+
+
+def _day_numbers(s):
+    """Days since 1970-01-01 as int64, plus a mask of the rows that have a date."""
+    if not pd.api.types.is_datetime64_any_dtype(s):
+        s = pd.to_datetime(s, format="ISO8601", errors="coerce")
+    days = s.to_numpy("datetime64[ns]").astype("datetime64[D]")
+    ok = ~np.isnat(days)
+    return np.where(ok, days.astype("int64"), 0), ok
+
+
+def _as_list(v):
+    return None if v is None else [v] if isinstance(v, str) else list(v)
+
+
+class RollingMetrics:
+    def __init__(self, rel_error=CUBE_ERROR, windows=WINDOWS):
+        self.rel_error = rel_error
+        self.windows = tuple(windows)
+        self.keys = []       # (priority, group) of each series
+        self._index = {}     # (priority, group) -> series number
+        self.origin = None   # day number of column 0
+        # the counters live in bigger buffers (see _grow); daily/rolling are views
+        # of the used part: series 0..len(keys), days _off.._off+_days
+        self._daily = np.zeros((0, len(MEASURES), 0))
+        self._rolling = {w: self._daily.copy() for w in self.windows}
+        self._off = 0
+        self._days = 0
+        self.sketches = {}   # (day number, series) -> QuantileSketch
+
+    @property
+    def days(self):
+        return self._days
+
+    @property
+    def daily(self):
+        return self._daily[:len(self.keys), :, self._off:self._off + self._days]
+
+    @property
+    def rolling(self):
+        return {w: a[:len(self.keys), :, self._off:self._off + self._days] for w, a in self._rolling.items()}
+
+    def _grow(self, keys, lo, hi):
+        # room for new series and for days lo..hi (padding both ends as needed).
+        # Returns the first day whose windows need computing: lo, or the first
+        # day added on the right (its windows still hold the days before it)
+        new = [k for k in dict.fromkeys(keys) if k not in self._index]
+        for k in new:
+            self._index[k] = len(self.keys)
+            self.keys.append(k)
+        if self.origin is None:
+            self.origin = lo
+        first = min(lo, self.origin + self.days)
+        left = max(self.origin - lo, 0)
+        right = max(hi - (self.origin + self.days - 1), 0)
+        cap_series, _, cap_days = self._daily.shape
+        days = self._days + left + right
+        if len(self.keys) > cap_series or left > self._off or self._off + self._days + right > cap_days:
+            # out of room: double the buffers (like a list does), so adding a
+            # day or a series at a time doesn't copy the whole history every time.
+            # The spare days go on the side that grew
+            n = max(len(self.keys), 2 * cap_series) if len(self.keys) > cap_series else cap_series
+            cap = max(days, 2 * cap_days)
+            spare = cap - days
+            off = spare if left and not right else 0 if right and not left else spare // 2
+            used = (slice(0, cap_series), slice(None), slice(off + left, off + left + self._days))
+            span = (slice(None), slice(None), slice(self._off, self._off + self._days))
+            old_daily, old_rolling = self._daily[span], {w: a[span] for w, a in self._rolling.items()}
+            self._daily = np.zeros((n, len(MEASURES), cap))
+            self._daily[used] = old_daily
+            self._rolling = {w: np.zeros_like(self._daily) for w in self.windows}
+            for w, a in self._rolling.items():
+                a[used] = old_rolling[w]
+            self._off = off + left
+        self._off -= left
+        self._days = days
+        self.origin -= left
+        return first
+
+    def _refresh(self, lo, hi):
+        """Recompute every window that covers a day in lo..hi (day numbers)."""
+        i0, i1 = lo - self.origin, hi - self.origin
+        for w, out in self.rolling.items():
+            start, end = max(i0 - w + 1, 0), min(i1 + w - 1, self.days - 1)
+            cs = np.concatenate([np.zeros(self.daily.shape[:2] + (1,)),
+                                 np.cumsum(self.daily[:, :, start:end + 1], axis=2)], axis=2)
+            d = np.arange(i0, end + 1)
+            out[:, :, i0:end + 1] = cs[:, :, d - start + 1] - cs[:, :, np.maximum(d - w + 1, start) - start]
+
+    def update(self, df, sign=1):
+        """Add the rows of a clean frame or chunk (sign=-1 takes them out again)."""
+        if not len(df):
+            return self
+        opened, has_opened = _day_numbers(df["first_opened_at"])
+        resolved, has_resolved = _day_numbers(df["last_resolved_at"])
+        labels = list(zip(*(_labels(df[d]).to_numpy() for d in DIMS)))
+        days = np.concatenate([opened[has_opened], resolved[has_resolved]])
+        if not len(days):
+            return self
+        first = self._grow(labels, int(days.min()), int(days.max()))
+        series = np.array([self._index[k] for k in labels], dtype=np.int64)
+
+        res = pd.to_numeric(df["resolution_hours"], errors="coerce").to_numpy(dtype="float64")
+        has_res = ~np.isnan(res)
+        sla = _flag(df, "sla_breached", np.where(has_res, (res > 24).astype("float64"), np.nan))
+        values = np.column_stack([
+            np.ones(len(df)), np.zeros(len(df)), np.nan_to_num(sla), ~np.isnan(sla), has_res,
+            np.where(has_res, res, 0.0),
+        ]) * sign
+        rows = has_opened
+        for m in range(len(MEASURES)):
+            if MEASURES[m] != "resolved":
+                np.add.at(self.daily, (series[rows], m, opened[rows] - self.origin), values[rows, m])
+        np.add.at(self.daily, (series[has_resolved], MEASURES.index("resolved"),
+                               resolved[has_resolved] - self.origin), sign)
+
+        # one sketch per (opened day, series); each group's values go in at once
+        timed = rows & has_res
+        v_all = res[timed]
+        cells = pd.Series(v_all).groupby([opened[timed], series[timed]]).indices
+        for (day, s), pos in cells.items():
+            sk = self.sketches.setdefault((int(day), int(s)), QuantileSketch(self.rel_error))
+            if sign > 0:
+                sk.add(v_all[pos])
+            else:
+                sk.remove(v_all[pos])
+        self._refresh(first, int(days.max()))
+        return self
+
+    # --- queries ------------------------------------------------------------
+
+    def _series(self, priority=None, group=None):
+        want_p, want_g = _as_list(priority), _as_list(group)
+        return [i for i, (p, g) in enumerate(self.keys)
+                if (want_p is None or p in want_p) and (want_g is None or g in want_g)]
+
+    def _day(self, day):
+        return int(np.datetime64(pd.Timestamp(day).date(), "D").astype("int64"))
+
+    def series(self, measure="opened", window=None, priority=None, group=None, start=None, end=None):
+        """A measure per day (or its trailing `window`-day total), for the matching priority/group(s).
+
+        `measure` is one of MEASURES or RATES ("breach_rate", "mean_hours" -
+        ratios of the window totals). Covers the days from the first to the last
+        one with data, cut to [start, end] if given.
+        """
+        if self.origin is None:
+            return pd.Series(dtype="float64")
+        arr = self.daily if window is None else self.rolling[window]
+        total = arr[self._series(priority, group)].sum(axis=0)  # (measures, days)
+        lo = 0 if start is None else max(self._day(start) - self.origin, 0)
+        hi = self.days if end is None else min(self._day(end) - self.origin + 1, self.days)
+        if measure in RATES:
+            num, den = (total[MEASURES.index(m), lo:hi] for m in RATES[measure])
+            with np.errstate(divide="ignore", invalid="ignore"):
+                values = np.where(den > 0, num / den, np.nan)
+        else:
+            values = total[MEASURES.index(measure), lo:hi]
+        index = pd.to_datetime(np.arange(self.origin + lo, self.origin + max(hi, lo)), unit="D")
+        return pd.Series(values, index=index, name=measure)
+
+    def sketch(self, window=7, end=None, priority=None, group=None):
+        """resolution_hours sketch of the rows opened in the `window` days up to `end` (default: last day)."""
+        sk = QuantileSketch(self.rel_error)
+        if self.origin is None:
+            return sk
+        last = self.origin + self.days - 1 if end is None else self._day(end)
+        wanted = set(self._series(priority, group))
+        for (day, s), part in self.sketches.items():
+            if s in wanted and last - window < day <= last:
+                sk.merge(part)
+        return sk
+
+    def latest(self, window=7, priority=None, group=None):
+        """The `window`-day totals, rates and percentiles up to the last day with data."""
+        if self.origin is None:
+            return {"day": None, "window": window}
+        out = {"day": str(pd.Timestamp(self.origin + self.days - 1, unit="D").date()), "window": window}
+        for m in list(MEASURES) + list(RATES):
+            v = self.series(m, window, priority, group).iloc[-1]
+            out[m] = None if pd.isna(v) else float(v)
+        sk = self.sketch(window, None, priority, group)
+        for name, q in (("p50_hours", 0.5), ("p90_hours", 0.9), ("p99_hours", 0.99)):
+            out[name] = sk.quantile(q) if sk.count else None
+        return out
+
+    # --- persistence --------------------------------------------------------
+
+    def to_dict(self):
+        # only the daily counters; the windows are recomputed on load
+        return {
+            "rel_error": self.rel_error,
+            "windows": list(self.windows),
+            "keys": [list(k) for k in self.keys],
+            "origin": self.origin,
+            "days": self.days,
+            "daily": self.daily.tolist(),
+            "sketches": [{"day": d, "series": s, "sketch": sk.to_dict()}
+                         for (d, s), sk in sorted(self.sketches.items())],
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        m = cls(d["rel_error"], d["windows"])
+        m.keys = [tuple(k) for k in d["keys"]]
+        m._index = {k: i for i, k in enumerate(m.keys)}
+        m.origin = d["origin"]
+        # the day count is stored, as it can't be told from an empty "daily"
+        days = d.get("days", len(d["daily"][0][0]) if d["daily"] else 0)
+        m._daily = np.array(d["daily"], dtype="float64").reshape(len(m.keys), len(MEASURES), days)
+        m._rolling = {w: np.zeros_like(m._daily) for w in m.windows}
+        m._days = days
+        m.sketches = {(c["day"], c["series"]): QuantileSketch.from_dict(c["sketch"]) for c in d["sketches"]}
+        if m.days:
+            m._refresh(m.origin, m.origin + m.days - 1)
+        return m
+
+    def save(self, path):
+        # temp file + rename, so a reader never sees half a file
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Print trend series from a rolling metrics file.")
+    ap.add_argument("metrics", help="JSON written by pipeline.py --metrics (or STORE/_metrics.json)")
+    ap.add_argument("--measure", default="opened", choices=MEASURES + list(RATES))
+    ap.add_argument("--window", type=int, choices=WINDOWS, help="trailing window in days (default: per day)")
+    ap.add_argument("--priority", nargs="+")
+    ap.add_argument("--group", nargs="+")
+    ap.add_argument("--last", type=int, default=14, help="print this many most recent days")
+    args = ap.parse_args()
+
+    m = RollingMetrics.load(args.metrics)
+    s = m.series(args.measure, args.window, args.priority, args.group)
+    print(s.tail(args.last).to_string())
+    print(json.dumps(m.latest(args.window or 7, args.priority, args.group), indent=2))
+
+
+if __name__ == "__main__":
+    main()
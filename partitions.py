@@ -0,0 +1,256 @@
+"""
+The clean incidents partitioned by first_opened_at, with a manifest for pruning.
+
+pipeline.py --partitioned DIR writes the clean rows (as well as --out) into
+ DIR/month=YYYY-MM/part-00000.csv                     (--partition-by month)
+ DIR/month=YYYY-MM/day=YYYY-MM-DD/part-00000.csv      (--partition-by day, the default)
+in the --out file's format, plus DIR/_manifest.json with, per file:
+ - the partition and the row count
+ - min/max of first_opened_at, last_resolved_at and resolution_hours
+ - the distinct final_priority / assignment_group_mode values in it
+query() checks a time range / priority / group against the manifest first and
+only reads the files that can hold matching rows, so "last 7 days" reads about
+7 days of data however long the history is.
+
+    python partitions.py data/clean_parts --start 2025-03-01 --end 2025-03-08 --priority "1 - Critical"
+"""
+
+import argparse
+import json
+import os
+import shutil
+
+import pandas as pd
+
+from cube import MISSING, _days, _labels
+from storage import TableWriter, fmt_of, read_table
+
+MANIFEST = "_manifest.json"
+MANIFEST_VERSION = 1
+GRANULARITY = ["day", "month"]
+RANGE_COLS = ["first_opened_at", "last_resolved_at", "resolution_hours"]
+VALUE_COLS = ["final_priority", "assignment_group_mode"]
+TIME_COL = "first_opened_at"
+UNKNOWN = "unknown"  # partition of rows without a first_opened_at (the cleaner drops those)
+
+
+def _times(s):
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s
+    return pd.to_datetime(s, format="ISO8601", errors="coerce")
+
+
+def partition_keys(df, by="day"):
+    """Partition of each row: "YYYY-MM-DD" (or "YYYY-MM") of first_opened_at."""
+    days = _days(df[TIME_COL])
+    keys = days if by == "day" else days.str.slice(0, 7)
+    return keys.where(days != MISSING, UNKNOWN)
+
+
+def partition_dir(key, by="day"):
+    if by == "month" or key == UNKNOWN:
+        return f"month={key}"
+    return os.path.join(f"month={key[:7]}", f"day={key}")
+
+
+def _file_stats(df):
+    st = {"rows": len(df), "min": {}, "max": {}, "values": {}}
+    for c in RANGE_COLS:
+        if c not in df.columns:
+            continue
+        s = _times(df[c]) if c != "resolution_hours" else pd.to_numeric(df[c], errors="coerce")
+        if s.notna().any():
+            lo, hi = s.min(), s.max()
+            st["min"][c] = str(lo) if c != "resolution_hours" else float(lo)
+            st["max"][c] = str(hi) if c != "resolution_hours" else float(hi)
+    for c in VALUE_COLS:
+        if c in df.columns:
+            st["values"][c] = sorted(_labels(df[c]).unique().tolist())
+    return st
+
+
+def _merge_stats(a, b):
+    a["rows"] += b["rows"]
+    for c, v in b["min"].items():
+        a["min"][c] = v if c not in a["min"] else min(a["min"][c], v, key=_order(c))
+    for c, v in b["max"].items():
+        a["max"][c] = v if c not in a["max"] else max(a["max"][c], v, key=_order(c))
+    for c, v in b["values"].items():
+        a["values"][c] = sorted(set(a["values"].get(c, [])) | set(v))
+    return a
+
+
+def _order(col):
+    return float if col == "resolution_hours" else pd.Timestamp
+
+
+class PartitionedWriter:
+    """Append clean chunks to ROOT, split by partition_keys(); writes the manifest on close.
+
+    Each partition has one TableWriter open at a time. Parquet/Feather writers
+    hold a file open, so at most `max_open` of those are kept: when a
+    partition's writer gets closed to make room, its next rows go to a new part
+    file. CSV appends without holding the file, so it's one file per partition.
+    """
+
+    def __init__(self, root, by="day", ext=".csv", max_open=128, date_format=None):
+        if by not in GRANULARITY:
+            raise ValueError(f"partition by one of {', '.join(GRANULARITY)}, not '{by}'")
+        fmt = fmt_of("part" + ext)
+        if os.path.isdir(root) and os.listdir(root):
+            if not os.path.exists(os.path.join(root, MANIFEST)):
+                raise ValueError(f"{root} isn't empty and isn't a partitioned store, not overwriting it")
+            shutil.rmtree(root)
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.by = by
+        self.ext = ext
+        self.max_open = None if fmt == "csv" else max_open
+        self.date_format = date_format
+        self.columns = None
+        self.files = {}    # relative path -> stats
+        self._open = {}    # partition -> (relative path, TableWriter), least recently used first
+        self._parts = {}   # partition -> part files started
+
+    def _writer(self, key):
+        if key in self._open:
+            self._open[key] = self._open.pop(key)
+            return self._open[key]
+        if self.max_open is not None and len(self._open) >= self.max_open:
+            oldest = next(iter(self._open))
+            self._open.pop(oldest)[1].close()
+        n = self._parts.get(key, 0)
+        self._parts[key] = n + 1
+        rel = os.path.join(partition_dir(key, self.by), f"part-{n:05d}{self.ext}")
+        os.makedirs(os.path.join(self.root, os.path.dirname(rel)), exist_ok=True)
+        self._open[key] = (rel, TableWriter(os.path.join(self.root, rel), self.date_format))
+        return self._open[key]
+
+    def write(self, df):
+        if self.columns is None:
+            self.columns = list(df.columns)
+        if not len(df):
+            return
+        for key, part in df.groupby(partition_keys(df, self.by), sort=True):
+            rel, writer = self._writer(key)
+            writer.write(part)
+            st = dict(_file_stats(part), partition=key)
+            self.files[rel] = _merge_stats(self.files[rel], st) if rel in self.files else st
+
+    def close(self):
+        for _, writer in self._open.values():
+            writer.close()
+        self._open = {}
+        manifest = {"version": MANIFEST_VERSION, "by": self.by, "format": self.ext, "columns": self.columns or [],
+                    "files": dict(sorted(self.files.items()))}
+        tmp = os.path.join(self.root, MANIFEST + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp, os.path.join(self.root, MANIFEST))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_partitioned(df, root, by="day", ext=".csv", date_format=None):
+    """The whole clean frame -> ROOT (one file per partition); returns the manifest's file stats."""
+    with PartitionedWriter(root, by, ext, date_format=date_format) as w:
+        w.write(df)
+    return w.files
+
+
+# --- reading --------------------------------------------------------------
+
+def load_manifest(root):
+    with open(os.path.join(root, MANIFEST), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"{root}: manifest version {manifest.get('version')}, expected {MANIFEST_VERSION}")
+    return manifest
+
+
+def _as_list(v):
+    return None if v is None else [v] if isinstance(v, str) else list(v)
+
+
+def prune(manifest, start=None, end=None, priority=None, group=None):
+    """Files that can hold rows opened in [start, end) with the given priority/group(s)."""
+    start = None if start is None else pd.Timestamp(start)
+    end = None if end is None else pd.Timestamp(end)
+    want = {"final_priority": _as_list(priority), "assignment_group_mode": _as_list(group)}
+    keep = []
+    for rel, st in manifest["files"].items():
+        lo, hi = st["min"].get(TIME_COL), st["max"].get(TIME_COL)
+        if start is not None and (hi is None or pd.Timestamp(hi) < start):
+            continue
+        if end is not None and (lo is None or pd.Timestamp(lo) >= end):
+            continue
+        if any(w is not None and not set(w) & set(st["values"].get(c, [])) for c, w in want.items()):
+            continue
+        keep.append(rel)
+    return keep
+
+
+def query(root, start=None, end=None, priority=None, group=None, columns=None, dtype=None):
+    """Clean rows opened in [start, end) with the given priority/group(s), reading only unpruned files.
+
+    `priority` / `group` take one value or a list; `columns` and `dtype` are
+    handed to read_table() (the filter columns are read either way).
+    """
+    manifest = load_manifest(root)
+    files = prune(manifest, start, end, priority, group)
+    return read_files(root, manifest, files, start, end, priority, group, columns, dtype)
+
+
+def read_files(root, manifest, files, start=None, end=None, priority=None, group=None, columns=None, dtype=None):
+    """query() over files already picked by prune(), so a caller that wants the list too prunes only once."""
+    need = None if columns is None else list(dict.fromkeys(list(columns) + [TIME_COL] + VALUE_COLS))
+    parts = []
+    for rel in files:
+        df = read_table(os.path.join(root, rel), columns=need, dtype=dtype)
+        ok = pd.Series(True, index=df.index)
+        if start is not None or end is not None:
+            opened = _times(df[TIME_COL])
+            if start is not None:
+                ok &= opened >= pd.Timestamp(start)
+            if end is not None:
+                ok &= opened < pd.Timestamp(end)
+        for c, w in (("final_priority", priority), ("assignment_group_mode", group)):
+            if w is not None:
+                ok &= _labels(df[c]).isin(_as_list(w)).to_numpy()
+        parts.append(df[ok.to_numpy()])
+    if not parts:
+        return pd.DataFrame(columns=manifest["columns"] if columns is None else columns)
+    out = pd.concat(parts, ignore_index=True)
+    return out if columns is None else out[list(columns)]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Query a partitioned clean store (see pipeline.py --partitioned).")
+    ap.add_argument("root")
+    ap.add_argument("--start", help="opened at or after this (e.g. 2024-03-01)")
+    ap.add_argument("--end", help="opened before this")
+    ap.add_argument("--priority", nargs="+")
+    ap.add_argument("--group", nargs="+")
+    ap.add_argument("--out", help="save the matching rows here instead of previewing them")
+    args = ap.parse_args()
+
+    manifest = load_manifest(args.root)
+    files = prune(manifest, args.start, args.end, args.priority, args.group)
+    total = sum(st["rows"] for st in manifest["files"].values())
+    scanned = sum(manifest["files"][rel]["rows"] for rel in files)
+    df = read_files(args.root, manifest, files, args.start, args.end, args.priority, args.group)
+    print(f"Read {len(files)} of {len(manifest['files'])} files ({scanned} of {total} rows) -> {len(df)} matching rows")
+    if args.out:
+        from storage import write_table
+        write_table(df, args.out)
+        print(f"✅ saved → {args.out}")
+    else:
+        print(df.head(5).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
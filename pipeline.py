@@ -1,17 +1,29 @@
+import argparse
+import json
+import os
+
 import pandas as pd
 import numpy as np
 
+from cube import RollupCube
+from dedup import KEY, MODES, Dedup, LatestKeys
+from features import FeatureWriter, write_features
+from metrics import RollingMetrics
+from partitions import GRANULARITY, PartitionedWriter, write_partitioned
+from sketches import make_quantiles, quantile_note
+from stages import Stages
+from storage import (CATEGORY_COLS, TableWriter, clean_dtypes, decode_numbers, fit_integers, iter_table,
+                     memory_table, print_memory_report, read_table, write_table)
+
 SRC = "data/incidents_dirty.csv"      # <- read the DIRTY file now
-OUT = "data/incidents_clean.csv"      # <- cleaned output
+OUT = "data/incidents_clean.csv"      # <- cleaned output (.parquet / .feather also work, see storage.py)
 
-# 1) load
-df = pd.read_csv(SRC, low_memory=False)
-print(f"Loaded dirty file: {SRC}")
-print(f"- starting rows: {len(df)}")
+DATE_COLS = ["first_opened_at", "last_resolved_at", "last_closed_at"]
 
-# 2) drop exact duplicates
-df = df.drop_duplicates()
-print(f"Step: drop exact duplicates -> rows: {len(df)}")
+# 1) the in-memory run reads the dirty file with the compact types where the
+# dirty values allow it: labels as categoricals, the incident number as an
+# integer (it stays text if any number doesn't look like INC<digits>)
+LOAD_DTYPES = {c: t for c, t in clean_dtypes().items() if c in ["number"] + CATEGORY_COLS}
 
 # 3) standardise priority labels (fix variants + keep originals if you want)
 priority_map = {
@@ -21,64 +33,113 @@ priority_map = {
     "4 - Low":      ["4 - Low", "low", "Low", "4-low", "P4"]
 }
 
-def normalise_priority(x):
-    if pd.isna(x):
-        return np.nan
-    for canon, variants in priority_map.items():
-        if str(x) in variants:
-            return canon
-    return x  # unknown values pass through unchanged
+# inverse lookup: variant -> canonical label
+priority_lookup = {v: canon for canon, variants in priority_map.items() for v in variants}
+
+# 3b) the same idea for every free-text categorical column. A value's match key
+# is its text stripped, inner whitespace collapsed and casefolded; keys in the
+# column's alias map get the canonical spelling, anything else keeps its
+# stripped text (so the result never depends on which chunk a value was in).
+# Strings that only say "missing" (dirty_up.py pads NaN into " nan  ") become NaN.
+NAN_STRINGS = {"", "nan", "none", "null", "n/a", "na", "<na>"}
+CATEGORY_ALIASES = {
+    "final_priority": {v.casefold(): canon for v, canon in priority_lookup.items()},
+    # the groups / states make_dataset.py generates
+    "assignment_group_mode": {g.casefold(): g for g in ["Network", "Database", "Application", "Security"]},
+    "final_state": {st.casefold(): st for st in ["Resolved", "Closed"]},
+}
+
+def canonicalise(s, aliases=None):
+    """Canonical labels for a free-text categorical, worked out on its distinct values only.
 
-if "final_priority" in df.columns:
-    df["final_priority"] = df["final_priority"].apply(normalise_priority)
-    print("Step: normalised final_priority values (mapped variants to canonical labels)")
+    Each distinct value is cleaned/looked up once and the result is broadcast
+    back to the rows through the categorical codes, so the cost grows with the
+    number of distinct values, not rows. Returns (categorical series,
+    {canonical: {variant: rows}} for every variant that changed, rows that
+    became NaN).
+    """
+    cat = pd.Categorical(s)
+    text = pd.Series(cat.categories, dtype=object).astype(str).str.strip().str.replace(r"\s+", " ", regex=True)
+    key = text.str.casefold()
+    missing = key.isin(NAN_STRINGS).to_numpy()
+    canon = key.map(aliases or {}).fillna(text).where(~missing)
+    new = pd.Categorical(canon)
+    # code -1 (NaN rows) indexes the trailing -1
+    codes = np.append(new.codes, -1)[cat.codes]
+    out = pd.Series(pd.Categorical.from_codes(codes, new.categories), index=s.index, name=s.name)
+
+    rows = np.bincount(cat.codes[cat.codes >= 0], minlength=len(cat.categories))
+    merged = {}
+    for variant, c, n in zip(cat.categories, canon, rows):
+        if n and variant != c:
+            merged.setdefault("nan" if pd.isna(c) else c, {})[str(variant)] = int(n)
+    return out, merged, int(rows[missing].sum())
 
 # 4) parse date/time columns (handle mixed formats + bad strings)
-def parse_dt(s):
+# every format dirty_up.py produces, as (name, regex, strptime format). Values are
+# sorted into these families first and each family is parsed with its explicit
+# format, which is much faster than letting pandas guess per element.
+DATE_FORMATS = [
+    ("iso_frac",  r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{1,9}", "%Y-%m-%d %H:%M:%S.%f"),
+    ("iso",       r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}",           "%Y-%m-%d %H:%M:%S"),
+    ("iso_z",     r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}Z",          "%Y-%m-%dT%H:%M:%SZ"),
+    ("iso_date",  r"\d{4}-\d{2}-\d{2}",                              "%Y-%m-%d"),
+    ("ymd_slash", r"\d{4}/\d{2}/\d{2} \d{2}:\d{2}",                  "%Y/%m/%d %H:%M"),
+]
+# dd/mm/yyyy vs mm/dd/yyyy: decided per value by whichever field is > 12.
+# When both fields are <= 12 we can't tell, so we fall back to day-first
+# (what the old dayfirst=True parse did) and count it as "ambiguous".
+SLASH_DATE = r"(\d{2})/(\d{2})/\d{4} \d{2}:\d{2}"
+EU_FORMAT = "%d/%m/%Y %H:%M"
+US_FORMAT = "%m/%d/%Y %H:%M"
+
+def parse_dt(s, counts=None):
     # tries multiple formats, returns NaT if it can’t parse
-    return pd.to_datetime(s, errors="coerce", dayfirst=True, utc=False)
-
-for c in ["first_opened_at", "last_resolved_at", "last_closed_at"]:
-    if c in df.columns:
-        df[c] = parse_dt(df[c])
-        print(f"Step: parsed/normalized date column: {c}")
-
-# 5) remove rows with no opened time (can’t use them)
-df = df.dropna(subset=["first_opened_at"])
-print(f"Step: dropped rows with missing first_opened_at -> rows: {len(df)}")
-
-# 6) fix time order issues: if resolved before opened, set resolved to NaT
-if {"first_opened_at","last_resolved_at"}.issubset(df.columns):
-    bad = df["last_resolved_at"] < df["first_opened_at"]
-    df.loc[bad, "last_resolved_at"] = pd.NaT
-    print(f"Step: corrected timestamp ordering -> set last_resolved_at to NaT for {bad.sum()} rows")
-
-# 7) rebuild resolution_hours from timestamps when possible
-if {"first_opened_at","last_resolved_at"}.issubset(df.columns):
-    dur = (df["last_resolved_at"] - df["first_opened_at"]).dt.total_seconds() / 3600.0
-    df["resolution_hours_from_time"] = dur
-    print("Step: computed resolution_hours_from_time from timestamps (hours)")
-
-# choose best available resolution_hours
-if "resolution_hours" in df.columns and "resolution_hours_from_time" in df.columns:
-    # prefer computed duration, else fall back to original
-    df["resolution_hours"] = np.where(
-        pd.notna(df["resolution_hours_from_time"]),
-        df["resolution_hours_from_time"],
-        pd.to_numeric(df["resolution_hours"], errors="coerce")
-    )
-    print("Step: merged resolution_hours_from_time into resolution_hours (prefer computed values)")
-elif "resolution_hours_from_time" in df.columns:
-    df["resolution_hours"] = df["resolution_hours_from_time"]
-    print("Step: using computed resolution_hours_from_time as resolution_hours")
-
-# 8) clip/clean bad durations: drop negatives, cap extreme outliers
-neg_before = (pd.to_numeric(df["resolution_hours"], errors="coerce") < 0).sum()
-df = df[(df["resolution_hours"].isna()) | (df["resolution_hours"] >= 0)]
-print(f"Step: dropped rows with negative resolution_hours -> removed {neg_before} rows; rows now: {len(df)}")
-q99 = df["resolution_hours"].quantile(0.99)
-df.loc[df["resolution_hours"] > q99, "resolution_hours"] = q99  # simple cap for coursework
-print(f"Step: capped resolution_hours at 99th percentile -> cap value: {q99:.2f} hours")
+    # (counts, if given, is a dict that gets rows-per-format added to it)
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s
+    # parse each distinct string once and broadcast back with the codes
+    codes, uniques = pd.factorize(s)
+    u = pd.Series(uniques, dtype=object).astype(str).str.strip()
+    parsed = np.full(len(u) + 1, np.datetime64("NaT"), dtype="datetime64[ns]")  # last slot = NaN rows
+    family = np.full(len(u) + 1, "unparsed", dtype=object)
+    family[-1] = "missing"
+    todo = np.ones(len(u), dtype=bool)
+
+    def take(name, mask, fmt):
+        if mask.any():
+            parsed[:-1][mask] = pd.to_datetime(u[mask], format=fmt, errors="coerce").to_numpy("datetime64[ns]")
+            family[:-1][mask] = name
+        todo[mask] = False
+
+    for name, pattern, fmt in DATE_FORMATS:
+        take(name, todo & u.str.fullmatch(pattern).to_numpy(dtype=bool), fmt)
+
+    parts = u.str.extract(f"^{SLASH_DATE}$")
+    slash = todo & parts[0].notna().to_numpy()
+    first = pd.to_numeric(parts[0]).to_numpy()
+    second = pd.to_numeric(parts[1]).to_numpy()
+    us = slash & (first <= 12) & (second > 12)
+    take("us", us, US_FORMAT)
+    ambiguous = slash & (first <= 12) & (second <= 12)
+    take("ambiguous", ambiguous, EU_FORMAT)
+    take("european", slash & ~us & ~ambiguous, EU_FORMAT)
+
+    # anything else that's still a valid ISO 8601 timestamp (no seconds, "T"
+    # without "Z", an offset, ...) goes through pandas' ISO parser as a last
+    # try; offsets are converted to UTC like the "Z" family. Only what fails
+    # here counts as unparsed.
+    if todo.any():
+        rest = pd.to_datetime(u[todo], format="ISO8601", errors="coerce", utc=True).dt.tz_localize(None)
+        ok = np.flatnonzero(todo)[rest.notna().to_numpy()]
+        parsed[ok] = rest.dropna().to_numpy("datetime64[ns]")
+        family[ok] = "iso_other"
+
+    if counts is not None:
+        per_row = pd.Series(family[codes]).value_counts()
+        for name, n in per_row.items():
+            counts[name] = counts.get(name, 0) + int(n)
+    return pd.Series(parsed[codes], index=s.index, name=s.name)
 
 # 9) keep just the columns we care about
 keep = [
@@ -92,19 +153,450 @@ keep = [
     "events_count",
     "resolution_hours",
 ]
-df = df[[c for c in keep if c in df.columns]]
-
-# 10) add labels (same as before)
-df["sla_breached"] = (df["resolution_hours"] > 24).astype("Int64")
-df["quick_resolution"] = (df["resolution_hours"] < 12).astype("Int64")
-print("Step: computed sla_breached (>24h) and quick_resolution (<12h) flags")
-
-priority_num = {"1 - Critical":1, "2 - High":2, "3 - Moderate":3, "4 - Low":4}
-df["priority_label"] = df["final_priority"].map(priority_num).astype("Int64")
-
-# 11) save
-df.to_csv(OUT, index=False)
-print(f"✅ cleaned file saved → {OUT}")
-print(f"rows: {len(df)}")
-print("Preview (first 3 rows):")
-print(df.head(3).to_string(index=False))
+
+LABELS = ["sla_breached", "quick_resolution", "priority_label"]
+CAP_QUANTILE = 0.99
+# fixed timestamp format for intermediate (spill) files, so a row's text doesn't
+# depend on which other rows happened to be written in the same chunk
+SPILL_DATE_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+# the clean CSV uses it too: the streaming / batch / incremental runs write
+# timestamps back as the spill text, and pandas' default would trim the
+# fraction to whatever the in-memory frame's values need (".500" vs ".500000")
+OUT_DATE_FORMAT = SPILL_DATE_FORMAT
+
+
+def _quiet(msg):
+    pass
+
+
+# --- cleaning steps -------------------------------------------------------
+# Everything from step 3 to step 9 only looks at one row at a time, so the same
+# functions work on the whole frame or on one chunk of it. Step 2 (dedup) and
+# the 99th percentile in step 8 need to see all rows - see run_streaming().
+
+def fix_categories(df, log=print):
+    for c in CATEGORY_COLS:
+        if c not in df.columns:
+            continue
+        before = df[c].nunique()
+        df[c], merged, nan_rows = canonicalise(df[c], CATEGORY_ALIASES.get(c))
+        variants = "; ".join(f"{canon!r} <- " + ", ".join(f"{v!r} ({n})" for v, n in sorted(vs.items()))
+                             for canon, vs in sorted(merged.items()))
+        log(f"Step: canonicalised {c} -> {before} distinct values to {df[c].nunique()}, "
+            f"{nan_rows} 'missing' strings to NaN" + (f" (merged: {variants})" if variants else ""))
+        if c == "final_priority":
+            unknown = int((df[c].notna() & ~df[c].isin(list(priority_map))).sum())
+            log(f"Step: normalised final_priority values (mapped variants to canonical labels) -> {unknown} unknown rows left as-is")
+    return df
+
+
+def parse_dates(df, log=print):
+    for c in DATE_COLS:
+        if c in df.columns:
+            counts = {}
+            df[c] = parse_dt(df[c], counts)
+            found = ", ".join(f"{k}={v}" for k, v in sorted(counts.items()))
+            log(f"Step: parsed/normalized date column: {c} ({found})")
+    return df
+
+
+def drop_unopened(df, log=print):
+    # 5) remove rows with no opened time (can’t use them)
+    df = df.dropna(subset=["first_opened_at"])
+    log(f"Step: dropped rows with missing first_opened_at -> rows: {len(df)}")
+    return df
+
+
+def fix_time_order(df, log=print):
+    # 6) fix time order issues: if resolved before opened, set resolved to NaT
+    if {"first_opened_at","last_resolved_at"}.issubset(df.columns):
+        bad = df["last_resolved_at"] < df["first_opened_at"]
+        df.loc[bad, "last_resolved_at"] = pd.NaT
+        log(f"Step: corrected timestamp ordering -> set last_resolved_at to NaT for {bad.sum()} rows")
+    return df
+
+
+def rebuild_durations(df, log=print):
+    # 7) rebuild resolution_hours from timestamps when possible
+    if {"first_opened_at","last_resolved_at"}.issubset(df.columns):
+        dur = (df["last_resolved_at"] - df["first_opened_at"]).dt.total_seconds() / 3600.0
+        df["resolution_hours_from_time"] = dur
+        log("Step: computed resolution_hours_from_time from timestamps (hours)")
+
+    # choose best available resolution_hours
+    if "resolution_hours" in df.columns and "resolution_hours_from_time" in df.columns:
+        # prefer computed duration, else fall back to original
+        df["resolution_hours"] = np.where(
+            pd.notna(df["resolution_hours_from_time"]),
+            df["resolution_hours_from_time"],
+            pd.to_numeric(df["resolution_hours"], errors="coerce")
+        )
+        log("Step: merged resolution_hours_from_time into resolution_hours (prefer computed values)")
+    elif "resolution_hours_from_time" in df.columns:
+        df["resolution_hours"] = df["resolution_hours_from_time"]
+        log("Step: using computed resolution_hours_from_time as resolution_hours")
+    return df
+
+
+def drop_negative_durations(df, log=print):
+    # 8a) clip/clean bad durations: drop negatives
+    neg_before = (pd.to_numeric(df["resolution_hours"], errors="coerce") < 0).sum()
+    df = df[(df["resolution_hours"].isna()) | (df["resolution_hours"] >= 0)]
+    log(f"Step: dropped rows with negative resolution_hours -> removed {neg_before} rows; rows now: {len(df)}")
+    return df
+
+
+def cap_durations(df, cap, log=print):
+    # 8b) cap extreme outliers
+    df.loc[df["resolution_hours"] > cap, "resolution_hours"] = cap  # simple cap for coursework
+    log(f"Step: capped resolution_hours at 99th percentile -> cap value: {cap:.2f} hours")
+    return df
+
+
+def keep_columns(df, log=print, counts=None):
+    # (counts, if given, is a dict that gets the events_count values set to NA added to it)
+    df = df[[c for c in keep if c in df.columns]]
+    types = clean_dtypes()
+    if "events_count" in df.columns:
+        # text when streamed from CSV; keep it a (small) integer column either way.
+        # Counts that don't fit it (fractional, or past Int16) become NA
+        events, bad = fit_integers(df["events_count"], types["events_count"])
+        df = df.assign(events_count=events)
+        if bad:
+            log(f"Step: events_count -> {bad} values that aren't whole numbers in {types['events_count']}'s range set to NA")
+        if counts is not None:
+            counts["events_count_na"] = counts.get("events_count_na", 0) + bad
+    for c in CATEGORY_COLS:
+        if c in df.columns and not isinstance(df[c].dtype, pd.CategoricalDtype):
+            df = df.assign(**{c: df[c].astype("category")})
+    return df
+
+
+def add_labels(df, log=print):
+    # 10) add labels (same as before)
+    types = clean_dtypes()
+    df["sla_breached"] = (df["resolution_hours"] > 24).astype(types["sla_breached"])
+    df["quick_resolution"] = (df["resolution_hours"] < 12).astype(types["quick_resolution"])
+    log("Step: computed sla_breached (>24h) and quick_resolution (<12h) flags")
+
+    priority_num = {"1 - Critical":1, "2 - High":2, "3 - Moderate":3, "4 - Low":4}
+    df["priority_label"] = df["final_priority"].map(priority_num).astype(types["priority_label"])
+    return df
+
+
+def clean_chunk(df, log=print, counts=None):
+    """Steps 3-9 (everything except dedup and the percentile cap)."""
+    df = fix_categories(df, log)
+    df = parse_dates(df, log)
+    df = drop_unopened(df, log)
+    df = fix_time_order(df, log)
+    df = rebuild_durations(df, log)
+    df = drop_negative_durations(df, log)
+    return keep_columns(df, log, counts)
+
+
+def finish_chunk(df, cap):
+    """Steps 8b and 10 on rows read back from a spill file."""
+    df["resolution_hours"] = pd.to_numeric(df["resolution_hours"])
+    df = cap_durations(df, cap, log=_quiet)
+    return add_labels(df, log=_quiet)
+
+
+# --- in-memory run (the original script) ---------------------------------
+
+def clean(df, dedup="exact", stages=None, log=print, quantiles="exact", rel_error=0.001):
+    """Steps 2-10 on a dirty frame already in memory; returns the clean frame.
+
+    The caller's frame is left as it was. Each step runs as a named stage of
+    `stages` (see stages.py) if one is given. The cap comes from the `quantiles`
+    engine (see sketches.py): "exact" is pandas' quantile, "sketch" is within
+    `rel_error` of it.
+    """
+    st = stages if stages is not None else Stages()
+    # the steps assign columns in place; a shallow copy keeps that off `df`
+    df = df.copy(deep=False)
+
+    # 2) drop duplicates (near duplicates only once the rows are normalised, below)
+    latest = LatestKeys.scan([df]) if dedup == "key" else None
+    dd = Dedup(dedup, latest)
+    df = st.run("dedup", lambda d: dd.raw(d)[0], df)
+    if dedup != "near":
+        log(f"Step: drop duplicates ({dedup}) -> removed {dd.removed} rows; rows: {len(df)}")
+
+    # 3) - 8a)
+    df = st.run("categories", fix_categories, df, log)
+    df = st.run("dates", parse_dates, df, log)
+    df = st.run("drop_unopened", drop_unopened, df, log)
+    df = st.run("reorder", fix_time_order, df, log)
+    df = st.run("durations", rebuild_durations, df, log)
+    df = st.run("drop_negative", drop_negative_durations, df, log)
+    if dedup == "near":
+        df = st.run("dedup_near", lambda d: dd.clean(d)[0], df)
+        log(f"Step: drop duplicates (near) -> removed {dd.removed} rows; rows: {len(df)}")
+
+    # 8b) cap at the 99th percentile of what's left
+    with st.stage("capping", len(df)) as rec:
+        q99 = make_quantiles(quantiles, rel_error).add(df["resolution_hours"]).quantile(CAP_QUANTILE)
+        df = cap_durations(df, q99, log)
+        rec["rows_out"] = len(df)
+
+    # 9) + 10) labels
+    return st.run("labels", lambda d: add_labels(keep_columns(d, log), log), df)
+
+
+def run(src=SRC, out=OUT, stages=None, cube=None, memory_report=False, dedup="exact", quantiles="exact",
+        rel_error=0.001, partitioned=None, partition_by="day", features=None, metrics=None):
+    """Load `src`, clean() it and save the result to `out`.
+
+    Also writes a partitioned store (see partitions.py) and a feature store
+    (see features.py) of it, if given their directories.
+    """
+    st = stages if stages is not None else Stages()
+
+    # 1) load
+    with st.stage("load") as rec:
+        df = read_table(src, dtype=LOAD_DTYPES)
+        rec["rows_out"] = len(df)
+    print(f"Loaded dirty file: {src}")
+    print(f"- starting rows: {len(df)}")
+
+    df = clean(df, dedup, st, quantiles=quantiles, rel_error=rel_error)
+    if memory_report:
+        print_memory_report(memory_table(df), len(df))
+
+    # 11) save
+    with st.stage("save", len(df)) as rec:
+        write_table(df, out, date_format=OUT_DATE_FORMAT)
+        rec["rows_out"] = len(df)
+    if partitioned:
+        with st.stage("partition", len(df)) as rec:
+            files = write_partitioned(df, partitioned, partition_by, os.path.splitext(out)[1], OUT_DATE_FORMAT)
+            rec["rows_out"] = len(df)
+        print(f"✅ partitioned by {partition_by} → {partitioned} ({len(files)} files)")
+    if features:
+        with st.stage("features", len(df)) as rec:
+            write_features(df, features)
+            rec["rows_out"] = len(df)
+        print(f"✅ feature arrays saved → {features}")
+    if cube is not None:
+        with st.stage("cube", len(df)):
+            cube.update(df)
+    if metrics is not None:
+        with st.stage("metrics", len(df)):
+            metrics.update(df)
+    print(f"✅ cleaned file saved → {out}")
+    print(f"rows: {len(df)}")
+    print("Preview (first 3 rows):")
+    print(df.head(3).assign(number=decode_numbers(df["number"].head(3))).to_string(index=False))
+    return df
+
+
+# --- streaming run --------------------------------------------------------
+
+def run_streaming(src=SRC, out=OUT, chunksize=100_000, rel_error=0.001, cube=None, dedup="exact", stages=None,
+                  quantiles="sketch", partitioned=None, partition_by="day", features=None, metrics=None):
+    """Clean `src` in chunks of `chunksize` rows so memory stays flat.
+
+    Pass 1 dedups (hash seen-set; key mode first scans just the number column
+    to find each incident's last row), runs steps 3-9 per chunk, spills the
+    uncapped rows next to `out` and feeds resolution_hours into a quantile engine
+    (a bounded-memory sketch by default, "exact" keeps every value).
+    Pass 2 re-reads the spill, applies the cap from it plus the labels
+    and appends to `out` (and to the `partitioned` store, the `features` store,
+    `cube` and `metrics`, if given - pass 1 counted the rows, so the feature
+    arrays are sized up front).
+    Per-chunk stages are summed in `stages`.
+    """
+    st = stages if stages is not None else Stages()
+    root, ext = os.path.splitext(out)
+    spill = root + ".part" + ext
+    sketch = make_quantiles(quantiles, rel_error)
+    rows_in = rows_kept = 0
+    counts = {}
+
+    print(f"Streaming dirty file: {src} (chunks of {chunksize} rows)")
+    latest = None
+    if dedup == "key":
+        with st.stage("key_scan") as rec:
+            latest = LatestKeys.scan(iter_table(src, chunksize, columns=[KEY], dtype=str))
+            rec["rows_out"] = len(latest.keys)
+        print(f"- scanned {len(latest.keys)} distinct incident numbers")
+    dd = Dedup(dedup, latest)
+    # read CSV as text so the duplicate hashes don't depend on how a particular
+    # chunk happened to infer its dtypes (parquet/feather are typed already)
+    spilled = TableWriter(spill, date_format=SPILL_DATE_FORMAT)
+    for i, chunk in enumerate(st.iterate("read", iter_table(src, chunksize, dtype=str)), start=1):
+        rows_in += len(chunk)
+
+        # 2) drop duplicates (across all chunks seen so far)
+        chunk = st.run("dedup", lambda d: dd.raw(d)[0], chunk)
+
+        # 3) - 9) (+ near duplicates, which need the cleaned columns)
+        chunk = st.run("clean", clean_chunk, chunk, log=_quiet, counts=counts)
+        if dedup == "near":
+            chunk = st.run("dedup_near", lambda d: dd.clean(d)[0], chunk)
+        rows_kept += len(chunk)
+        sketch.add(chunk["resolution_hours"])
+
+        with st.stage("spill", len(chunk)) as rec:
+            spilled.write(chunk)
+            rec["rows_out"] = len(chunk)
+        print(f"- chunk {i}: read {rows_in} rows so far, kept {rows_kept}")
+
+    print(f"- starting rows: {rows_in}")
+    print(f"Step: drop duplicates ({dedup}) -> removed {dd.removed} rows")
+    print(f"Step: steps 3-8 per chunk (dates, priorities, durations) -> rows: {rows_kept}")
+    if counts.get("events_count_na"):
+        print(f"Step: events_count -> {counts['events_count_na']} values that aren't whole numbers "
+              f"in {clean_dtypes()['events_count']}'s range set to NA")
+
+    spilled.close()
+
+    parts = PartitionedWriter(partitioned, partition_by, ext) if partitioned else None
+    feats = FeatureWriter(features, rows_kept) if features else None
+    if not rows_kept:
+        # nothing survived pass 1, still write a header-only output
+        write_table(pd.DataFrame(columns=keep + LABELS), out)
+        if parts is not None:
+            parts.write(pd.DataFrame(columns=keep + LABELS))
+    else:
+        # 8b) cap using the quantiles of every kept row
+        q99 = sketch.quantile(CAP_QUANTILE)
+        print(f"Step: capped resolution_hours at 99th percentile -> cap value: {q99:.2f} hours"
+              f" ({quantile_note(sketch)})")
+
+        with TableWriter(out, date_format=OUT_DATE_FORMAT) as writer:
+            for chunk in st.iterate("read_spill", iter_table(spill, chunksize, dtype=str)):
+                # 8b) + 10) labels
+                chunk = st.run("finish", finish_chunk, chunk, q99)
+                with st.stage("save", len(chunk)) as rec:
+                    writer.write(chunk)
+                    rec["rows_out"] = len(chunk)
+                if parts is not None:
+                    with st.stage("partition", len(chunk)) as rec:
+                        parts.write(chunk)
+                        rec["rows_out"] = len(chunk)
+                if feats is not None:
+                    with st.stage("features", len(chunk)) as rec:
+                        feats.write(chunk)
+                        rec["rows_out"] = len(chunk)
+                if cube is not None:
+                    with st.stage("cube", len(chunk)):
+                        cube.update(chunk)
+                if metrics is not None:
+                    with st.stage("metrics", len(chunk)):
+                        metrics.update(chunk)
+        print("Step: computed sla_breached (>24h) and quick_resolution (<12h) flags")
+    if parts is not None:
+        parts.close()
+        print(f"✅ partitioned by {partition_by} → {partitioned} ({len(parts.files)} files)")
+    if feats is not None:
+        feats.close()
+        print(f"✅ feature arrays saved → {features}")
+    if os.path.exists(spill):
+        os.remove(spill)
+
+    # 11) save
+    print(f"✅ cleaned file saved → {out}")
+    print(f"rows: {rows_kept}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Clean the dirty incidents export.")
+    ap.add_argument("--src", default=SRC, help="dirty input file")
+    ap.add_argument("--out", default=OUT, help="cleaned output file")
+    ap.add_argument("--chunksize", type=int, default=0,
+                    help="stream the input in chunks of this many rows (0 = load it all at once)")
+    ap.add_argument("--sketch-error", type=float, default=0.001,
+                    help="relative error of the 99th percentile sketch")
+    ap.add_argument("--quantiles", choices=["exact", "sketch"],
+                    help="how the 99th percentile cap is computed (default: exact in memory, "
+                         "sketch when streaming / batch / incremental)")
+    ap.add_argument("--incremental", metavar="STORE",
+                    help="only clean rows added to --src since the last run, into this store directory")
+    ap.add_argument("--rebuild", action="store_true",
+                    help="with --incremental: wipe the store and re-clean the whole export")
+    ap.add_argument("--timings", metavar="JSON",
+                    help="write wall seconds per stage (in-memory or streaming run) to this file")
+    ap.add_argument("--stage-log", metavar="JSONL",
+                    help="write one JSON line per stage: wall/CPU seconds, rows in/out, peak memory")
+    ap.add_argument("--trace-memory", action="store_true",
+                    help="measure each stage's peak memory with tracemalloc instead of peak RSS (slower)")
+    ap.add_argument("--profile", metavar="DIR",
+                    help="run every stage under cProfile and dump DIR/<stage>.prof")
+    ap.add_argument("--flame", action="store_true",
+                    help="print the stage table and the functions each stage spends its time in")
+    ap.add_argument("--batch", metavar="GLOB_OR_DIR",
+                    help="clean every dirty file matching this glob/directory in parallel into --out")
+    ap.add_argument("--workers", type=int, default=os.cpu_count(),
+                    help="with --batch: number of worker processes")
+    ap.add_argument("--cube", metavar="JSON",
+                    help="also write a rollup cube of the clean rows here (see cube.py)")
+    ap.add_argument("--dedup", choices=MODES, default="exact",
+                    help="step 2: exact copies, latest row per incident number (key), or rows equal "
+                         "after normalising timestamps/text (near)")
+    ap.add_argument("--partitioned", metavar="DIR",
+                    help="also write the clean rows partitioned by first_opened_at into DIR, with a min/max "
+                         "manifest for partitions.py queries (in-memory or streaming run)")
+    ap.add_argument("--partition-by", choices=GRANULARITY, default="day",
+                    help="with --partitioned: one partition per day or per month")
+    ap.add_argument("--features", metavar="DIR",
+                    help="also write model-ready feature/target arrays (memory-mapped .npy + schema.json, "
+                         "see features.py) into DIR (in-memory or streaming run)")
+    ap.add_argument("--metrics", metavar="JSON",
+                    help="also write per-day counters and 7/30/90-day rolling windows of the clean rows "
+                         "here (see metrics.py)")
+    ap.add_argument("--memory-report", action="store_true",
+                    help="print bytes per column of the clean frame, default vs compact dtypes (in-memory run)")
+    args = ap.parse_args()
+
+    cube = RollupCube() if args.cube else None
+    metrics = RollingMetrics() if args.metrics else None
+    stages = Stages(trace_memory=args.trace_memory, profile=bool(args.profile or args.flame))
+
+    if args.batch:
+        from batch import run_batch
+        run_batch(args.batch, args.out, args.workers, args.chunksize or 100_000, args.sketch_error, cube,
+                  args.dedup, args.quantiles or "sketch")
+        if metrics is not None:
+            # the workers don't return their rows; read the merged output back
+            for chunk in iter_table(args.out, args.chunksize or 100_000):
+                metrics.update(chunk)
+    elif args.incremental:
+        from incremental import run_incremental
+        # the store keeps its own cube up to date; --cube just gets a copy of it
+        store_cube = run_incremental(args.src, args.incremental, args.chunksize or 100_000,
+                                     args.sketch_error, rebuild=args.rebuild, dedup=args.dedup,
+                                     quantiles=args.quantiles or "sketch")
+        cube = store_cube if cube is not None else None
+        # likewise the store's metrics
+        metrics = RollingMetrics.load(os.path.join(args.incremental, "_metrics.json")) if metrics is not None else None
+    elif args.chunksize > 0:
+        run_streaming(args.src, args.out, args.chunksize, args.sketch_error, cube, args.dedup, stages,
+                      args.quantiles or "sketch", args.partitioned, args.partition_by, args.features, metrics)
+    else:
+        run(args.src, args.out, stages, cube, args.memory_report, args.dedup, args.quantiles or "exact",
+            args.sketch_error, args.partitioned, args.partition_by, args.features, metrics)
+
+    if stages.records:
+        if args.timings:
+            with open(args.timings, "w", encoding="utf-8") as f:
+                json.dump(stages.timings(), f, indent=2)
+        if args.stage_log:
+            stages.write_jsonl(args.stage_log)
+        if args.profile:
+            stages.dump_profiles(args.profile)
+        if args.flame:
+            print()
+            stages.report()
+            stages.flame_summary()
+    if cube is not None:
+        cube.save(args.cube)
+        print(f"✅ rollup cube saved → {args.cube} ({len(cube.cells)} cells)")
+    if metrics is not None:
+        metrics.save(args.metrics)
+        print(f"✅ rolling metrics saved → {args.metrics} ({metrics.days} days, {len(metrics.keys)} series)")
+
+
+if __name__ == "__main__":
+    main()
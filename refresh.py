@@ -0,0 +1,279 @@
+"""
+Full refresh (generate -> dirty -> clean -> summary + figures -> slides), skipping unchanged stages.
+
+Each stage is one of the scripts, run as a child process. Its fingerprint is a
+hash of:
+ - its command line (rows, seed, --now, corruption rate overrides, dedup mode, ...)
+ - the source of the script and of every repo module it imports, so constants
+   like CORRUPTION_RATES or CAP_QUANTILE are covered by the code hash
+ - the content of its input files
+Outputs are kept in a content-addressed cache (data/.refresh_cache/<fingerprint>/).
+A stage whose fingerprint is cached isn't run: its outputs are left alone if
+they're already the cached ones, or copied back from the cache otherwise.
+Input files are only re-hashed when their size or mtime changed, so an unchanged
+rerun is a few stat() calls and hashes of the .py files.
+
+The DAG comes from the files: a stage waits for whichever stages write its
+inputs, and stages that don't depend on each other (summary and figures) run
+at the same time. The cache keeps the most recently used entries within
+--cache-size MB and --cache-entries entries.
+
+    python refresh.py                           # everything, 2000 rows
+    python refresh.py --rows 50000 --rate invalid_date=0.05
+    python refresh.py --force                   # run every stage anyway
+"""
+
+import argparse
+import ast
+import glob
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+BASE = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join("data", ".refresh_cache")
+INDEX = "index.json"
+NOW = "2025-01-01T00:00:00"  # fixed so the generated rows (and everything after them) can be cached
+
+AGG = "data/incidents_aggregated_5k.csv"
+DIRTY = "data/incidents_dirty.csv"
+CLEAN = "data/incidents_clean.csv"
+STAGE_LOG = "data/incidents_stage_log.jsonl"
+STATS = "data/incidents_stats.json"
+FIGURES = "data/figures/*.png"
+FIG_MD = "data/figures/FIGURES.md"
+DECK = "CW1_presentation_[YourName]_[YourID].pptx"
+
+
+class Stage:
+    def __init__(self, name, args, inputs, outputs):
+        self.name = name
+        self.args = args          # script + arguments, run with this Python from BASE
+        self.inputs = inputs      # files (or globs) read
+        self.outputs = outputs    # files (or globs) written
+        self.upstream = set()
+
+
+def build_stages(p):
+    """The refresh DAG for the parsed arguments `p`."""
+    rates = [a for r in p.rate for a in ("--rate", r)]
+    quantiles = ["--quantiles", p.quantiles] if p.quantiles else []
+    stages = [
+        Stage("make_dataset", ["make_dataset.py", "--rows", str(p.rows), "--seed", str(p.seed), "--now", p.now,
+                               "--out", AGG], [], [AGG]),
+        Stage("dirty_up", ["dirty_up.py", "--src", AGG, "--dst", DIRTY, "--seed", str(p.seed)] + rates,
+              [AGG], [DIRTY]),
+        Stage("pipeline", ["pipeline.py", "--src", DIRTY, "--out", CLEAN, "--dedup", p.dedup,
+                           "--stage-log", STAGE_LOG] + quantiles, [DIRTY], [CLEAN, STAGE_LOG]),
+        Stage("summary", ["summary.py", "--src", CLEAN, "--stats-json", STATS, "--stage-log", STAGE_LOG],
+              [CLEAN, STAGE_LOG], [STATS]),
+        Stage("figures", ["make_more_visuals.py", "--clean", CLEAN, "--dirty", DIRTY], [CLEAN, DIRTY], [FIGURES]),
+        # the deck also shows pipeline.py's code, so it's an input as well as the numbers and figures
+        Stage("presentation", ["generate_presentation.py", "--out", DECK], [STATS, FIGURES, FIG_MD, "pipeline.py"],
+              [DECK, "CW1_speaker_script_[YourName]_[YourID].txt", "CW1_slide_notes_[YourName]_[YourID].md",
+               "SUBMISSION_CHECKLIST.md"]),
+    ]
+    writers = {out: s.name for s in stages for out in s.outputs}
+    for s in stages:
+        s.upstream = {writers[i] for i in s.inputs if i in writers}
+    return {s.name: s for s in stages}
+
+
+def _files(patterns):
+    # only "*" makes a pattern a glob; the deck's file names have literal [brackets]
+    out = []
+    for pat in patterns:
+        if "*" in pat:
+            out += sorted(os.path.relpath(f, BASE) for f in glob.glob(os.path.join(BASE, pat)))
+        elif os.path.exists(os.path.join(BASE, pat)):
+            out.append(pat)
+    return out
+
+
+def local_modules(script):
+    """`script` and every module of this repo it imports, directly or not."""
+    todo, seen = [script], []
+    while todo:
+        path = todo.pop()
+        if path in seen:
+            continue
+        seen.append(path)
+        with open(os.path.join(BASE, path), "r", encoding="utf-8") as f:
+            tree = ast.parse(f.read(), path)
+        for node in ast.walk(tree):
+            names = [a.name for a in node.names] if isinstance(node, ast.Import) else \
+                [node.module] if isinstance(node, ast.ImportFrom) and node.module and not node.level else []
+            for name in names:
+                mod = name.split(".")[0] + ".py"
+                if os.path.exists(os.path.join(BASE, mod)):
+                    todo.append(mod)
+    return sorted(seen)
+
+
+class Cache:
+    """Fingerprinted stage outputs under CACHE_DIR, plus a stat cache of file hashes."""
+
+    def __init__(self, root, max_bytes, max_entries):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.index = {"entries": {}, "files": {}}
+        path = os.path.join(root, INDEX)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.index = json.load(f)
+
+    def file_hash(self, rel):
+        """sha1 of a file under BASE; only re-read when its size or mtime changed."""
+        st = os.stat(os.path.join(BASE, rel))
+        known = self.index["files"].get(rel)
+        if known and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+            return known[2]
+        h = hashlib.sha1()
+        with open(os.path.join(BASE, rel), "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        self.index["files"][rel] = [st.st_size, st.st_mtime_ns, h.hexdigest()]
+        return h.hexdigest()
+
+    def fingerprint(self, stage):
+        parts = {
+            "stage": stage.name,
+            "args": stage.args,
+            "python": sys.version,
+            "code": {m: self.file_hash(m) for m in local_modules(stage.args[0])},
+            "inputs": {f: self.file_hash(f) for f in _files(stage.inputs)},
+        }
+        return hashlib.sha1(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def lookup(self, fp):
+        """"current" if the cached outputs are in place, "restored" after copying them back, else None."""
+        entry = self.index["entries"].get(fp)
+        if entry is None:
+            return None
+        entry["used"] = time.time()
+        stale = [rel for rel, sha in entry["outputs"].items()
+                 if not os.path.exists(os.path.join(BASE, rel)) or self.file_hash(rel) != sha]
+        for rel in stale:
+            dst = os.path.join(BASE, rel)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.copyfile(os.path.join(self.root, fp, rel), dst)
+            self.file_hash(rel)
+        return "restored" if stale else "current"
+
+    def store(self, fp, stage):
+        # copies, not hard links: the scripts rewrite their outputs in place
+        entry = {"stage": stage.name, "outputs": {}, "bytes": 0, "used": time.time()}
+        for rel in _files(stage.outputs):
+            dst = os.path.join(self.root, fp, rel)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.copyfile(os.path.join(BASE, rel), dst)
+            entry["outputs"][rel] = self.file_hash(rel)
+            entry["bytes"] += os.path.getsize(dst)
+        self.index["entries"][fp] = entry
+
+    def evict(self, keep=()):
+        """Drop least recently used entries (except `keep`) until under both limits."""
+        entries = self.index["entries"]
+        total = sum(e["bytes"] for e in entries.values())
+        evicted = []
+        for fp in sorted(entries, key=lambda k: entries[k]["used"]):
+            if total <= self.max_bytes and len(entries) <= self.max_entries:
+                break
+            if fp in keep:
+                continue
+            total -= entries.pop(fp)["bytes"]
+            shutil.rmtree(os.path.join(self.root, fp), ignore_errors=True)
+            evicted.append(fp)
+        return evicted
+
+    def save(self):
+        os.makedirs(self.root, exist_ok=True)
+        # forget hashes of files that no longer exist
+        self.index["files"] = {k: v for k, v in self.index["files"].items() if os.path.exists(os.path.join(BASE, k))}
+        tmp = os.path.join(self.root, INDEX + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.index, f, indent=1, sort_keys=True)
+        os.replace(tmp, os.path.join(self.root, INDEX))
+
+
+def run_stage(stage):
+    """Run one stage's script -> wall seconds; raises with the end of stderr if it fails."""
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable] + stage.args, cwd=BASE, stdout=subprocess.DEVNULL,
+                          stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{' '.join(stage.args)} failed ({proc.returncode}):\n"
+                           f"{proc.stderr.decode(errors='replace')[-2000:]}")
+    return time.perf_counter() - t0
+
+
+def refresh(stages, cache, jobs=2, force=False):
+    """Bring every stage up to date, upstream first; returns {stage: what happened}."""
+    done, status, used = set(), {}, set()
+    running = {}
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        while len(done) < len(stages):
+            for s in stages.values():
+                if s.name in done or s.name in running.values() or not s.upstream <= done:
+                    continue
+                fp = cache.fingerprint(s)
+                used.add(fp)
+                hit = None if force else cache.lookup(fp)
+                if hit:
+                    done.add(s.name)
+                    status[s.name] = hit
+                    print(f"- {s.name:<13} {hit}")
+                else:
+                    running[pool.submit(run_stage, s)] = s.name
+            if len(done) == len(stages):
+                break
+            if not running:
+                raise RuntimeError("stages left that can't run: " + ", ".join(sorted(set(stages) - done)))
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                s = stages[running.pop(fut)]
+                secs = fut.result()
+                fp = cache.fingerprint(s)
+                cache.store(fp, s)
+                done.add(s.name)
+                status[s.name] = f"ran in {secs:.2f}s"
+                print(f"- {s.name:<13} {status[s.name]}")
+    evicted = cache.evict(keep=used)
+    if evicted:
+        print(f"- evicted {len(evicted)} old cache entr{'y' if len(evicted) == 1 else 'ies'}")
+    return status
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Run the whole pipeline, reusing cached outputs of unchanged stages.")
+    ap.add_argument("--rows", type=int, default=2000)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--now", default=NOW, help="make_dataset.py --now (fixed, so its output can be cached)")
+    ap.add_argument("--rate", action="append", default=[], metavar="NAME=FRACTION",
+                    help="dirty_up.py corruption rate override (repeatable)")
+    ap.add_argument("--dedup", default="exact", help="pipeline.py --dedup")
+    ap.add_argument("--quantiles", choices=["exact", "sketch"], help="pipeline.py --quantiles")
+    ap.add_argument("--jobs", type=int, default=2, help="stages run at the same time, at most")
+    ap.add_argument("--force", action="store_true", help="run every stage even if it's cached")
+    ap.add_argument("--cache-size", type=float, default=1024, help="MB of cached outputs to keep")
+    ap.add_argument("--cache-entries", type=int, default=64, help="cached stage runs to keep")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    cache = Cache(os.path.join(BASE, CACHE_DIR), args.cache_size * 2**20, args.cache_entries)
+    try:
+        status = refresh(build_stages(args), cache, args.jobs, args.force)
+    finally:
+        cache.save()
+    ran = sum(v.startswith("ran") for v in status.values())
+    print(f"✅ {ran} stage(s) ran, {len(status) - ran} cached ({time.perf_counter() - t0:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
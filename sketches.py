@@ -0,0 +1,240 @@
+"""
+Small mergeable quantile sketch used when the data doesn't fit in memory.
+
+It is a log-bucket histogram (the DDSketch idea): every value lands in a bucket
+whose width is a fixed fraction of the value, so any quantile we read back is
+within `rel_error` of the true one. Buckets are plain integer counts, which
+means two sketches merge by adding counts - the result is exactly the same as
+sketching the concatenated data, whatever order the pieces arrive in.
+
+ExactQuantiles has the same interface but keeps every value, for when the data
+fits in memory and the answer has to match pandas' quantile() exactly. Code
+that needs quantiles takes an engine name ("exact" / "sketch") and calls
+make_quantiles(); quantiles_from_dict() reads either back.
+"""
+
+import math
+
+import numpy as np
+
+
+class QuantileSketch:
+    def __init__(self, rel_error=0.001):
+        if not 0 < rel_error < 1:
+            raise ValueError("rel_error must be between 0 and 1")
+        self.rel_error = rel_error
+        self.gamma = (1 + rel_error) / (1 - rel_error)
+        self._log_gamma = math.log(self.gamma)
+        self.pos = {}  # bucket key -> count for values > 0
+        self.neg = {}  # bucket key -> count for values < 0 (keyed on -value)
+        self.zeros = 0
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _keys(self, v):
+        return np.ceil(np.log(v) / self._log_gamma).astype(np.int64)
+
+    def _bump(self, store, values, sign=1):
+        if len(values) == 0:
+            return
+        keys, counts = np.unique(self._keys(values), return_counts=True)
+        for k, c in zip(keys.tolist(), counts.tolist()):
+            left = store.get(k, 0) + sign * c
+            if left:
+                store[k] = left
+            else:
+                store.pop(k, None)
+
+    def add(self, values):
+        """Add an array/Series of values (NaN is ignored)."""
+        v = np.asarray(values, dtype="float64")
+        v = v[~np.isnan(v)]
+        if len(v) == 0:
+            return self
+        self._bump(self.pos, v[v > 0])
+        self._bump(self.neg, -v[v < 0])
+        self.zeros += int((v == 0).sum())
+        self.count += len(v)
+        self.min = min(self.min, float(v.min()))
+        self.max = max(self.max, float(v.max()))
+        return self
+
+    def remove(self, values):
+        """Take values back out (they must have been added before).
+
+        min/max are left alone, so they may be slightly loose afterwards.
+        """
+        v = np.asarray(values, dtype="float64")
+        v = v[~np.isnan(v)]
+        self._bump(self.pos, v[v > 0], sign=-1)
+        self._bump(self.neg, -v[v < 0], sign=-1)
+        self.zeros -= int((v == 0).sum())
+        self.count -= len(v)
+        return self
+
+    def merge(self, other):
+        if not isinstance(other, QuantileSketch) or other.gamma != self.gamma:
+            raise ValueError("can only merge sketches with the same rel_error")
+        for store, theirs in ((self.pos, other.pos), (self.neg, other.neg)):
+            for k, c in theirs.items():
+                store[k] = store.get(k, 0) + c
+        self.zeros += other.zeros
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def _value(self, key):
+        # middle of the bucket, which is what gives the relative error bound
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def quantile(self, q):
+        """Approximate q-quantile (same rank convention as pandas, no interpolation)."""
+        if self.count == 0:
+            return math.nan
+        rank = q * (self.count - 1)
+        seen = 0
+        for k in sorted(self.neg, reverse=True):
+            seen += self.neg[k]
+            if seen > rank:
+                return min(max(-self._value(k), self.min), self.max)
+        seen += self.zeros
+        if seen > rank:
+            return 0.0
+        for k in sorted(self.pos):
+            seen += self.pos[k]
+            if seen > rank:
+                return min(max(self._value(k), self.min), self.max)
+        return self.max
+
+    def buckets(self):
+        """(values, counts) of every non-empty bucket in ascending order (for histograms)."""
+        neg = sorted(self.neg, reverse=True)
+        pos = sorted(self.pos)
+        values = ([-self._value(k) for k in neg] + ([0.0] if self.zeros else [])
+                  + [self._value(k) for k in pos])
+        counts = [self.neg[k] for k in neg] + ([self.zeros] if self.zeros else []) + [self.pos[k] for k in pos]
+        values = np.asarray(values, dtype="float64")
+        if self.count:
+            values = values.clip(self.min, self.max)
+        return values, np.asarray(counts, dtype=np.int64)
+
+    def to_dict(self):
+        return {
+            "rel_error": self.rel_error,
+            "pos": {str(k): c for k, c in self.pos.items()},
+            "neg": {str(k): c for k, c in self.neg.items()},
+            "zeros": self.zeros,
+            "count": self.count,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        sk = cls(d["rel_error"])
+        sk.pos = {int(k): c for k, c in d["pos"].items()}
+        sk.neg = {int(k): c for k, c in d["neg"].items()}
+        sk.zeros = d["zeros"]
+        sk.count = d["count"]
+        if d["min"] is not None:
+            sk.min = d["min"]
+            sk.max = d["max"]
+        return sk
+
+
+class ExactQuantiles:
+    """Every value, sorted on demand; quantile() is pandas' (linear interpolation)."""
+
+    rel_error = 0.0
+
+    def __init__(self, rel_error=None):
+        self._parts = []
+        self._sorted = np.empty(0, dtype="float64")
+
+    def _values(self):
+        if self._parts:
+            self._sorted = np.sort(np.concatenate([self._sorted] + self._parts))
+            self._parts = []
+        return self._sorted
+
+    @property
+    def count(self):
+        return len(self._sorted) + sum(len(p) for p in self._parts)
+
+    @property
+    def min(self):
+        v = self._values()
+        return float(v[0]) if len(v) else math.inf
+
+    @property
+    def max(self):
+        v = self._values()
+        return float(v[-1]) if len(v) else -math.inf
+
+    def add(self, values):
+        """Add an array/Series of values (NaN is ignored)."""
+        v = np.asarray(values, dtype="float64")
+        v = v[~np.isnan(v)]
+        if len(v):
+            self._parts.append(v)
+        return self
+
+    def remove(self, values):
+        """Take values back out (they must have been added before)."""
+        r = np.sort(np.asarray(values, dtype="float64"))
+        r = r[~np.isnan(r)]
+        if not len(r):
+            return self
+        v = self._values()
+        uniq, counts = np.unique(r, return_counts=True)
+        # the first `count` copies of each value, which sit next to each other
+        first = np.repeat(np.searchsorted(v, uniq) - (np.cumsum(counts) - counts), counts)
+        self._sorted = np.delete(v, first + np.arange(len(r)))
+        return self
+
+    def merge(self, other):
+        if not isinstance(other, ExactQuantiles):
+            raise ValueError("can only merge exact quantiles with exact quantiles")
+        self._parts.append(other._values())
+        return self
+
+    def quantile(self, q):
+        v = self._values()
+        return float(np.quantile(v, q)) if len(v) else math.nan
+
+    def buckets(self):
+        values, counts = np.unique(self._values(), return_counts=True)
+        return values, counts.astype(np.int64)
+
+    def to_sketch(self, rel_error=0.001):
+        """The same values in a QuantileSketch, for saving state that has to stay small."""
+        return QuantileSketch(rel_error).add(self._values())
+
+    def to_dict(self):
+        return {"engine": "exact", "values": self._values().tolist()}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls().add(d["values"])
+
+
+ENGINES = {"sketch": QuantileSketch, "exact": ExactQuantiles}
+
+
+def make_quantiles(engine="sketch", rel_error=0.001):
+    """An empty quantile engine by name (rel_error only matters to the sketch)."""
+    if engine not in ENGINES:
+        raise ValueError(f"unknown quantile engine '{engine}' (one of {', '.join(ENGINES)})")
+    return ENGINES[engine](rel_error)
+
+
+def quantiles_from_dict(d):
+    """Read back what either engine's to_dict() wrote (sketch dicts have no "engine")."""
+    return ENGINES[d.get("engine", "sketch")].from_dict(d)
+
+
+def quantile_note(q):
+    """How precise q's quantiles are, for log lines."""
+    return "exact" if isinstance(q, ExactQuantiles) else f"sketch, ±{q.rel_error:.1%}"
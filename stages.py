@@ -0,0 +1,145 @@
+"""
+Named pipeline stages with one instrumentation surface.
+
+pipeline.py runs each of its steps through a Stages object, which records per
+stage:
+ - wall and CPU seconds
+ - rows in and rows out
+ - peak memory growth: with trace_memory, the tracemalloc peak above what was
+   allocated when the stage started (counts numpy/pandas buffers too, but slows
+   the run down); otherwise how much the process' peak RSS grew (free, but
+   coarse - it only moves when a stage sets a new high-water mark)
+Stages that run once per chunk are summed, with `calls` counting them.
+
+The records are written as JSON lines (one object per stage). With profile on,
+every stage also runs under cProfile: the stats can be dumped per stage
+(DIR/<stage>.prof, for pstats / snakeviz) or printed as a short flame summary
+of where each stage spends its own time.
+"""
+
+import cProfile
+import contextlib
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _peak_rss():
+    if resource is None:
+        return None
+    # ru_maxrss is KB on Linux, bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+class Stages:
+    def __init__(self, trace_memory=False, profile=False):
+        self.trace_memory = trace_memory
+        self.profile = profile
+        self.records = {}   # stage name -> summed record, in first-run order
+        self.profiles = {}  # stage name -> pstats.Stats
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextlib.contextmanager
+    def stage(self, name, rows_in=None):
+        """Time the block as stage `name`; set rec["rows_out"] inside it."""
+        rec = {"rows_in": rows_in, "rows_out": None}
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            mem0 = tracemalloc.get_traced_memory()[0]
+        else:
+            mem0 = _peak_rss()
+        prof = cProfile.Profile() if self.profile else None
+        wall0, cpu0 = time.perf_counter(), time.process_time()
+        if prof:
+            prof.enable()
+        try:
+            yield rec
+        finally:
+            if prof:
+                prof.disable()
+            wall, cpu = time.perf_counter() - wall0, time.process_time() - cpu0
+            if self.trace_memory:
+                mem = tracemalloc.get_traced_memory()[1] - mem0
+            else:
+                mem = None if mem0 is None else _peak_rss() - mem0
+            self._add(name, wall, cpu, rec, mem, prof)
+
+    def _add(self, name, wall, cpu, rec, mem, prof):
+        total = self.records.setdefault(name, {
+            "stage": name, "calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "rows_in": None, "rows_out": None,
+            "mem_peak_mb": None, "mem_source": "tracemalloc" if self.trace_memory else "rss",
+        })
+        total["calls"] += 1
+        total["wall_s"] += wall
+        total["cpu_s"] += cpu
+        for k in ("rows_in", "rows_out"):
+            if rec[k] is not None:
+                total[k] = (total[k] or 0) + rec[k]
+        if mem is not None:
+            total["mem_peak_mb"] = max(total["mem_peak_mb"] or 0.0, mem / 2**20)
+        if prof is not None:
+            if name in self.profiles:
+                self.profiles[name].add(prof)
+            else:
+                self.profiles[name] = pstats.Stats(prof)
+
+    def run(self, name, fn, df, *args, **kwargs):
+        """fn(df, *args, **kwargs) as stage `name`, with the rows in/out filled in."""
+        with self.stage(name, len(df)) as rec:
+            out = fn(df, *args, **kwargs)
+            rec["rows_out"] = len(out)
+        return out
+
+    def iterate(self, name, chunks):
+        """Yield from `chunks`, timing the production of each one as stage `name`."""
+        chunks = iter(chunks)
+        while True:
+            with self.stage(name) as rec:
+                chunk = next(chunks, None)
+                rec["rows_out"] = 0 if chunk is None else len(chunk)
+            if chunk is None:
+                return
+            yield chunk
+
+    # --- output ---------------------------------------------------------------
+
+    def timings(self):
+        """{stage: wall seconds}, the format pipeline.py --timings has always written."""
+        return {name: r["wall_s"] for name, r in self.records.items()}
+
+    def write_jsonl(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for r in self.records.values():
+                f.write(json.dumps(r) + "\n")
+
+    def dump_profiles(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for name, stats in self.profiles.items():
+            stats.dump_stats(os.path.join(directory, f"{name}.prof"))
+
+    def report(self, log=print):
+        log(f"{'stage':<16}{'calls':>6}{'wall s':>9}{'cpu s':>9}{'rows in':>11}{'rows out':>11}{'peak MB':>9}")
+        for r in self.records.values():
+            rows = [f"{r[k]:>11}" if r[k] is not None else f"{'-':>11}" for k in ("rows_in", "rows_out")]
+            mem = f"{r['mem_peak_mb']:>9.1f}" if r["mem_peak_mb"] is not None else f"{'-':>9}"
+            log(f"{r['stage']:<16}{r['calls']:>6}{r['wall_s']:>9.3f}{r['cpu_s']:>9.3f}{''.join(rows)}{mem}")
+
+    def flame_summary(self, top=8, log=print):
+        """Per stage, the functions with the most self time (needs profile=True)."""
+        for name, stats in self.profiles.items():
+            entries = sorted(stats.stats.items(), key=lambda kv: -kv[1][2])
+            total = sum(v[2] for _, v in entries) or 1.0
+            log(f"\n[{name}] {self.records[name]['wall_s']:.3f}s wall")
+            for (path, line, func), (_, calls, tottime, cumtime, _) in entries[:top]:
+                where = func if path == "~" else f"{func} ({os.path.basename(path)}:{line})"
+                bar = "#" * max(1, round(30 * tottime / total))
+                log(f"  {tottime / total:>5.1%} {bar:<30} {where}  [{calls} calls, {cumtime:.3f}s cum]")
@@ -0,0 +1,285 @@
+"""
+Read/write helpers shared by every stage (make_dataset -> dirty_up -> pipeline -> summary).
+
+The file extension picks the format:
+ - .csv                 plain text (the default, and what you'd export/share)
+ - .parquet / .pq       columnar, keeps datetime / categorical / Int64 columns typed
+ - .feather / .arrow    Arrow IPC, same typing as parquet but faster to read back
+
+Parquet and Feather need pyarrow; CSV works with plain pandas.
+
+clean_dtypes() is the compact in-memory schema of the cleaned table. Pass it as
+`dtype=` when reading and the columns come out typed straight from the reader
+(the incident number is read as text and encoded per chunk); writing turns the
+number back into "INC..." text, so files look the same either way.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+FORMATS = {
+    ".csv": "csv",
+    ".parquet": "parquet",
+    ".pq": "parquet",
+    ".feather": "feather",
+    ".arrow": "feather",
+}
+
+# low-cardinality text columns stored as categoricals in the columnar formats
+CATEGORY_COLS = ["final_priority", "final_state", "assignment_group_mode"]
+
+NUMBER_PREFIX = "INC"
+# "INC" + digits without a leading zero, small enough for a uint32, so the
+# integer turns back into exactly the same text
+NUMBER_PATTERN = NUMBER_PREFIX + r"[1-9]\d{0,8}"
+
+
+def clean_dtypes(float32=False):
+    """Compact dtypes for the cleaned table (the dates are parsed separately)."""
+    return {
+        "number": "UInt32",            # INC100123 -> 100123
+        "final_priority": "category",
+        "final_state": "category",
+        "assignment_group_mode": "category",
+        "events_count": "Int16",
+        "resolution_hours": "float32" if float32 else "float64",
+        "sla_breached": "Int8",
+        "quick_resolution": "Int8",
+        "priority_label": "Int8",
+    }
+
+
+def fit_integers(s, dtype):
+    """`s` as the nullable integer `dtype`, with values that aren't whole numbers in its range as NA.
+
+    Returns (series, how many values were set to NA) - a plain astype() raises
+    on the first out-of-range or fractional value instead.
+    """
+    x = pd.to_numeric(s, errors="coerce").astype("float64")
+    info = np.iinfo(pd.api.types.pandas_dtype(dtype).numpy_dtype)
+    bad = x.notna() & ((x % 1 != 0) | (x < info.min) | (x > info.max))
+    return x.mask(bad).astype(dtype), int(bad.sum())
+
+
+def encode_numbers(s):
+    """"INC100123" -> 100123 as UInt32, or `s` unchanged if any number has another shape."""
+    if pd.api.types.is_integer_dtype(s):
+        return s
+    ok = s.isna() | s.astype(object).astype(str).str.fullmatch(NUMBER_PATTERN)
+    if not ok.all():
+        return s
+    digits = s.astype(object).str.slice(len(NUMBER_PREFIX))
+    return pd.to_numeric(digits).astype("UInt32")
+
+
+def decode_numbers(s):
+    """Inverse of encode_numbers (text columns pass through)."""
+    if not pd.api.types.is_integer_dtype(s):
+        return s
+    return (NUMBER_PREFIX + s.astype("string")).astype(object).where(s.notna(), np.nan)
+
+
+def fmt_of(path):
+    ext = os.path.splitext(str(path))[1].lower()
+    if ext not in FORMATS:
+        raise ValueError(f"don't know how to store '{path}' (use one of {', '.join(FORMATS)})")
+    return FORMATS[ext]
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet/Feather storage needs pyarrow (pip install pyarrow), or use a .csv path")
+    return pyarrow
+
+
+def _typed(df):
+    # object label columns -> category so they're stored as dictionaries
+    for c in CATEGORY_COLS:
+        if c in df.columns and pd.api.types.is_string_dtype(df[c]) and not isinstance(df[c].dtype, pd.CategoricalDtype):
+            df = df.assign(**{c: df[c].astype("category")})
+    return df
+
+
+def _text_numbers(df):
+    # files always hold the "INC..." text, whatever the frame uses in memory
+    if "number" in df.columns and pd.api.types.is_integer_dtype(df["number"]):
+        df = df.assign(number=decode_numbers(df["number"]))
+    return df
+
+
+def _csv_dtype(dtype):
+    # the number is read as text and encoded afterwards (see _apply_dtypes)
+    if isinstance(dtype, dict) and "number" in dtype:
+        return dict(dtype, number=str)
+    return dtype
+
+
+def _apply_dtypes(df, dtype, cast):
+    """Encode the number if `dtype` asks for an integer one; `cast` also astype()s the rest."""
+    if not isinstance(dtype, dict):
+        return df
+    for c, t in dtype.items():
+        if c not in df.columns:
+            continue
+        if c == "number" and pd.api.types.is_integer_dtype(pd.api.types.pandas_dtype(t)):
+            df[c] = encode_numbers(df[c])
+        elif cast and df[c].dtype != t:
+            df[c] = df[c].astype(t)
+    return df
+
+
+def read_table(path, columns=None, dtype=None):
+    """Read a whole table. `columns` only loads those columns (projection).
+
+    `dtype` (e.g. clean_dtypes()) is handed to the CSV reader; for the columnar
+    formats a dict of dtypes is applied to what pyarrow returns.
+    """
+    fmt = fmt_of(path)
+    if fmt == "csv":
+        df = pd.read_csv(path, usecols=columns, dtype=_csv_dtype(dtype), low_memory=False)
+        return _apply_dtypes(df, dtype, cast=False)
+    _pyarrow()
+    if fmt == "parquet":
+        df = pd.read_parquet(path, columns=columns)
+    else:
+        df = pd.read_feather(path, columns=columns)
+    return _apply_dtypes(df, dtype, cast=True)
+
+
+def iter_table(path, chunksize, columns=None, dtype=None):
+    """Yield the table in DataFrames of up to `chunksize` rows.
+
+    A single `dtype` (like str) is only used for CSV (the columnar formats
+    already know their types); a dict of dtypes is applied to every format.
+    """
+    fmt = fmt_of(path)
+    if fmt == "csv":
+        for chunk in pd.read_csv(path, usecols=columns, dtype=_csv_dtype(dtype), chunksize=chunksize):
+            yield _apply_dtypes(chunk, dtype, cast=False)
+        return
+    pa = _pyarrow()
+    ds = pa.dataset.dataset(path, format="parquet" if fmt == "parquet" else "ipc")
+    for batch in ds.to_batches(columns=columns, batch_size=chunksize):
+        if batch.num_rows:
+            yield _apply_dtypes(batch.to_pandas(), dtype, cast=True)
+
+
+def _plain(df):
+    # the same frame as it was held before clean_dtypes(): object strings,
+    # int64 / float64 numbers
+    out = {}
+    for c in df.columns:
+        s = df[c]
+        if c == "number":
+            s = decode_numbers(s)
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            s = s.astype(object)
+        elif pd.api.types.is_float_dtype(s):
+            s = s.astype("float64")
+        elif pd.api.types.is_integer_dtype(s):
+            s = s.astype("float64" if s.isna().any() else "int64")
+        out[c] = s
+    return pd.DataFrame(out, index=df.index)
+
+
+def memory_table(df):
+    """Bytes per column with plain pandas types ("before") and as `df` holds them ("after")."""
+    return pd.DataFrame({
+        "before": _plain(df).memory_usage(index=False, deep=True),
+        "after": df.memory_usage(index=False, deep=True),
+    })
+
+
+def print_memory_report(table, rows, log=print):
+    """Print a memory_table (possibly summed over chunks) for `rows` rows."""
+    log(f"Memory per column ({rows} rows):")
+    for c, r in table.iterrows():
+        log(f"- {c:<24} {r['before']:>14,} B -> {r['after']:>14,} B  ({r['after'] / max(r['before'], 1):.0%})")
+    before, after = table["before"].sum(), table["after"].sum()
+    log(f"- {'total':<24} {before:>14,} B -> {after:>14,} B  ({after / max(before, 1):.0%}), "
+        f"{before / max(rows, 1):.0f} -> {after / max(rows, 1):.0f} bytes/row")
+
+
+def write_table(df, path, date_format=None):
+    # date_format: as TableWriter's (CSV only)
+    df = _text_numbers(df)
+    fmt = fmt_of(path)
+    if fmt == "csv":
+        df.to_csv(path, index=False, date_format=date_format)
+    elif fmt == "parquet":
+        _pyarrow()
+        _typed(df).to_parquet(path, index=False)
+    else:
+        _pyarrow()
+        _typed(df).reset_index(drop=True).to_feather(path)
+
+
+class TableWriter:
+    """Append DataFrame chunks to one output file, in any of the formats above.
+
+    Use as a context manager; the columnar formats take their schema from the
+    first chunk written. `date_format` fixes how CSV writes timestamps.
+
+    Categorical columns keep one growing list of categories across chunks (new
+    ones appended at the end), so Feather can write later chunks' dictionaries
+    as deltas - an IPC file can't replace a dictionary halfway through.
+    """
+
+    def __init__(self, path, date_format=None):
+        self.path = path
+        self.date_format = date_format
+        self.fmt = fmt_of(path)
+        self.rows = 0
+        self._writer = None
+        self._schema = None
+        self._categories = {}
+
+    def _same_categories(self, df):
+        for c in df.columns:
+            if isinstance(df[c].dtype, pd.CategoricalDtype):
+                known = self._categories.setdefault(c, [])
+                seen = set(known)
+                known.extend(v for v in df[c].cat.categories if v not in seen)
+                df = df.assign(**{c: df[c].cat.set_categories(known)})
+        return df
+
+    def write(self, df):
+        df = _text_numbers(df)
+        if self.fmt == "csv":
+            first = self._schema is None
+            df.to_csv(self.path, index=False, mode="w" if first else "a", header=first,
+                      date_format=self.date_format)
+            self._schema = list(df.columns)
+        else:
+            pa = _pyarrow()
+            df = self._same_categories(_typed(df))
+            table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+            if self._writer is None:
+                self._schema = table.schema
+                if self.fmt == "parquet":
+                    self._writer = pa.parquet.ParquetWriter(self.path, self._schema)
+                else:
+                    self._writer = pa.ipc.new_file(self.path, self._schema,
+                                                   options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True))
+            if self.fmt == "parquet":
+                self._writer.write_table(table)
+            else:
+                self._writer.write(table)
+        self.rows += len(df)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
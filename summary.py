@@ -1,42 +1,333 @@
+import argparse
+import heapq
+import json
+
+import numpy as np
 import pandas as pd
 
+from cube import RollupCube
+from sketches import ExactQuantiles, make_quantiles, quantiles_from_dict
+from storage import clean_dtypes, iter_table, memory_table, print_memory_report
+
 SRC = "data/incidents_clean.csv"
 
-df = pd.read_csv(SRC)
-
-total = len(df)
-print(f"Loaded cleaned data: {SRC}")
-print(f"Total incidents (cleaned): {total}\n")
-
-print("By priority (count, percent):")
-pri = df["final_priority"].value_counts(dropna=False)
-pri_pct = df["final_priority"].value_counts(normalize=True, dropna=False) * 100
-for k,v in pri.items():
-	print(f"- {k}: {v} ({pri_pct[k]:.1f}%)")
-
-print("\nSLA summary:")
-sla_counts = df["sla_breached"].value_counts(dropna=False)
-sla_pct = df["sla_breached"].value_counts(normalize=True, dropna=False) * 100
-for k,v in sla_counts.items():
-	label = "breached (1)" if str(k) == '1' else ("not breached (0)" if str(k) == '0' else str(k))
-	print(f"- {label}: {v} ({sla_pct[k]:.1f}%)")
-
-print("\nQuick resolution (<12h) percent:")
-if "quick_resolution" in df.columns:
-	qr_pct = df["quick_resolution"].mean() * 100
-	print(f"- quick_resolution: {qr_pct:.1f}%")
-else:
-	print("- quick_resolution column not present")
-
-res = df["resolution_hours"].dropna()
-print("\nResolution hours (cleaned):")
-print(f"- count (non-missing): {len(res)}")
-print(f"- mean: {res.mean():.2f} hours")
-print(f"- median: {res.median():.2f} hours")
-print(f"- 90th percentile: {res.quantile(0.9):.2f} hours")
-print(f"- 99th percentile: {res.quantile(0.99):.2f} hours")
-
-print("\nTop 5 longest resolution_hours:")
-print(res.sort_values(ascending=False).head(5).to_string(index=False))
-
-print("\nSummary complete.")
+# only the columns the summary needs (parquet/feather skip the rest entirely)
+SUMMARY_COLS = ["final_priority", "sla_breached", "quick_resolution", "resolution_hours"]
+GROUP_COL = "assignment_group_mode"
+TOP_K = 5
+STATS_VERSION = 1
+# stage-log stages that only write the rows out, listed with kind "output"
+OUTPUT_STAGES = {"spill", "save", "partition", "features"}
+
+
+def _label(v):
+	# value_counts-style key, as a string so it survives a JSON round trip
+	if pd.isna(v):
+		return "nan"
+	if isinstance(v, float) and v.is_integer():
+		v = int(v)
+	return str(v)
+
+
+class SummaryStats:
+	"""Everything summary.py prints, built in one pass over chunks.
+
+	Counts, sums and the quantile sketch just add up, and the top-k list is the
+	top-k of both sides, so summaries of separate files (e.g. one per day) can be
+	merged without going back to the rows.
+	"""
+
+	def __init__(self, rel_error=0.001, top_k=TOP_K, quantiles="sketch"):
+		self.rel_error = rel_error
+		self.rows = 0
+		self.priority = {}
+		self.sla = {}
+		self.quick_sum = 0
+		self.quick_count = 0
+		self.res_count = 0
+		self.res_sum = 0.0
+		self.res_sketch = make_quantiles(quantiles, rel_error)  # see sketches.py
+		self.top_k = top_k
+		self.top = []  # min-heap of the largest resolution_hours
+
+	@staticmethod
+	def _count(store, s):
+		for k, v in s.value_counts(dropna=False).items():
+			if not v:
+				continue  # unused categories
+			k = _label(k)
+			store[k] = store.get(k, 0) + int(v)
+
+	def update(self, df):
+		self.rows += len(df)
+		self._count(self.priority, df["final_priority"])
+		self._count(self.sla, df["sla_breached"])
+		if "quick_resolution" in df.columns:
+			qr = pd.to_numeric(df["quick_resolution"], errors="coerce").dropna()
+			self.quick_sum += int(qr.sum())
+			self.quick_count += len(qr)
+		res = pd.to_numeric(df["resolution_hours"], errors="coerce").dropna().to_numpy(dtype="float64")
+		self.res_count += len(res)
+		self.res_sum += float(res.sum())
+		self.res_sketch.add(res)
+		# only the chunk's own top-k can make it into the overall top-k
+		self._push(np.sort(res)[-self.top_k:])
+		return self
+
+	def _push(self, values):
+		for v in values:
+			if len(self.top) < self.top_k:
+				heapq.heappush(self.top, float(v))
+			elif v > self.top[0]:
+				heapq.heapreplace(self.top, float(v))
+
+	def merge(self, other):
+		self.rows += other.rows
+		for mine, theirs in ((self.priority, other.priority), (self.sla, other.sla)):
+			for k, v in theirs.items():
+				mine[k] = mine.get(k, 0) + v
+		self.quick_sum += other.quick_sum
+		self.quick_count += other.quick_count
+		self.res_count += other.res_count
+		self.res_sum += other.res_sum
+		self.res_sketch.merge(other.res_sketch)
+		self._push(other.top)
+		return self
+
+	def to_dict(self):
+		# always the sketch: the exact engine would write out every resolution_hours
+		sketch = self.res_sketch
+		if isinstance(sketch, ExactQuantiles):
+			sketch = sketch.to_sketch(self.rel_error)
+		return {
+			"rows": self.rows,
+			"priority": self.priority,
+			"sla": self.sla,
+			"quick_sum": self.quick_sum,
+			"quick_count": self.quick_count,
+			"res_count": self.res_count,
+			"res_sum": self.res_sum,
+			"res_sketch": sketch.to_dict(),
+			"top_k": self.top_k,
+			"top": sorted(self.top, reverse=True),
+		}
+
+	@classmethod
+	def from_dict(cls, d):
+		st = cls(d["res_sketch"].get("rel_error", 0.001), d["top_k"])
+		for k in ("rows", "priority", "sla", "quick_sum", "quick_count", "res_count", "res_sum"):
+			setattr(st, k, d[k])
+		st.res_sketch = quantiles_from_dict(d["res_sketch"])
+		st._push(d["top"])
+		return st
+
+	@classmethod
+	def from_cube(cls, cube, **where):
+		"""The same numbers, read off a rollup cube (see cube.py) instead of the rows.
+
+		`where` limits them to matching cells, as in RollupCube.frame().
+		"""
+		st = cls(cube.rel_error, cube.top_k)
+		totals = cube.frame(by=[], **where)
+		st.rows = int(totals["rows"])
+		st.priority = {k: int(v) for k, v in cube.frame(["final_priority"], **where)["rows"].items() if v}
+		sla = {"1": totals["breached"], "0": totals["sla_count"] - totals["breached"],
+		       "nan": totals["rows"] - totals["sla_count"]}
+		st.sla = {k: int(v) for k, v in sla.items() if v}
+		st.quick_sum = int(totals["quick"])
+		st.quick_count = int(totals["quick_count"])
+		st.res_count = int(totals["res_count"])
+		st.res_sum = float(totals["res_sum"])
+		st.res_sketch = cube.sketch(**where)
+		st._push(cube.top(**where))
+		return st
+
+	def results(self):
+		"""The numbers report() prints, as a plain (JSON-able) dict."""
+		sk = self.res_sketch
+		res = self.res_count
+		return {
+			"rows": self.rows,
+			"priority": dict(self.priority),
+			"sla": dict(self.sla),
+			"sla_breach_rate": self.sla.get("1", 0) / self.rows if self.rows else None,
+			"quick_rate": self.quick_sum / self.quick_count if self.quick_count else None,
+			"resolution_hours": {
+				"count": res,
+				"mean": self.res_sum / res if res else None,
+				"median": sk.quantile(0.5) if res else None,
+				"p90": sk.quantile(0.9) if res else None,
+				"p99": sk.quantile(0.99) if res else None,
+			},
+			"top": sorted(self.top, reverse=True),
+		}
+
+	def report(self, src):
+		total = self.rows
+		print(f"Loaded cleaned data: {src}")
+		print(f"Total incidents (cleaned): {total}\n")
+
+		print("By priority (count, percent):")
+		for k, v in sorted(self.priority.items(), key=lambda kv: -kv[1]):
+			print(f"- {k}: {v} ({v / total * 100:.1f}%)")
+
+		print("\nSLA summary:")
+		for k, v in sorted(self.sla.items(), key=lambda kv: -kv[1]):
+			label = "breached (1)" if k == '1' else ("not breached (0)" if k == '0' else k)
+			print(f"- {label}: {v} ({v / total * 100:.1f}%)")
+
+		print("\nQuick resolution (<12h) percent:")
+		if self.quick_count:
+			print(f"- quick_resolution: {self.quick_sum / self.quick_count * 100:.1f}%")
+		else:
+			print("- quick_resolution column not present")
+
+		sk = self.res_sketch
+		print("\nResolution hours (cleaned):")
+		print(f"- count (non-missing): {self.res_count}")
+		print(f"- mean: {self.res_sum / self.res_count if self.res_count else float('nan'):.2f} hours")
+		print(f"- median: {sk.quantile(0.5):.2f} hours")
+		print(f"- 90th percentile: {sk.quantile(0.9):.2f} hours")
+		print(f"- 99th percentile: {sk.quantile(0.99):.2f} hours")
+		if sk.rel_error:
+			print(f"  (percentiles from a sketch, within ±{sk.rel_error:.1%})")
+		else:
+			print("  (exact percentiles)")
+
+		print(f"\nTop {self.top_k} longest resolution_hours:")
+		for v in sorted(self.top, reverse=True):
+			print(v)
+
+		print("\nSummary complete.")
+
+
+def summarise(df, rel_error=0.001, quantiles="exact"):
+	"""Summary of a clean frame already in memory, as SummaryStats.results()."""
+	return SummaryStats(rel_error, quantiles=quantiles).update(df).results()
+
+
+def group_labels(s):
+	"""assignment_group_mode -> the group it counts for: padding stripped, missing is "unassigned"."""
+	return s.astype(object).map(lambda v: _label(v).strip()).replace("nan", "unassigned")
+
+
+def summarise_files(paths, chunksize=500_000, rel_error=0.001, float32=False, memory_report=False,
+                    quantiles="exact", groups=None):
+	# read with the compact clean schema (categoricals, Int8 flags, optional float32).
+	# `groups`, if given, is a dict that gets a SummaryStats per group_labels() added
+	stats = SummaryStats(rel_error, quantiles=quantiles)
+	dtype = clean_dtypes(float32)
+	cols = SUMMARY_COLS + ([GROUP_COL] if groups is not None else [])
+	mem = None
+	for path in paths:
+		for chunk in iter_table(path, chunksize, columns=cols, dtype=dtype):
+			stats.update(chunk)
+			if groups is not None:
+				for g, part in chunk.groupby(group_labels(chunk[GROUP_COL]), sort=False):
+					if g not in groups:
+						groups[g] = SummaryStats(rel_error, quantiles=quantiles)
+					groups[g].update(part)
+			if memory_report:
+				mem = memory_table(chunk) if mem is None else mem + memory_table(chunk)
+	if mem is not None:
+		print_memory_report(mem, stats.rows)
+		print()
+	return stats
+
+
+def cube_groups(cube):
+	"""SummaryStats per group_labels() group, off a rollup cube."""
+	raw = cube.frame([GROUP_COL]).index
+	labels = group_labels(pd.Series(raw, dtype=object))
+	return {g: SummaryStats.from_cube(cube, **{GROUP_COL: list(raw[(labels == g).to_numpy()])})
+	        for g in labels.unique()}
+
+
+def load_stage_log(path):
+	"""The records pipeline.py --stage-log wrote (one JSON object per stage)."""
+	with open(path, "r", encoding="utf-8") as f:
+		return [json.loads(line) for line in f if line.strip()]
+
+
+def stats_document(stats, sources, groups=None, stages=None):
+	"""Everything the deck needs in one JSON-able dict (see --stats-json).
+
+	`stages` (pipeline.py's stage log) gives the dirty row count - what the first
+	stage read - and the rows each stage removed. Each step has a `kind`: "clean"
+	for the cleaning stages, "output" for the ones that only write rows out.
+	"""
+	dirty = None
+	steps = []
+	for r in stages or []:
+		if r["rows_in"] is None and dirty is None:
+			dirty = r["rows_out"]
+		elif r["rows_in"] is not None and r["rows_out"] is not None:
+			kind = "output" if r["stage"] in OUTPUT_STAGES else "clean"
+			steps.append({"stage": r["stage"], "kind": kind, "rows_in": r["rows_in"], "rows_out": r["rows_out"],
+			              "removed": r["rows_in"] - r["rows_out"]})
+	return {
+		"version": STATS_VERSION,
+		"sources": sources,
+		"rows": {"dirty": dirty, "clean": stats.rows},
+		"steps": steps,
+		"overall": stats.results(),
+		"by_group": {g: s.results() for g, s in sorted((groups or {}).items())},
+	}
+
+
+def main():
+	ap = argparse.ArgumentParser(description="Print summary statistics for the cleaned incidents.")
+	ap.add_argument("--src", nargs="+", default=[SRC], help="cleaned file(s) (.csv, .parquet or .feather)")
+	ap.add_argument("--chunksize", type=int, default=500_000, help="rows read per chunk")
+	ap.add_argument("--sketch-error", type=float, default=0.001, help="relative error of the percentiles")
+	ap.add_argument("--quantiles", choices=["exact", "sketch"], default="exact",
+	                help="exact percentiles (keeps every value, the default), or from a bounded-memory sketch")
+	ap.add_argument("--float32", action="store_true", help="read resolution_hours as float32")
+	ap.add_argument("--memory-report", action="store_true",
+	                help="print bytes per column read, default vs compact dtypes")
+	ap.add_argument("--save", metavar="JSON", help="also save the (mergeable) summary state here; its percentiles are always sketched")
+	ap.add_argument("--stats-json", metavar="JSON",
+	                help="also write the statistics document the deck builder reads (same pass, plus per group)")
+	ap.add_argument("--stage-log", metavar="JSONL",
+	                help="with --stats-json: pipeline.py --stage-log output, for dirty rows and rows removed per step")
+	ap.add_argument("--merge", nargs="+", metavar="JSON",
+	                help="combine saved summaries instead of reading data files")
+	ap.add_argument("--cube", nargs="+", metavar="JSON",
+	                help="answer from rollup cube(s) written by pipeline.py --cube instead of the rows")
+	args = ap.parse_args()
+
+	if args.cube:
+		cube = RollupCube.load(args.cube[0])
+		for path in args.cube[1:]:
+			cube.merge(RollupCube.load(path))
+		stats = SummaryStats.from_cube(cube)
+		groups = cube_groups(cube) if args.stats_json else None
+		sources = args.cube
+	elif args.merge:
+		stats = None
+		for path in args.merge:
+			with open(path, "r", encoding="utf-8") as f:
+				part = SummaryStats.from_dict(json.load(f))
+			stats = part if stats is None else stats.merge(part)
+		groups = None  # saved summaries don't keep the groups
+		sources = args.merge
+	else:
+		groups = {} if args.stats_json else None
+		stats = summarise_files(args.src, args.chunksize, args.sketch_error, args.float32, args.memory_report,
+		                        args.quantiles, groups)
+		sources = args.src
+
+	src = ", ".join(sources)
+	if args.save:
+		with open(args.save, "w", encoding="utf-8") as f:
+			json.dump(stats.to_dict(), f)
+	if args.stats_json:
+		stages = load_stage_log(args.stage_log) if args.stage_log else None
+		doc = stats_document(stats, sources, groups, stages)
+		with open(args.stats_json, "w", encoding="utf-8") as f:
+			json.dump(doc, f, indent=2)
+	stats.report(src)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,34 @@
+"""Regression tests for pipeline.py --batch: python -m pytest -q"""
+
+import pandas as pd
+
+from batch import run_batch
+from pipeline import run, run_streaming
+
+COLUMNS = ["number", "first_opened_at", "last_resolved_at", "last_closed_at", "final_state", "final_priority",
+           "assignment_group_mode", "events_count", "resolution_hours"]
+
+
+def _row(number, opened, resolved="2025-03-05 10:00:00"):
+    return [number, opened, resolved, resolved, "Resolved", "2 - High", "Network", "2", ""]
+
+
+def test_key_dedup_later_file_wins_even_when_its_row_is_dropped(tmp_path):
+    # INC100001's latest row is in the second file, and cleaning drops it (no
+    # usable first_opened_at) - so, as in a serial run, the older row in the
+    # first file must not come back
+    first = [_row("INC100001", "2025-03-01 10:00:00"), _row("INC100002", "2025-03-02 10:00:00")]
+    second = [_row("INC100001", "not a date"), _row("INC100003", "2025-03-03 10:00:00")]
+    parts = tmp_path / "parts"
+    parts.mkdir()
+    pd.DataFrame(first, columns=COLUMNS).to_csv(parts / "a.csv", index=False)
+    pd.DataFrame(second, columns=COLUMNS).to_csv(parts / "b.csv", index=False)
+    whole = tmp_path / "whole.csv"
+    pd.DataFrame(first + second, columns=COLUMNS).to_csv(whole, index=False)
+
+    outs = {name: str(tmp_path / f"{name}.csv") for name in ["batch", "streaming", "memory"]}
+    run_batch(str(parts), outs["batch"], workers=1, chunksize=1, dedup="key")
+    run_streaming(str(whole), outs["streaming"], chunksize=1, dedup="key")
+    run(str(whole), outs["memory"], dedup="key")
+    for name, out in outs.items():
+        assert sorted(pd.read_csv(out)["number"]) == ["INC100002", "INC100003"], name
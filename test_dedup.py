@@ -0,0 +1,73 @@
+"""Tests for step 2, the dedup modes: python -m pytest -q"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from dedup import NO_KEY, Dedup, LatestKeys, SeenHashes, key_hashes
+from pipeline import run, run_streaming
+
+
+def _dirty():
+    return pd.read_csv("data/incidents_dirty.csv", dtype=str)
+
+
+def _chunks(df, size):
+    return [df.iloc[i:i + size] for i in range(0, len(df), size)]
+
+
+def test_seen_hashes_match_a_set():
+    rng = np.random.default_rng(0)
+    seen, brute = SeenHashes(), set()
+    for size in rng.integers(0, 400, 60):
+        h = rng.integers(1, 3000, size).astype(np.uint64)  # plenty of repeats, within and across chunks
+        expect = []
+        for v in h.tolist():
+            expect.append(v not in brute)
+            brute.add(v)
+        assert seen.first_seen(h).tolist() == expect
+        assert len(seen._runs) <= 2 * int(np.log2(len(brute) + 1)) + 1
+    snapshot = seen.copy()
+    seen.first_seen(np.array([10**6], dtype=np.uint64))
+    assert len(seen) == len(snapshot) + 1
+    assert snapshot.values.tolist() == sorted(brute)
+    assert snapshot.contains(np.array([10**6, min(brute)], dtype=np.uint64)).tolist() == [False, True]
+
+
+def _dedup_in_chunks(df, mode, size):
+    latest = LatestKeys.scan(_chunks(df[["number"]], size)) if mode == "key" else None
+    dd = Dedup(mode, latest)
+    return pd.concat([dd.raw(c)[0] for c in _chunks(df, size)]), dd
+
+
+@pytest.mark.parametrize("size", [13, 150, 5000])
+def test_exact_mode_is_drop_duplicates_across_chunks(size):
+    df = _dirty()
+    kept, dd = _dedup_in_chunks(df, "exact", size)
+    pd.testing.assert_frame_equal(kept, df.drop_duplicates())
+    assert dd.removed == len(df) - len(kept)
+
+
+@pytest.mark.parametrize("size", [13, 150, 5000])
+def test_key_mode_keeps_the_last_row_of_every_number_across_chunks(size):
+    df = _dirty()
+    kept, _ = _dedup_in_chunks(df, "key", size)
+    h, has = key_hashes(df)
+    last = ~pd.Series(h).duplicated(keep="last").to_numpy()
+    pd.testing.assert_frame_equal(kept, df[~has | last])
+    assert kept["number"].dropna().str.strip().str.casefold().is_unique
+
+
+def test_key_mode_marks_rows_without_a_number():
+    df = _dirty().head(5)
+    df.loc[df.index[:2], "number"] = [None, "  "]
+    _, hashes = Dedup("key", LatestKeys.scan([df])).raw(df)
+    assert (hashes.iloc[:2] == NO_KEY).all() and (hashes.iloc[2:] != NO_KEY).all()
+
+
+@pytest.mark.parametrize("dedup", ["exact", "key", "near"])
+def test_streaming_dedups_like_the_in_memory_run(tmp_path, dedup):
+    mem, streamed = tmp_path / "memory.csv", tmp_path / "streaming.csv"
+    run("data/incidents_dirty.csv", str(mem), dedup=dedup)
+    run_streaming("data/incidents_dirty.csv", str(streamed), chunksize=150, dedup=dedup, quantiles="exact")
+    assert mem.read_bytes() == streamed.read_bytes()
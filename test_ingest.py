@@ -0,0 +1,79 @@
+"""Tests for the ingest service's worker side (no HTTP): python -m pytest -q"""
+
+import glob
+import os
+
+import pandas as pd
+
+from ingest import QUARANTINE_DIR, IngestService, _records
+
+
+def _service(tmp_path, **kwargs):
+    store = str(tmp_path / "live")
+    os.makedirs(store, exist_ok=True)
+    return IngestService(store, batch_size=100, **kwargs)
+
+
+def _store_rows(svc):
+    files = glob.glob(os.path.join(svc.store, "month=*.csv"))
+    return pd.concat([pd.read_csv(f) for f in files]) if files else pd.DataFrame(columns=["number"])
+
+
+def test_unresolved_incident_is_stored_not_quarantined(tmp_path):
+    # a newly opened incident: no last_resolved_at / resolution_hours, so no cap yet
+    svc = _service(tmp_path)
+    batch = _records(b'{"number": "INC100001", "first_opened_at": "2025-03-01 10:00:00", '
+                     b'"final_priority": "2 - High", "assignment_group_mode": "Network", "events_count": "1"}')
+    assert svc.apply(batch, {}) is None
+    assert list(_store_rows(svc)["number"]) == ["INC100001"]
+    assert svc.counters["failed_batches"] == 0
+    assert not os.path.exists(os.path.join(svc.store, QUARANTINE_DIR))
+    assert svc.health()[1]["last_error"] is None
+
+
+def test_failed_batch_is_rolled_back_and_can_be_resent(tmp_path, monkeypatch):
+    import ingest
+    dirty = pd.read_csv("data/incidents_dirty.csv", dtype=str).iloc[:50]
+    svc = _service(tmp_path)
+    real = ingest.clean_chunk
+
+    def broken(df, log=None):
+        raise ValueError("boom")
+
+    monkeypatch.setattr(ingest, "clean_chunk", broken)
+    error, path = svc.apply(dirty, {"tail.csv": 123})
+    assert isinstance(error, ValueError) and os.path.exists(path)
+    assert len(svc.dedup.seen) == 0 and svc.sketch.count == 0
+    assert svc.tail_offsets == {"tail.csv": 123}  # the rows are in the quarantine
+
+    monkeypatch.setattr(ingest, "clean_chunk", real)
+    assert svc.apply(pd.read_csv(path, dtype=str), {}) is None
+    assert svc.counters["kept"] == len(_store_rows(svc)) > 0
+
+
+def test_state_survives_a_restart(tmp_path):
+    dirty = pd.read_csv("data/incidents_dirty.csv", dtype=str).iloc[:100]
+    svc = _service(tmp_path)
+    svc.apply(dirty.iloc[:60], {"tail.csv": 60})
+    svc.save()
+    again = _service(tmp_path)
+    assert again.tail_offsets == {"tail.csv": 60}
+    assert again.stats.rows == svc.stats.rows
+    # rows already kept before the restart are still recognised as duplicates
+    again.apply(dirty, {})
+    assert _store_rows(again)["number"].is_unique
+
+
+def test_a_crash_after_the_checkpoint_does_not_duplicate_rows(tmp_path):
+    dirty = pd.read_csv("data/incidents_dirty.csv", dtype=str).iloc[:200]
+    svc = _service(tmp_path)
+    svc.apply(dirty.iloc[:100], {"tail.csv": 100})
+    svc.save()
+    svc.apply(dirty.iloc[100:], {"tail.csv": 200})  # appended, then "crash" before the next save
+
+    again = _service(tmp_path)
+    assert again.tail_offsets == {"tail.csv": 100}
+    assert len(_store_rows(again)) == again.stats.rows  # the store is back at the checkpoint
+    again.apply(dirty.iloc[100:], {"tail.csv": 200})  # the tail reads those rows again
+    rows = _store_rows(again)
+    assert rows["number"].is_unique and len(rows) == svc.counters["kept"]
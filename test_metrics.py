@@ -0,0 +1,93 @@
+"""Tests for the rolling-window metrics engine: python -m pytest -q"""
+
+import numpy as np
+import pandas as pd
+
+from metrics import MEASURES, RollingMetrics
+from pipeline import run
+
+
+def _clean():
+    return pd.read_csv("data/incidents_clean.csv")
+
+
+def _brute(m, w):
+    cs = np.cumsum(np.pad(m.daily, ((0, 0), (0, 0), (1, 0))), axis=2)
+    d = np.arange(m.days)
+    return cs[:, :, d + 1] - cs[:, :, np.maximum(d - w + 1, 0)]
+
+
+def test_empty_engine_round_trip(tmp_path):
+    path = str(tmp_path / "m.json")
+    RollingMetrics().save(path)
+    m = RollingMetrics.load(path)
+    assert m.days == 0 and m.keys == []
+    assert m.series("breach_rate", window=7).empty
+    assert m.latest()["day"] is None
+    # and it still takes rows after loading
+    m.update(_clean().head(10))
+    assert m.series("opened").sum() == 10
+
+
+def test_round_trip_keeps_counters_windows_and_sketches(tmp_path):
+    path = str(tmp_path / "m.json")
+    m = RollingMetrics().update(_clean())
+    m.save(path)
+    back = RollingMetrics.load(path)
+    assert back.keys == m.keys and back.origin == m.origin
+    np.testing.assert_allclose(back.daily, m.daily)
+    for w in m.windows:
+        np.testing.assert_allclose(back.rolling[w], m.rolling[w])
+    assert back.latest(30) == m.latest(30)
+
+
+def test_windows_match_a_full_recompute_after_updates_in_any_order():
+    df = _clean()
+    months = pd.to_datetime(df["first_opened_at"]).dt.strftime("%Y-%m")
+    m = RollingMetrics()
+    # newest month first, so the arrays get padded on both sides
+    for key in sorted(months.unique(), reverse=True):
+        m.update(df[months == key])
+        for w in m.windows:
+            np.testing.assert_allclose(m.rolling[w], _brute(m, w))
+    whole = RollingMetrics().update(df)
+    for w in m.windows:
+        pd.testing.assert_series_equal(m.series("opened", w), whole.series("opened", w))
+
+
+def test_remove_undoes_add():
+    df = _clean()
+    m = RollingMetrics().update(df.iloc[:1000])
+    before = {w: a.copy() for w, a in m.rolling.items()}
+    m.update(df.iloc[1000:1200]).update(df.iloc[1000:1200], sign=-1)
+    for w in m.windows:
+        np.testing.assert_allclose(m.rolling[w][:, :, :before[w].shape[2]], before[w], atol=1e-9)
+
+
+def test_pipeline_metrics_for_an_empty_output(tmp_path):
+    src = tmp_path / "dirty.csv"
+    pd.read_csv("data/incidents_dirty.csv", nrows=0).to_csv(src, index=False)
+    path = str(tmp_path / "m.json")
+    metrics = RollingMetrics()
+    run(str(src), str(tmp_path / "clean.csv"), metrics=metrics)
+    metrics.save(path)
+    m = RollingMetrics.load(path)
+    assert m.days == 0 and m.daily.shape == (0, len(MEASURES), 0)
+    # what `python metrics.py FILE` does with it
+    assert m.series("opened").empty and m.latest()["day"] is None
+
+
+def test_day_by_day_updates_grow_the_buffers_only_a_few_times():
+    df = _clean()
+    day = pd.to_datetime(df["first_opened_at"]).dt.floor("D")
+    m = RollingMetrics()
+    buffers = [m._daily]
+    for d in sorted(day.unique()):
+        m.update(df[day == d])
+        if m._daily is not buffers[-1]:
+            buffers.append(m._daily)
+    assert m.days >= 60 and len(buffers) < 20  # doubling, not one copy per day
+    whole = RollingMetrics().update(df)
+    for w in m.windows:
+        np.testing.assert_allclose(m.rolling[w], _brute(m, w))
+        pd.testing.assert_series_equal(m.series("breach_rate", w), whole.series("breach_rate", w))
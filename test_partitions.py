@@ -0,0 +1,87 @@
+"""Tests for the partitioned clean store: python -m pytest -q"""
+
+import os
+
+import pandas as pd
+import pytest
+
+from partitions import PartitionedWriter, load_manifest, prune, query, write_partitioned
+
+QUERIES = [
+    {},
+    {"start": "2025-10-01", "end": "2025-10-08"},
+    {"start": "2025-11-30"},
+    {"end": "2025-09-10", "priority": "1 - Critical"},
+    {"start": "2025-09-15", "end": "2025-10-15", "priority": ["2 - High", "4 - Low"], "group": "Network"},
+]
+
+
+def _clean():
+    return pd.read_csv("data/incidents_clean.csv")
+
+
+def _brute(df, start=None, end=None, priority=None, group=None):
+    opened = pd.to_datetime(df["first_opened_at"])
+    ok = pd.Series(True, index=df.index)
+    if start is not None:
+        ok &= opened >= pd.Timestamp(start)
+    if end is not None:
+        ok &= opened < pd.Timestamp(end)
+    for col, want in (("final_priority", priority), ("assignment_group_mode", group)):
+        if want is not None:
+            ok &= df[col].isin([want] if isinstance(want, str) else want)
+    return df[ok]
+
+
+def _numbers(df):
+    return sorted(df["number"])
+
+
+@pytest.mark.parametrize("by", ["day", "month"])
+def test_queries_match_a_filter_over_every_row(tmp_path, by):
+    df = _clean()
+    root = str(tmp_path / "parts")
+    write_partitioned(df, root, by)
+    manifest = load_manifest(root)
+    assert sum(st["rows"] for st in manifest["files"].values()) == len(df)
+    for q in QUERIES:
+        assert _numbers(query(root, **q)) == _numbers(_brute(df, **q)), q
+
+
+def test_prune_skips_files_outside_the_range(tmp_path):
+    df = _clean()
+    root = str(tmp_path / "parts")
+    write_partitioned(df, root, "day")
+    manifest = load_manifest(root)
+    week = prune(manifest, "2025-10-01", "2025-10-08")
+    assert 0 < len(week) <= 7 < len(manifest["files"])
+    assert all("day=2025-10-0" in rel for rel in week)
+    # every file with a matching row survives pruning
+    for q in QUERIES:
+        kept = set(prune(manifest, **q))
+        for rel, st in manifest["files"].items():
+            part = pd.read_csv(os.path.join(root, rel))
+            if len(_brute(part, **q)):
+                assert rel in kept, (q, rel)
+
+
+def test_a_query_with_no_match_keeps_the_columns(tmp_path):
+    df = _clean()
+    root = str(tmp_path / "parts")
+    write_partitioned(df, root)
+    empty = query(root, start="2030-01-01")
+    assert empty.empty and list(empty.columns) == list(df.columns)
+    assert list(query(root, start="2030-01-01", columns=["number"]).columns) == ["number"]
+
+
+def test_chunked_parquet_writer_with_few_open_files(tmp_path):
+    df = _clean()
+    root = str(tmp_path / "parts")
+    with PartitionedWriter(root, "month", ".parquet", max_open=2) as w:
+        for i in range(0, len(df), 150):
+            w.write(df.iloc[i:i + 150])
+    manifest = load_manifest(root)
+    months = {st["partition"] for st in manifest["files"].values()}
+    assert len(manifest["files"]) > len(months)  # writers were closed and new parts started
+    for q in QUERIES:
+        assert _numbers(query(root, **q)) == _numbers(_brute(df, **q)), q
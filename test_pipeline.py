@@ -0,0 +1,61 @@
+"""Regression tests for the cleaner: python -m pytest -q"""
+
+import pandas as pd
+
+from pipeline import run, run_streaming
+
+DIRTY = [
+    # number, first_opened_at, last_resolved_at, events_count
+    ("INC100001", "2025-03-01 10:00:00", "2025-03-01 14:00:00", "2"),
+    ("INC100002", "2025-03-02 10:00:00", "2025-03-02 20:00:00", "40000"),
+    ("INC100003", "2025-03-03 10:00:00", "2025-03-04 12:00:00", "3.5"),
+    ("INC100004", "2025-03-04 10:00:00", "2025-03-04 11:00:00", ""),
+]
+
+
+def _dirty(path):
+    pd.DataFrame([{
+        "number": n, "first_opened_at": opened, "last_resolved_at": resolved, "last_closed_at": resolved,
+        "final_state": "Resolved", "final_priority": "2 - High", "assignment_group_mode": "Network",
+        "events_count": events, "resolution_hours": "",
+    } for n, opened, resolved, events in DIRTY]).to_csv(path, index=False)
+
+
+def test_events_count_out_of_range_or_fractional_becomes_na(tmp_path):
+    src = tmp_path / "dirty.csv"
+    _dirty(src)
+    for name, clean in [("memory", lambda out: run(str(src), out)),
+                        ("streaming", lambda out: run_streaming(str(src), out, chunksize=2))]:
+        out = str(tmp_path / f"{name}.csv")
+        clean(out)
+        df = pd.read_csv(out).set_index("number")
+        assert len(df) == len(DIRTY), name
+        assert df.loc["INC100001", "events_count"] == 2, name
+        assert df.loc[["INC100002", "INC100003", "INC100004"], "events_count"].isna().all(), name
+
+
+def test_streaming_with_exact_quantiles_writes_the_same_file(tmp_path):
+    # timestamps with only milliseconds: pandas alone would write them as ".500"
+    # in memory, while the streamed rows come back from the spill as ".500000"
+    dirty = pd.read_csv("data/incidents_dirty.csv", dtype=str).iloc[:300]
+    for c in ["first_opened_at", "last_resolved_at", "last_closed_at"]:
+        dirty[c] = dirty[c].str.replace(r"\.\d+$", ".500", regex=True)
+    src = tmp_path / "dirty.csv"
+    dirty.to_csv(src, index=False)
+    mem, streamed = tmp_path / "memory.csv", tmp_path / "streaming.csv"
+    run(str(src), str(mem))
+    run_streaming(str(src), str(streamed), chunksize=70, quantiles="exact")
+    assert mem.read_bytes() == streamed.read_bytes()
+
+
+def test_streaming_output_does_not_depend_on_the_chunk_size(tmp_path):
+    # the sketch merges the same whatever the chunking, so even the cap is identical
+    files = []
+    for chunksize in (97, 500, 100_000):
+        out = tmp_path / f"clean_{chunksize}.csv"
+        run_streaming("data/incidents_dirty.csv", str(out), chunksize=chunksize)
+        files.append(out.read_bytes())
+    assert files[0] == files[1] == files[2]
+    mem = tmp_path / "memory.csv"
+    run("data/incidents_dirty.csv", str(mem))
+    assert len(pd.read_csv(mem)) == len(pd.read_csv(tmp_path / "clean_97.csv"))
@@ -0,0 +1,81 @@
+"""Tests for the quantile engines: python -m pytest -q"""
+
+import math
+
+import numpy as np
+import pytest
+
+from sketches import ExactQuantiles, QuantileSketch, make_quantiles, quantiles_from_dict
+
+QS = [0, 0.01, 0.25, 0.5, 0.9, 0.99, 1]
+
+
+def _values(n=20_000, seed=1):
+    rng = np.random.default_rng(seed)
+    v = rng.lognormal(2, 1.5, n)
+    v[:500] = -v[:500]  # some negatives and zeros too
+    v[500:700] = 0
+    return rng.permutation(v)
+
+
+@pytest.mark.parametrize("rel_error", [0.001, 0.01, 0.05])
+def test_sketch_quantiles_are_within_rel_error(rel_error):
+    v = _values()
+    sk = QuantileSketch(rel_error).add(v)
+    ordered = np.sort(v)
+    for q in QS:
+        # the value at the same rank (pandas' "lower"), give or take rel_error of it
+        true = ordered[int(math.floor(q * (len(v) - 1)))]
+        assert abs(sk.quantile(q) - true) <= rel_error * abs(true) + 1e-12, q
+
+
+def test_sketch_merge_is_the_same_as_one_sketch_in_any_order():
+    v = _values()
+    whole = QuantileSketch(0.01).add(v)
+    parts = [QuantileSketch(0.01).add(p) for p in np.array_split(v, 7)]
+    merged = QuantileSketch(0.01)
+    for p in reversed(parts):
+        merged.merge(p)
+    assert merged.to_dict() == whole.to_dict()
+    with pytest.raises(ValueError):
+        merged.merge(QuantileSketch(0.001))
+
+
+def test_sketch_remove_undoes_add():
+    v = _values()
+    sk = QuantileSketch(0.01).add(v[:10_000])
+    before = sk.to_dict()
+    sk.add(v[10_000:]).remove(v[10_000:])
+    after = sk.to_dict()
+    for k in ("pos", "neg", "zeros", "count"):
+        assert after[k] == before[k]
+
+
+def test_empty_engines_answer_nan_and_round_trip():
+    for engine in ("exact", "sketch"):
+        q = make_quantiles(engine, 0.01)
+        assert math.isnan(q.quantile(0.5)) and q.count == 0
+        back = quantiles_from_dict(q.to_dict())
+        assert type(back) is type(q) and back.count == 0
+    with pytest.raises(ValueError):
+        make_quantiles("tdigest")
+
+
+def test_exact_matches_numpy_after_merge_and_remove():
+    v = _values()
+    ex = ExactQuantiles().add(v[:5000]).add([np.nan])
+    ex.merge(ExactQuantiles().add(v[5000:]))
+    ex.remove(v[:3000])
+    rest = v[3000:]
+    for q in QS:
+        assert ex.quantile(q) == np.quantile(rest, q)
+    assert ex.count == len(rest)
+    back = quantiles_from_dict(ex.to_dict())
+    assert back.quantile(0.99) == ex.quantile(0.99)
+    assert ex.to_sketch(0.01).to_dict() == QuantileSketch(0.01).add(rest).to_dict()
+
+
+def test_exact_remove_takes_out_one_copy_of_repeated_values():
+    ex = ExactQuantiles().add([1, 2, 2, 2, 3])
+    ex.remove([2, 2])
+    assert ex.buckets()[0].tolist() == [1, 2, 3] and ex.count == 3
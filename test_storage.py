@@ -0,0 +1,58 @@
+"""Tests for the storage layer: python -m pytest -q"""
+
+import pandas as pd
+import pytest
+
+from storage import (TableWriter, clean_dtypes, decode_numbers, encode_numbers, fit_integers, fmt_of, iter_table,
+                     read_table, write_table)
+
+
+def _clean():
+    return read_table("data/incidents_clean.csv", dtype=clean_dtypes())
+
+
+@pytest.mark.parametrize("ext", [".csv", ".parquet", ".feather"])
+def test_write_then_read_gives_the_same_frame(tmp_path, ext):
+    df = _clean()
+    path = str(tmp_path / f"clean{ext}")
+    write_table(df, path)
+    back = read_table(path, dtype=clean_dtypes())
+    pd.testing.assert_frame_equal(back, df, check_categorical=False)
+    assert read_table(path, dtype=str)["number"].iloc[0].startswith("INC")  # files hold the text
+
+
+@pytest.mark.parametrize("ext", [".csv", ".parquet", ".feather"])
+def test_chunks_written_and_read_back_match_the_whole_table(tmp_path, ext):
+    df = _clean()
+    path = str(tmp_path / f"clean{ext}")
+    with TableWriter(path) as w:
+        # chunks see different category lists (Feather needs them merged)
+        for i in range(0, len(df), 300):
+            w.write(df.iloc[i:i + 300].assign(final_state=lambda d: d["final_state"].cat.remove_unused_categories()))
+    chunks = list(iter_table(path, 250, dtype=clean_dtypes()))
+    assert max(len(c) for c in chunks) <= 250
+    back = pd.concat(chunks, ignore_index=True)
+    pd.testing.assert_frame_equal(back, df, check_categorical=False)
+
+
+def test_fit_integers_sets_what_does_not_fit_to_na():
+    s = pd.Series(["2", "40000", "-3", "3.5", "", None, "1e2"])
+    out, n = fit_integers(s, "Int16")
+    assert out.tolist() == [2, pd.NA, -3, pd.NA, pd.NA, pd.NA, 100]
+    assert str(out.dtype) == "Int16" and n == 2  # blanks were already missing
+
+
+def test_numbers_encode_only_when_every_one_round_trips():
+    s = pd.Series(["INC100001", None, "INC42"])
+    enc = encode_numbers(s)
+    assert str(enc.dtype) == "UInt32"
+    back = decode_numbers(enc)
+    assert back.isna().tolist() == [False, True, False] and back.dropna().tolist() == ["INC100001", "INC42"]
+    odd = pd.Series(["INC100001", "INC0007"])  # a leading zero wouldn't come back
+    assert encode_numbers(odd) is odd
+
+
+def test_unknown_extension_is_an_error():
+    assert fmt_of("a.PQ") == "parquet"
+    with pytest.raises(ValueError):
+        fmt_of("clean.xlsx")
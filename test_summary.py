@@ -0,0 +1,55 @@
+"""Tests for the summary statistics: python -m pytest -q"""
+
+import json
+
+import pandas as pd
+
+from generate_presentation import quality_bullets
+from pipeline import run
+from sketches import QuantileSketch
+from stages import Stages
+from summary import SummaryStats, load_stage_log, stats_document
+
+
+def _clean():
+    return pd.read_csv("data/incidents_clean.csv")
+
+
+def test_saved_exact_summary_keeps_a_sketch_not_every_value(tmp_path):
+    df = _clean()
+    stats = SummaryStats(0.01, quantiles="exact").update(df)  # the default engine
+    saved = json.dumps(stats.to_dict())
+    assert "values" not in json.loads(saved)["res_sketch"]
+    assert len(saved) < len(json.dumps(df["resolution_hours"].dropna().tolist())) / 4
+
+    back = SummaryStats.from_dict(json.loads(saved))
+    assert isinstance(back.res_sketch, QuantileSketch) and back.res_sketch.count == stats.res_count
+    res = df["resolution_hours"].dropna()
+    for q in (0.5, 0.9, 0.99):
+        # the sketch answers with one of the values, within rel_error of it
+        assert abs(back.res_sketch.quantile(q) - res.quantile(q, interpolation="lower")) <= 0.01 * res.quantile(q, interpolation="lower")
+
+
+def test_saved_summaries_of_two_halves_merge_into_the_whole():
+    df = _clean()
+    half = len(df) // 2
+    parts = [SummaryStats.from_dict(json.loads(json.dumps(SummaryStats(quantiles="exact").update(p).to_dict())))
+             for p in (df.iloc[:half], df.iloc[half:])]
+    merged = parts[0].merge(parts[1])
+    whole = SummaryStats.from_dict(SummaryStats(quantiles="exact").update(df).to_dict())
+    assert merged.to_dict() == whole.to_dict()
+
+
+def test_stats_document_marks_the_output_stages(tmp_path):
+    st = Stages()
+    out = str(tmp_path / "clean.csv")
+    run("data/incidents_dirty.csv", out, stages=st, partitioned=str(tmp_path / "parts"))
+    log = str(tmp_path / "stages.jsonl")
+    st.write_jsonl(log)
+    doc = stats_document(SummaryStats().update(pd.read_csv(out)), [out], stages=load_stage_log(log))
+    kinds = {s["stage"]: s["kind"] for s in doc["steps"]}
+    assert kinds["save"] == kinds["partition"] == "output"
+    assert kinds["dedup"] == kinds["drop_negative"] == "clean"
+    removed = sum(s["removed"] for s in doc["steps"] if s["kind"] == "clean")
+    assert removed == doc["rows"]["dirty"] - doc["rows"]["clean"]
+    assert not any("save" in b or "partition" in b for b in quality_bullets(doc))